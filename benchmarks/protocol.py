@@ -0,0 +1,98 @@
+"""
+    Compare the cost of encoding, decoding and validating a command message
+    with the framed JSON protocol (and MessagePack, when installed) against
+    the pickle path of multiprocessing.connection it replaced.
+
+    Usage: python -m benchmarks.protocol [--number N]
+"""
+import argparse
+import pickle
+import timeit
+
+from panmuphled.server import protocol
+from panmuphled.server.parser import Parser
+
+# A message as panmuphlectl sends it, with every parameter present
+MESSAGE = {
+    "command": "switch_workspace",
+    "index": 2,
+    "name": None,
+    "exec": None,
+    "pid": None,
+    "address": None,
+    "screen": None,
+    "direction": None,
+    "query": None,
+    "limit": None,
+    "previous": False,
+}
+
+
+def legacy_validate(msg):
+    # The ad-hoc checks each command handler used to perform
+    if "command" not in msg or type(msg["command"]) != str:
+        return False
+
+    if "index" not in msg and "direction" not in msg:
+        return False
+
+    if "index" in msg and (type(msg["index"]) != int and msg["index"] != None):
+        return False
+
+    if "direction" in msg and (msg["direction"] != None and type(msg["direction"]) != str):
+        return False
+
+    return True
+
+
+def bench(number, label, encode, decode, validate):
+    payload = encode(MESSAGE)
+
+    enc = timeit.timeit(lambda: encode(MESSAGE), number=number)
+    dec = timeit.timeit(lambda: decode(payload), number=number)
+    val = timeit.timeit(lambda: validate(decode(payload)), number=number) - dec
+
+    scale = 1e6 / number
+
+    print(
+        f"{label:<10} {len(payload):>6} {enc * scale:>10.2f} {dec * scale:>10.2f} "
+        f"{val * scale:>10.2f} {(enc + dec + val) * scale:>10.2f}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Panmuphle protocol benchmark")
+    parser.add_argument("--number", type=int, default=100000)
+
+    args = parser.parse_args()
+
+    print(f"{'encoding':<10} {'bytes':>6} {'encode us':>10} {'decode us':>10} {'valid. us':>10} {'total us':>10}")
+
+    bench(
+        args.number,
+        "pickle",
+        lambda msg: pickle.dumps(msg, pickle.HIGHEST_PROTOCOL),
+        pickle.loads,
+        legacy_validate,
+    )
+
+    bench(
+        args.number,
+        "json",
+        lambda msg: protocol.encode(msg, protocol.ENCODING_JSON),
+        lambda payload: protocol.decode(payload, protocol.ENCODING_JSON),
+        Parser.parse_message,
+    )
+
+    if protocol.msgpack is not None:
+        bench(
+            args.number,
+            "msgpack",
+            lambda msg: protocol.encode(msg, protocol.ENCODING_MSGPACK),
+            lambda payload: protocol.decode(payload, protocol.ENCODING_MSGPACK),
+            Parser.parse_message,
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+import math
+import random
+import threading
+import time
+
+"""
+    A load generator for the daemon, which runs a mix of commands from a
+    number of concurrent clients at a target rate, the way status bars,
+    scripts and keybindings hit it together, and reports throughput and
+    latency.
+
+    The mix is given as weighted actions, e.g.
+    'list-workspaces:6,find-applications:3,switch-workspace:1'. With a
+    target rate, every client sends on a fixed schedule and latencies are
+    measured from when a command was due rather than when it was sent, so
+    a daemon which falls behind shows up in the latencies instead of
+    quietly lowering the rate.
+
+    Commands which change the tree really run, so it's best pointed at a
+    daemon driving the compositor simulator (panmuphlectl.simulator).
+"""
+
+DEFAULT_CLIENTS = 4
+DEFAULT_DURATION = 10.0
+DEFAULT_MIX = "list-workspaces:6,find-applications:3,switch-workspace:1"
+
+PERCENTILES = [50, 95, 99]
+
+
+def build_list_workspaces(context, rng):
+    return {"command": "list_workspaces"}
+
+def build_list_windows(context, rng):
+    return {"command": "list_windows"}
+
+def build_show_tree(context, rng):
+    return {"command": "show_tree"}
+
+def build_stats(context, rng):
+    return {"command": "stats"}
+
+def build_switch_workspace(context, rng):
+    return {"command": "switch_workspace", "index": rng.randint(1, max(context["workspaces"], 1))}
+
+def build_switch_window(context, rng):
+    return {"command": "switch_window", "index": rng.randint(1, max(context["windows"], 1))}
+
+def build_find_applications(context, rng):
+    return {"command": "find_applications", "name": rng.choice(context["applications"] or ["none"])}
+
+def build_search(context, rng):
+    return {"command": "search", "query": rng.choice(context["applications"] or ["none"])}
+
+
+BENCH_COMMANDS = {
+    "list-workspaces": build_list_workspaces,
+    "list-windows": build_list_windows,
+    "show-tree": build_show_tree,
+    "stats": build_stats,
+    "switch-workspace": build_switch_workspace,
+    "switch-window": build_switch_window,
+    "find-applications": build_find_applications,
+    "search": build_search,
+}
+
+
+def parse_mix(mix):
+    # 'action:weight,...' -> [(action, weight)], a missing weight is 1
+    parsed = []
+
+    for entry in mix.split(","):
+        action, _, weight = entry.strip().partition(":")
+
+        if action not in BENCH_COMMANDS:
+            raise ValueError(f"Unknown bench action '{action}', expecting one of {list(BENCH_COMMANDS)}")
+
+        parsed.append((action, float(weight) if weight else 1.0))
+
+    return parsed
+
+def get_context(send_command, binary=False):
+    # Parameters for the commands, from the daemon's current tree
+    resp = send_command({"command": "show_tree"}, binary=binary)
+
+    if resp["rc"] != 0:
+        return None
+
+    workspaces = resp["tree"]["workspaces"]
+    windows = [wn for ws in workspaces for wn in ws["windows"]]
+
+    return {
+        "workspaces": len(workspaces),
+        "windows": max(len(ws["windows"]) for ws in workspaces) if workspaces else 0,
+        "applications": sorted({ap["name"] for wn in windows for ap in wn["applications"]}),
+    }
+
+def get_percentile(latencies, percentile):
+    # Nearest rank of sorted latencies
+    if len(latencies) == 0:
+        return None
+
+    rank = max(math.ceil(percentile / 100 * len(latencies)), 1)
+
+    return latencies[rank - 1]
+
+def summarize(samples, elapsed):
+    summary = {
+        "requests": len(samples),
+        "throughput": len(samples) / elapsed if elapsed > 0 else 0.0,
+        "errors": {},
+        "latency_ms": summarize_latencies([latency for action, latency, error in samples]),
+        "by_action": {},
+    }
+
+    for action, latency, error in samples:
+        if error != None:
+            summary["errors"][error] = summary["errors"].get(error, 0) + 1
+
+    for action in sorted({action for action, latency, error in samples}):
+        action_samples = [sample for sample in samples if sample[0] == action]
+
+        summary["by_action"][action] = {
+            "requests": len(action_samples),
+            "errors": len([sample for sample in action_samples if sample[2] != None]),
+            "latency_ms": summarize_latencies([latency for a, latency, error in action_samples]),
+        }
+
+    return summary
+
+def summarize_latencies(latencies):
+    latencies = sorted(latency * 1000 for latency in latencies)
+
+    summary = {f"p{percentile}": get_percentile(latencies, percentile) for percentile in PERCENTILES}
+    summary["max"] = latencies[-1] if latencies else None
+    summary["mean"] = sum(latencies) / len(latencies) if latencies else None
+
+    return summary
+
+
+class Bench:
+    def __init__(self, send_command, clients=DEFAULT_CLIENTS, rate=None, duration=DEFAULT_DURATION, mix=DEFAULT_MIX, binary=False, seed=None):
+        self.send_command = send_command
+        self.clients = clients
+        self.rate = rate
+        self.duration = duration
+        self.mix = parse_mix(mix)
+        self.binary = binary
+        self.seed = seed
+
+        # One list of (action, latency, error) per client
+        self.samples = [[] for i in range(clients)]
+
+    def run(self):
+        context = get_context(self.send_command, binary=self.binary)
+
+        if context == None:
+            return {"rc": 2}
+
+        started_at = time.perf_counter()
+
+        threads = [
+            threading.Thread(target=self.__run_client, args=(i, context, started_at), name=f"bench-{i}", daemon=True)
+            for i in range(self.clients)
+        ]
+
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+        elapsed = time.perf_counter() - started_at
+        samples = [sample for client_samples in self.samples for sample in client_samples]
+
+        summary = summarize(samples, elapsed)
+        summary.update({
+            "clients": self.clients,
+            "target_rate": self.rate,
+            "duration": elapsed,
+            "mix": dict(self.mix),
+        })
+
+        return {"rc": 0, "bench": summary}
+
+    """
+    """
+
+    def __run_client(self, i, context, started_at):
+        rng = random.Random(None if self.seed == None else self.seed + i)
+
+        actions = [action for action, weight in self.mix]
+        weights = [weight for action, weight in self.mix]
+
+        ends_at = started_at + self.duration
+
+        # Each client sends its share of the rate, staggered so they don't
+        # all send at once
+        interval = self.clients / self.rate if self.rate else 0.0
+        due_at = started_at + interval * i / self.clients
+
+        while True:
+            if not self.rate:
+                due_at = time.perf_counter()
+
+            if due_at >= ends_at:
+                break
+
+            delay = due_at - time.perf_counter()
+
+            if delay > 0:
+                time.sleep(delay)
+
+            action = rng.choices(actions, weights=weights)[0]
+            error = None
+
+            try:
+                resp = self.send_command(BENCH_COMMANDS[action](context, rng), binary=self.binary)
+
+                if resp["rc"] != 0:
+                    error = f"rc {resp['rc']}"
+            except Exception as e:
+                error = type(e).__name__
+
+            self.samples[i].append((action, time.perf_counter() - due_at, error))
+
+            due_at = due_at + interval
@@ -1,17 +1,19 @@
 import argparse
 import json
-from multiprocessing.connection import Client
+
+from panmuphlectl.bench import Bench, DEFAULT_CLIENTS, DEFAULT_DURATION, DEFAULT_MIX
+from panmuphled.server.protocol import Client
 
 PANMUPHLE_PORT = 7761
 PANMUPHLE_HOST = "localhost"
 
 
-def send_command(cmd):
+def send_command(cmd, binary=False):
     host = PANMUPHLE_HOST
     port = PANMUPHLE_PORT
 
     try:
-        conn = Client((host, port))
+        conn = Client((host, port), binary=binary)
     except:
         return {"rc": 2}
 
@@ -26,6 +28,35 @@ def send_command(cmd):
 def print_resp(resp):
     print(json.dumps(resp))
 
+def watch(cmd):
+    # Subscribe to the daemon's events and print them as JSON lines until
+    # the daemon goes away or the user interrupts
+    host = PANMUPHLE_HOST
+    port = PANMUPHLE_PORT
+
+    try:
+        conn = Client((host, port))
+    except:
+        return {"rc": 2}
+
+    conn.send(cmd)
+
+    resp = conn.recv()
+
+    if resp["rc"] != 0:
+        conn.close()
+        return resp
+
+    try:
+        while True:
+            print(json.dumps(conn.recv()), flush=True)
+    except (EOFError, OSError, KeyboardInterrupt):
+        pass
+
+    conn.close()
+
+    return resp
+
 """
 """
 
@@ -48,6 +79,22 @@ PANMUPHLECTL_ACTIONS = {
     "launch-application": "launch_application",
     "find-applications": "find_applications",
     "switch-application": "switch_application",
+    "search-applications": "search_applications",
+    "search": "search",
+    "switch-to-match": "switch_to_match",
+    "cycle-recent": "cycle_recent",
+    "toggle-scratchpad": "toggle_scratchpad",
+    "stats": "stats",
+    "dump-log": "dump_log",
+    "profile": "profile",
+    "memprofile": "memprofile",
+    "job-status": "job_status",
+    "job-wait": "job_wait",
+    "job-cancel": "job_cancel",
+    "batch": "batch",
+    "run-macro": "run_macro",
+    "watch": "subscribe",
+    "bench": None,
     "restart": "restart",
     "terminate": "terminate",
 }
@@ -63,11 +110,59 @@ def main():
     parser.add_argument("--exec", type=str)
     parser.add_argument("--pid", type=int)
     parser.add_argument("--addr", type=str)
+    parser.add_argument("--query", type=str)
+    parser.add_argument("--limit", type=int)
+    parser.add_argument("--level", type=str, help="Only dump log records at or above this level")
+    parser.add_argument("--mode", type=str, help="What profile or memprofile should do, e.g. start or stop")
+    parser.add_argument("--count", type=int, help="Number of commands to profile")
+    parser.add_argument("--seconds", type=float, help="Seconds to profile for, or to wait for a job")
+    parser.add_argument("--frames", type=int, help="Frames of each allocation to trace")
+    parser.add_argument("--previous", action="store_true")
+    parser.add_argument("--job", action="store_true", help="Return a job id instead of waiting for the command")
+    parser.add_argument("--id", type=int, help="Id of the job to check on, wait for or cancel")
+    parser.add_argument("--events", type=str, help="Comma separated event types to watch")
+    parser.add_argument("--since", type=int, help="Only show changes since this tree version")
+    parser.add_argument("--binary", action="store_true", help="Use the MessagePack encoding")
+    parser.add_argument("--commands", type=str, help="JSON list of commands to run as a batch")
+    parser.add_argument("--stop-on-error", action="store_true")
+    parser.add_argument("--timeout", type=float, help="Seconds the daemon has to run the command")
+    parser.add_argument("--clients", type=int, default=DEFAULT_CLIENTS, help="Concurrent clients to bench with")
+    parser.add_argument("--rate", type=float, help="Commands per second to bench at, as fast as possible if not given")
+    parser.add_argument("--duration", type=float, default=DEFAULT_DURATION, help="Seconds to bench for")
+    parser.add_argument("--mix", type=str, default=DEFAULT_MIX, help="Weighted actions to bench, e.g. 'list-workspaces:6,search:1'")
+    parser.add_argument("--seed", type=int, help="Seed for choosing bench commands")
 
     args = parser.parse_args()
 
     func = PANMUPHLECTL_ACTIONS[args.action]
 
+    if args.action == "watch":
+        resp = watch({
+            "command": func,
+            "events": args.events.split(",") if args.events else None
+        })
+
+        if resp["rc"] != 0:
+            print_resp(resp)
+
+        return resp["rc"]
+
+    if args.action == "bench":
+        bench = Bench(
+            send_command,
+            clients=args.clients,
+            rate=args.rate,
+            duration=args.duration,
+            mix=args.mix,
+            binary=args.binary,
+            seed=args.seed
+        )
+        resp = bench.run()
+
+        print_resp(resp)
+
+        return resp["rc"]
+
     resp = send_command({
         "command": func, 
         "index": args.index,
@@ -76,8 +171,22 @@ def main():
         "pid": args.pid,
         "address": args.addr,
         "screen": args.screen,
-        "direction": args.direction
-    })
+        "direction": args.direction,
+        "query": args.query,
+        "limit": args.limit,
+        "level": args.level,
+        "mode": args.mode,
+        "count": args.count,
+        "seconds": args.seconds,
+        "frames": args.frames,
+        "previous": args.previous,
+        "job": args.job,
+        "id": args.id,
+        "since": args.since,
+        "commands": json.loads(args.commands) if args.commands else None,
+        "stop_on_error": args.stop_on_error,
+        "timeout": args.timeout
+    }, binary=args.binary)
 
     print_resp(resp)
 
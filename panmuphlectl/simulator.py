@@ -0,0 +1,257 @@
+import fcntl
+import json
+import os
+import signal
+import sys
+import time
+
+"""
+    A stand-in for hyprctl, so the daemon can be run and benchmarked
+    without a compositor. It answers the queries and dispatches the daemon
+    uses from a small state file, and is selected by pointing the daemon at
+    it, e.g.
+
+        panmuphlesim reset HDMI-0 DP-0
+        PANMUPHLE_HYPRCTL=$(which panmuphlesim) panmuphled
+
+    Applications are simulated too, 'panmuphlesim app CLASS' opens a client
+    on the active workspace and stays alive until it's closed or killed,
+    so a configuration can use it as the exec of its applications.
+
+    Every call can be slowed down by PANMUPHLE_SIM_LATENCY milliseconds to
+    resemble a busy compositor. There is no event socket, the daemon falls
+    back to querying.
+"""
+
+STATE_PATH = os.environ.get("PANMUPHLE_SIM_STATE", "/tmp/panmuphle-sim.json")
+
+DEFAULT_MONITORS = ["HDMI-0", "DP-0"]
+
+
+def get_initial_state(monitors):
+    return {
+        "monitors": [
+            {"id": i, "name": name, "activeWorkspace": {"id": i + 1, "name": str(i + 1)}}
+            for i, name in enumerate(monitors)
+        ],
+        "workspaces": [
+            {"id": i + 1, "name": str(i + 1), "monitorID": i, "windows": 0}
+            for i in range(len(monitors))
+        ],
+        "clients": [],
+        "focused_monitor": 0,
+        "next_address": 1,
+    }
+
+def load_state():
+    if not os.path.exists(STATE_PATH):
+        return get_initial_state(DEFAULT_MONITORS)
+
+    with open(STATE_PATH) as state_file:
+        return json.load(state_file)
+
+def save_state(state):
+    with open(STATE_PATH + ".tmp", "w") as state_file:
+        json.dump(state, state_file)
+
+    os.replace(STATE_PATH + ".tmp", STATE_PATH)
+
+def with_state(func):
+    # Run func on the state under an exclusive lock, so concurrent calls
+    # see each other's changes
+    with open(STATE_PATH + ".lock", "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+
+        state = load_state()
+        result = func(state)
+        save_state(state)
+
+    return result
+
+############################
+# Queries
+############################
+
+def get_workspace(state, ws_id):
+    for ws_data in state["workspaces"]:
+        if ws_data["id"] == ws_id:
+            return ws_data
+
+    return None
+
+def get_active_workspace(state):
+    return state["monitors"][state["focused_monitor"]]["activeWorkspace"]
+
+def query(state, name):
+    if name == "activeworkspace":
+        return get_workspace(state, get_active_workspace(state)["id"])
+
+    if name in ("monitors", "workspaces", "clients"):
+        for ws_data in state["workspaces"]:
+            ws_data["windows"] = len([c for c in state["clients"] if c["workspace"]["id"] == ws_data["id"]])
+
+        return state[name]
+
+    return None
+
+############################
+# Dispatches
+############################
+
+def dispatch_workspace(state, arg):
+    ws_id = int(arg)
+    ws_data = get_workspace(state, ws_id)
+
+    if ws_data == None:
+        ws_data = {"id": ws_id, "name": str(ws_id), "monitorID": state["focused_monitor"], "windows": 0}
+        state["workspaces"].append(ws_data)
+
+    monitor = state["monitors"][ws_data["monitorID"]]
+    monitor["activeWorkspace"] = {"id": ws_id, "name": ws_data["name"]}
+    state["focused_monitor"] = ws_data["monitorID"]
+
+def dispatch_renameworkspace(state, arg):
+    ws_id, name = arg.split(" ", 1)
+    ws_data = get_workspace(state, int(ws_id))
+
+    if ws_data != None:
+        ws_data["name"] = name
+
+def dispatch_moveworkspacetomonitor(state, arg):
+    ws_id, mon_id = arg.split(" ", 1)
+    ws_data = get_workspace(state, int(ws_id))
+
+    if ws_data != None and mon_id.isdigit() and int(mon_id) < len(state["monitors"]):
+        ws_data["monitorID"] = int(mon_id)
+
+def dispatch_movetoworkspacesilent(state, arg):
+    ws_id, window = arg.split(",", 1)
+
+    for client in state["clients"]:
+        if window == f"address:{client['address']}":
+            client["workspace"] = {"id": int(ws_id), "name": ws_id}
+
+def dispatch_closewindow(state, arg):
+    for client in list(state["clients"]):
+        if arg == f"address:{client['address']}":
+            state["clients"].remove(client)
+
+            try:
+                os.kill(client["pid"], signal.SIGTERM)
+            except OSError:
+                pass
+
+def dispatch(state, args):
+    handler = DISPATCHERS.get(args[0])
+
+    if handler != None:
+        handler(state, " ".join(args[1:]))
+
+    return "ok"
+
+
+DISPATCHERS = {
+    "workspace": dispatch_workspace,
+    "renameworkspace": dispatch_renameworkspace,
+    "moveworkspacetomonitor": dispatch_moveworkspacetomonitor,
+    "movetoworkspacesilent": dispatch_movetoworkspacesilent,
+    "closewindow": dispatch_closewindow,
+}
+
+############################
+# hyprctl
+############################
+
+def run_hyprctl(state, args):
+    json_output = "-j" in args
+    args = [arg for arg in args if arg != "-j"]
+
+    # Queries in batches are prefixed, 'j/clients'
+    if args[0].startswith("j/"):
+        json_output = True
+        args = [args[0][2:]] + args[1:]
+
+    if args[0] == "dispatch":
+        return dispatch(state, args[1:])
+
+    if args[0] == "keyword":
+        return "ok"
+
+    result = query(state, args[0])
+
+    if result == None:
+        return f"unknown request {args[0]}"
+
+    return json.dumps(result) if json_output else str(result)
+
+def hyprctl(args):
+    latency = float(os.environ.get("PANMUPHLE_SIM_LATENCY", "0"))
+
+    if latency > 0:
+        time.sleep(latency / 1000)
+
+    if args[0] == "--batch":
+        commands = [command.strip().split(" ") for command in args[1].split(";") if command.strip()]
+
+        output = with_state(lambda state: [run_hyprctl(state, command) for command in commands])
+        print("\n".join(output))
+    else:
+        print(with_state(lambda state: run_hyprctl(state, args)))
+
+    return 0
+
+############################
+# Simulated applications
+############################
+
+def run_app(wm_class, title=None):
+    pid = os.getpid()
+
+    def open_client(state):
+        address = f"0x{state['next_address']:x}"
+        state["next_address"] = state["next_address"] + 1
+
+        state["clients"].append({
+            "address": address,
+            "pid": pid,
+            "class": wm_class,
+            "title": title or wm_class,
+            "workspace": dict(get_active_workspace(state)),
+        })
+
+        return address
+
+    address = with_state(open_client)
+
+    def close_client(signum, frame):
+        def remove_client(state):
+            state["clients"] = [c for c in state["clients"] if c["address"] != address]
+
+        with_state(remove_client)
+        sys.exit(0)
+
+    signal.signal(signal.SIGTERM, close_client)
+    signal.signal(signal.SIGINT, close_client)
+
+    while True:
+        signal.pause()
+
+def main():
+    args = sys.argv[1:]
+
+    if len(args) == 0:
+        print("usage: panmuphlesim (reset [MONITOR ...] | app CLASS [TITLE] | HYPRCTL ARGS ...)")
+        return 1
+
+    if args[0] == "reset":
+        save_state(get_initial_state(args[1:] or DEFAULT_MONITORS))
+        return 0
+
+    if args[0] == "app":
+        return run_app(args[1], title=" ".join(args[2:]) or None)
+
+    return hyprctl(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,197 @@
+import heapq
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+"""
+    Hands out the ids of compositor workspaces, which the daemon calls
+    windows, so opening a window needs no listing of the compositor's
+    workspaces. The registry of names and ids is seeded from a single
+    listing at startup, and then kept up to date by the daemon's own
+    reservations and by the compositor's workspace events, which cover
+    workspaces the user creates by hand.
+
+    Ids are reserved under a lock, so windows opened concurrently never
+    collide, and ids of windows which were closed are reused, lowest
+    first. The compositor destroys any workspace which is empty and not
+    focused, including those of windows whose applications haven't opened
+    a client yet or whose clients were closed, so a reserved id stays
+    reserved until its window releases it, whatever the compositor does
+    with the workspace meanwhile.
+"""
+
+# Hyprland numbers regular workspaces from 1, special workspaces have
+# negative ids
+MIN_ID = 1
+
+
+class WorkspaceAllocator:
+    def __init__(self):
+        # Compositor workspace name <-> id, for every workspace we know of
+        self.ids_by_name = {}
+        self.names_by_id = {}
+
+        # Id -> name of the managed window which holds it, only the window
+        # releases it
+        self.holders = {}
+
+        # Ids below next_id which are free, as a heap
+        self.free = []
+        self.next_id = MIN_ID
+
+        self.seeded = False
+        self.reservations = 0
+        self.reused = 0
+
+        self.lock = threading.Lock()
+
+    def seed(self, workspaces_data):
+        with self.lock:
+            self.ids_by_name = {}
+            self.names_by_id = {}
+
+            for ws_data in workspaces_data:
+                if ws_data["id"] >= MIN_ID:
+                    self.__add(ws_data["id"], ws_data["name"])
+
+            # Held ids whose workspaces are gone for now aren't free
+            for ws_id, name in self.holders.items():
+                if ws_id not in self.names_by_id:
+                    self.__add(ws_id, name)
+
+            self.next_id = max(list(self.names_by_id) + [MIN_ID - 1]) + 1
+            self.free = [ws_id for ws_id in range(MIN_ID, self.next_id) if ws_id not in self.names_by_id]
+            heapq.heapify(self.free)
+
+            self.seeded = True
+
+        logger.info(f"Seeded workspace ids with {len(self.names_by_id)} existing workspaces, next id {self.next_id}")
+
+    def reserve(self, name):
+        # The id of the workspace with the given name, and whether it
+        # already existed
+        with self.lock:
+            if name in self.ids_by_name:
+                self.holders[self.ids_by_name[name]] = name
+                return self.ids_by_name[name], True
+
+            if len(self.free) > 0:
+                ws_id = heapq.heappop(self.free)
+                self.reused = self.reused + 1
+            else:
+                ws_id = self.next_id
+                self.next_id = self.next_id + 1
+
+            self.__add(ws_id, name)
+            self.holders[ws_id] = name
+            self.reservations = self.reservations + 1
+
+        logger.debug("Reserved workspace id %d for %s", ws_id, name)
+
+        return ws_id, False
+
+    def hold(self, ws_id, name):
+        # Windows restored from a saved state hold the ids they had
+        with self.lock:
+            if ws_id == None:
+                return
+
+            self.holders[ws_id] = name
+
+            if ws_id not in self.names_by_id:
+                self.__add(ws_id, name)
+
+    def release(self, ws_id, name):
+        # Only if the id still belongs to the name, it may have been given to
+        # another workspace since
+        with self.lock:
+            if ws_id == None:
+                return
+
+            if self.holders.get(ws_id) == name:
+                del self.holders[ws_id]
+
+            if self.names_by_id.get(ws_id) != name:
+                return
+
+            self.__remove(ws_id)
+
+        logger.debug("Released workspace id %d of %s", ws_id, name)
+
+    def show_stats(self):
+        with self.lock:
+            return {
+                "known": len(self.names_by_id),
+                "held": len(self.holders),
+                "next_id": self.next_id,
+                "free": sorted(self.free),
+                "reservations": self.reservations,
+                "reused": self.reused,
+            }
+
+    """
+        Compositor event handlers
+    """
+
+    def on_create_workspace(self, data):
+        ws_id, name = data.split(",", 1)
+        ws_id = int(ws_id)
+
+        with self.lock:
+            # Our own reservations are already known, under their final name
+            if ws_id < MIN_ID or ws_id in self.names_by_id:
+                return
+
+            logger.info(f"Workspace {name} with id {ws_id} was created outside the daemon")
+
+            self.__add(ws_id, name)
+
+    def on_destroy_workspace(self, data):
+        ws_id, name = data.split(",", 1)
+        ws_id = int(ws_id)
+
+        # Only workspaces the daemon doesn't manage are forgotten, a window
+        # keeps its id until it's closed
+        with self.lock:
+            if ws_id in self.holders or self.names_by_id.get(ws_id) != name:
+                return
+
+            self.__remove(ws_id)
+
+    def on_rename_workspace(self, data):
+        ws_id, name = data.split(",", 1)
+        ws_id = int(ws_id)
+
+        with self.lock:
+            old_name = self.names_by_id.get(ws_id)
+
+            if old_name == None or old_name == name:
+                return
+
+            del self.ids_by_name[old_name]
+            self.names_by_id[ws_id] = name
+            self.ids_by_name[name] = ws_id
+
+    """
+    """
+
+    def __add(self, ws_id, name):
+        self.ids_by_name[name] = ws_id
+        self.names_by_id[ws_id] = name
+
+        if ws_id >= self.next_id:
+            self.free.extend(range(self.next_id, ws_id))
+            heapq.heapify(self.free)
+            self.next_id = ws_id + 1
+        elif ws_id in self.free:
+            self.free.remove(ws_id)
+            heapq.heapify(self.free)
+
+    def __remove(self, ws_id):
+        name = self.names_by_id.pop(ws_id)
+
+        if self.ids_by_name.get(name) == ws_id:
+            del self.ids_by_name[name]
+
+        heapq.heappush(self.free, ws_id)
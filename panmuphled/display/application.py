@@ -1,15 +1,25 @@
 import logging
+import os
 import subprocess
 import time
 import json
 import shlex
 import psutil
-import copy
 
-from panmuphled.display.common import run_command
+from panmuphled.display.common import (
+    run_command, run_batch, get_remaining_time, expire_deadline, deadline_expired,
+    job_cancelled, report_progress, is_running, HYPRCTL_PATH,
+)
+from panmuphled.display.rules import class_match
 
 logger = logging.getLogger(__name__)
 
+MAX_TOTAL_TRIES = 50
+BASE_WAIT_TIME  = 0.25
+STABILITY_TRIES = 10
+
+MAX_WAIT_TIME = MAX_TOTAL_TRIES * BASE_WAIT_TIME
+
 
 class Application:
     def __init__(self, name, window, app_def):
@@ -27,6 +37,14 @@ class Application:
 
         self.focused_default = app_def["focused_default"]
 
+        self.client_titles = {}
+        self.client_classes = {}
+
+        self.needs_relaunch = False
+
+        # Whether the process was left behind by a previous run of the daemon
+        self.adopted = False
+
     @staticmethod
     def validate(app_def):
         return True
@@ -34,102 +52,291 @@ class Application:
     def start(self):
         logger.info(f"Starting application {self.name}")
         rc = 0
+
+        if job_cancelled():
+            self.__cancel_launch()
+            return rc
+
+        # Pick up where a previous run of the daemon left off
+        if self.__adopt():
+            return rc
         
-        # Disable initial focus
-        rc, stdout = run_command([
-            "/usr/bin/hyprctl",
-            "keyword",
-            "windowrulev2",
-            "'noinitialfocus,class:^(.*)$'"
-        ])
+        # Keep the windows this launch opens from stealing focus. When the
+        # window starts all of its applications the rules are already
+        # installed, and this costs no round trip.
+        launch_match = self.launch_match()
+
+        launch_rules = self.window.workspace.controller.launch_rules
+        commands = launch_rules.acquire([launch_match])
+        unset_commands = None
+        released = False
+
+        # The rules are given back however the launch ends, a timeout
+        # included, unless they already went along with the move
+        try:
+            rc, stdout = run_batch(commands)
 
-        clients_before = self.__get_application_ids()
+            clients_before = self.__get_application_ids()
 
-        self.application_subdir, stdout_log_path, stderr_log_path = (
-            self.window.workspace.controller.file_manager.create_application_subdir(
-                self.window.name, self.name
+            self.application_subdir, stdout_log_path, stderr_log_path = (
+                self.window.workspace.controller.file_manager.create_application_subdir(
+                    self.window.name, self.name
+                )
             )
-        )
 
-        # Open application
-        with open(stdout_log_path, "wb") as stdout_log, open(
-            stderr_log_path, "wb"
-        ) as stderr_log:
-            cmd = shlex.split(self.exec)
+            # Open application
+            self.started_at = time.monotonic()
 
-            self.process = subprocess.Popen(
-                cmd, stdout=stdout_log, stderr=stderr_log
-            )
+            with open(stdout_log_path, "wb") as stdout_log, open(
+                stderr_log_path, "wb"
+            ) as stderr_log:
+                cmd = shlex.split(self.exec)
 
-        # Record the PID of the application
-        self.window.workspace.controller.file_manager.save_application_pid(
-            self.application_subdir, self.process.pid)
+                self.process = subprocess.Popen(
+                    cmd, stdout=stdout_log, stderr=stderr_log
+                )
 
-        # Determine the application's clientID 
-        self.client_id = self.__await_window(clients_before, process=self.process)
+            # Record the PID of the application
+            self.window.workspace.controller.file_manager.save_application_pid(
+                self.application_subdir, self.process.pid)
 
-        logger.info(self.client_id)
+            self.window.workspace.controller.reconciler.watch_process(self)
+            self.window.workspace.controller.scheduler.apply_application(self)
 
-        # Move this application to the correct window
-        if self.client_id:
-            rc = self.__move_application_to_window(self.client_id, self.window.window_id)
-        else:
-            if self.process.returncode != None:
-                logger.warning(f"Application {self.name} terminated while waiting for window to open")
-                return self.process.returncode
-
-        # Re-enable initial focus
-        rc = run_command([
-            "/usr/bin/hyprctl",
-            "keyword",
-            "windowrulev2",
-            "'unset,class:^(.*)$'"
-        ])
+            # Determine the application's clientID 
+            self.client_id = self.__await_window(clients_before, process=self.process)
 
-        return rc
+            logger.info(self.client_id)
 
-    def stop(self):
-        logger.info(f"Stopping application {self.name}")
-        rc = self.__close_application(self.client_id)
+            if job_cancelled():
+                self.__cancel_launch()
+                return rc
 
-        if self.process:
-            logger.info("Killing process and all children")
+            self.window.workspace.controller.search_index.update(
+                self, title=self.client_titles.get(self.client_id)
+            )
 
-            try:
-                parent = psutil.Process(self.process.pid)
-            except psutil.NoSuchProcess:
-                logger.warn(f"Unable to find process {self.process.pid}")
-                parent = None
+            self.window.workspace.controller.mark_changed(self.window.workspace)
 
-            if parent:        
-                for child in parent.children(recursive=True):
-                    try:
-                        child.kill()
-                    except psutil.NoSuchProcess:
-                        logger.warn(f"Failed to find process {child.ppid()} during kill")
-                
-                try:
-                    parent.kill()
-                except psutil.NoSuchProcess:
-                    logger.warn(f"Failed to find process {parent.ppid()} during kill")
+            self.window.workspace.controller.bus.publish(
+                "application_started",
+                application=self.name,
+                window=self.window.name,
+                pid=self.process.pid,
+                address=self.client_id,
+            )
 
+            # Move this application to the correct window, and drop its launch
+            # rules in the same round trip
+            unset_commands = launch_rules.release([launch_match])
+            commands = list(unset_commands)
+
+            if self.client_id:
+                commands.append(self.plan_move_to_window())
+
+            rc, stdout = run_batch(commands)
+            released = True
+        finally:
+            # Rules already given back whose batch failed are still
+            # installed in the compositor
+            if not released and unset_commands != None:
+                run_batch(unset_commands)
+            elif not released:
+                run_batch(launch_rules.release([launch_match]))
+
+        if not self.client_id and self.process.poll() != None:
+            logger.warning(f"Application {self.name} terminated while waiting for window to open")
+            rc = self.process.returncode
+
+        report_progress(
+            application=self.name,
+            window=self.window.name,
+            state="started" if rc == 0 else "failed",
+            rc=rc,
+            pid=self.process.pid,
+            address=self.client_id,
+        )
+
+        return rc
+
+    def stop(self, close=True):
+        # Without close, the client was already asked to close
+        logger.info(f"Stopping application {self.name}")
+        self.window.workspace.controller.search_index.remove(self)
+        self.window.workspace.controller.history.remove("applications", self)
+
+        rc = self.__close_application(self.client_id) if close else 0
+
+        self.__kill_process()
 
         self.window.workspace.controller.file_manager.remove_application_subdir(
             self.window.name, self.name
         )
 
+        self.window.workspace.controller.bus.publish(
+            "application_exited",
+            application=self.name,
+            window=self.window.name,
+            pid=self.process.pid if self.process else None,
+        )
+
         self.process = None
 
+        self.window.workspace.controller.mark_changed(self.window.workspace)
+
         return rc
 
     def restore(self):
         pass
 
+    def reconcile(self, clients_by_addr):
+        # Check a restored application against the compositor's clients,
+        # returning the commands which put its client back in its window.
+        # Applications whose client is gone, or which never had one and
+        # whose process is gone, are marked for relaunch.
+        if self.client_id == None:
+            if self.process == None or not is_running(self.process):
+                logger.info(f"Application {self.name} no longer has a process, marking it for relaunch")
+                self.needs_relaunch = True
+
+            return []
+
+        client = clients_by_addr.get(self.client_id)
+
+        if client == None:
+            logger.info(f"Application {self.name} no longer has a client, marking it for relaunch")
+            self.needs_relaunch = True
+            return []
+
+        if client["workspace"]["id"] != self.window.window_id:
+            logger.info(f"Application {self.name} was moved to workspace {client['workspace']['id']}, moving it back")
+            return [self.plan_move_to_window()]
+
+        return []
+
+    def attach_client(self, client_id, title=None):
+        logger.info(f"Application {self.name} now has client {client_id}")
+
+        self.client_id = client_id
+
+        self.window.workspace.controller.search_index.update(self, title=title)
+        self.window.workspace.controller.mark_changed(self.window.workspace)
+
+    def forget(self):
+        # The application went away on its own, so drop it from the tree
+        # without touching its client or process
+        logger.info(f"Forgetting application {self.name}")
+
+        self.window.workspace.controller.search_index.remove(self)
+        self.window.workspace.controller.history.remove("applications", self)
+
+        self.window.workspace.controller.file_manager.remove_application_subdir(
+            self.window.name, self.name
+        )
+
+        self.window.applications.remove(self)
+
+        self.window.workspace.controller.bus.publish(
+            "application_exited",
+            application=self.name,
+            window=self.window.name,
+            pid=self.process.pid if self.process else None,
+        )
+
+        self.process = None
+        self.client_id = None
+
+        self.window.workspace.controller.mark_changed(self.window.workspace)
+
+    def move_to(self, window):
+        # Follow a client which was moved to another window. Application
+        # names are unique within a window, so this fails on a collision.
+        if any(app.name == self.name for app in window.applications):
+            return False
+
+        logger.info(f"Moving application {self.name} from window {self.window.name} to {window.name}")
+
+        prev = self.window
+
+        self.window.workspace.controller.file_manager.rename_application_subdir(
+            prev.name, window.name, self.name
+        )
+
+        prev.applications.remove(self)
+        window.applications.append(self)
+        self.window = window
+
+        # The window it joined already decides what gets focus
+        self.focused_default = False
+
+        self.window.workspace.controller.search_index.update(self)
+        self.window.workspace.controller.mark_changed(prev.workspace)
+        self.window.workspace.controller.mark_changed(window.workspace)
+
+        return True
+
+    def relaunch(self):
+        logger.info(f"Relaunching application {self.name}")
+
+        self.needs_relaunch = False
+
+        # Whatever is left of the old process shouldn't outlive its client
+        if self.process and self.__owns_process():
+            self.__kill_process()
+
+        self.process = None
+        self.client_id = None
+
+        self.window.workspace.controller.file_manager.remove_application_subdir(
+            self.window.name, self.name
+        )
+
+        return self.start()
+
     def activate(self, force=False):
         logger.info(f"Activating application {self.name}")
-        if self.focused_default or force:
+
+        rc, stdout = run_batch(self.plan_activate(force=force))
+
+        return rc
+
+    def plan_activate(self, force=False):
+        if self.client_id and (self.focused_default or force):
             logger.debug(f"Giving focus to default focused application {self.name}")
-            rc = self.__focus_application(self.client_id)
+            return [["dispatch", "focuswindow", f"address:{self.client_id}"]]
+
+        return []
+
+    def owns_client(self, client):
+        # Whether the client was opened by the process of this application,
+        # or by one of its children
+        if self.process == None:
+            return False
+
+        if client["pid"] == self.process.pid:
+            return True
+
+        try:
+            return self.process.pid in [parent.pid for parent in psutil.Process(client["pid"]).parents()]
+        except psutil.Error:
+            return False
+
+    def plan_close(self):
+        return ["dispatch", "closewindow", f"address:{self.client_id}"]
+
+    def plan_move_to_window(self):
+        return ["dispatch", "movetoworkspacesilent", f"{self.window.window_id},address:{self.client_id}"]
+
+    def launch_match(self):
+        # The window rule match for the windows this application is expected
+        # to open. Until a launch has shown which class it uses, guess the
+        # name of the executable, which is the convention most follow.
+        window_class = self.window.workspace.controller.profiles.get_window_class(self.exec)
+
+        if window_class == None:
+            window_class = os.path.basename(shlex.split(self.exec)[0])
+
+        return class_match(window_class)
 
     """
     """
@@ -147,149 +354,243 @@ class Application:
 
     """
 
+    def __adopt(self):
+        # Re-attach the process this application had before the daemon
+        # went down, along with its clients. A process which has no client
+        # right now is still adopted, it claims the next one it opens.
+        controller = self.window.workspace.controller
+        app_subdir, process = controller.take_orphan(self.window.name, self.name)
+
+        if process == None:
+            return False
+
+        self.process = process
+        self.application_subdir = app_subdir
+        self.adopted = True
+
+        # Follow a client which is already in this window if there is one,
+        # the others are left open and followed once it closes
+        clients = sorted(
+            [client for client in controller.get_orphan_clients() if self.owns_client(client)],
+            key=lambda client: client["workspace"]["id"] != self.window.window_id,
+        )
+
+        if len(clients) == 0:
+            logger.info(f"Adopting process {process.pid} of application {self.name}, which has no client yet")
+        else:
+            logger.info(f"Adopting process {process.pid} and {len(clients)} clients of application {self.name}")
+            self.client_id = clients[0]["address"]
+
+        controller.reconciler.watch_process(self)
+        controller.scheduler.apply_application(self)
+        controller.search_index.update(self, title=clients[0].get("title") if clients else None)
+        controller.mark_changed(self.window.workspace)
+
+        controller.bus.publish(
+            "application_started",
+            application=self.name,
+            window=self.window.name,
+            pid=self.process.pid,
+            address=self.client_id,
+        )
+
+        if len(clients) > 0 and clients[0]["workspace"]["id"] != self.window.window_id:
+            rc, stdout = run_batch([self.plan_move_to_window()])
+
+        return True
+
+    def __cancel_launch(self):
+        # Drop an application whose job was cancelled before it finished
+        # launching, along with whatever it had opened so far
+        logger.info(f"Launch of application {self.name} was cancelled")
+
+        controller = self.window.workspace.controller
+
+        if self.client_id:
+            self.__close_application(self.client_id)
+
+        self.__kill_process()
+
+        controller.file_manager.remove_application_subdir(self.window.name, self.name)
+        controller.search_index.remove(self)
+        controller.history.remove("applications", self)
+
+        if self in self.window.applications:
+            self.window.applications.remove(self)
+
+        report_progress(application=self.name, window=self.window.name, state="cancelled")
+
+        self.process = None
+        self.client_id = None
+
+        controller.mark_changed(self.window.workspace)
+
     def __await_window(self, clients_before, process):
         logger.info("Awaiting window opening")
 
-        logger.debug(f"clients_before: {clients_before}")
+        logger.debug("clients_before: %s", clients_before)
 
-        clients_after = self.__get_application_ids()
+        profiles = self.window.workspace.controller.profiles
+        profile = profiles.get(self.exec)
 
-        logger.debug(f"clients_after (initial): {clients_after}")
+        poll_time = min(BASE_WAIT_TIME, profile["poll_time"]) if profile else BASE_WAIT_TIME
 
-        MAX_TOTAL_TRIES = 50
-        BASE_WAIT_TIME  = 0.25
-        STABILITY_TRIES = 10
+        b_set = set(clients_before)
+        new_ids = []
 
-        total_tries = 0
+        # Times are measured from the launch of the application
+        first_window_at = None
+        changed_at = None
 
-        first_client_opened = False
-        clients_after_first = None
-        tries_after_first   = -1
+        elapsed = time.monotonic() - self.started_at
+        total_tries = 0
 
         last_client_opened = False
+        cut_off = False
 
         # This is ugly, but it's necessary. Still doesn't account
         # silly applications like Steam that like to open a bunch of
         # different windows.
-        while not last_client_opened and total_tries < MAX_TOTAL_TRIES:
-            time.sleep(BASE_WAIT_TIME)
+        while not last_client_opened and elapsed < MAX_WAIT_TIME:
+            remaining = get_remaining_time()
+
+            # Whoever cancelled the job doesn't want the window anymore
+            if job_cancelled():
+                logger.info(f"Job cancelled while awaiting window of application {self.name}")
+                cut_off = True
+                break
+
+            # Stop waiting at the deadline of the command, the reconciler
+            # will pick up the window if it opens later
+            if remaining != None and (remaining <= poll_time or deadline_expired()):
+                logger.warning(f"Deadline reached while awaiting window of application {self.name}")
+                expire_deadline("await_window")
+                cut_off = True
+                break
+
+            time.sleep(poll_time)
             clients_after = self.__get_application_ids()
 
+            elapsed = time.monotonic() - self.started_at
             total_tries = total_tries + 1
 
-            # # See if the process has terminated
-            # process.poll()
-
-            # if process.returncode != None:
-            #     return None
-            
-            if not first_client_opened:
-                # We can tell the first client opened
-                # by checking the current number of client IDs
-                # against the number of client IDs from before
-                # the application was opened
-                first_client_opened = len(clients_before) != len(clients_after)
-
-                if first_client_opened:
-                    clients_after_first = copy.deepcopy(clients_after)
-                    tries_after_first = total_tries
-            else:
-                # This is after the first client opened. At this point
-                # we continue checking for any changes in the number of
-                # clients of their ids. This is because some applications will
-                # close and then reopen or other such jazz.
-                if clients_after_first != clients_after:
-                    clients_after_first = copy.deepcopy(clients_after)
-                    tries_after_first = total_tries
-            
-                # There's no perfect way to know if a given application
-                # is done opening new windows. It's literally just another
-                # expression of the Halting problem. But this isn't a bad
-                # estimation. Basically we want to see the client IDs remain
-                # the same for a desired number of polls, at which point we
-                # infer that it's probably done with its startup process
-                # and has opened all the windows it's going to open.
-                if (total_tries - tries_after_first) >= STABILITY_TRIES:
+            # Some applications will close and then reopen windows or
+            # other such jazz, so any change in the new clients counts
+            current_ids = [n_id for n_id in clients_after if n_id not in b_set]
+
+            if current_ids != new_ids:
+                new_ids = current_ids
+                changed_at = elapsed
+
+                if first_window_at is None and len(new_ids) > 0:
+                    first_window_at = elapsed
+
+            if first_window_at is None:
+                continue
+
+            # There's no perfect way to know if a given application
+            # is done opening new windows. It's literally just another
+            # expression of the Halting problem. If we've learned how this
+            # application usually starts, we stop once it has opened its
+            # usual number of windows by its usual time. Otherwise we want
+            # to see the client IDs remain the same for a desired number of
+            # polls, at which point we infer that it's probably done with
+            # its startup process.
+            if profile:
+                if len(new_ids) >= profile["windows"] and elapsed >= profile["settle_time"]:
                     last_client_opened = True
-            
-            logger.debug(f"total_tries:   {total_tries}")
-            logger.debug(f"   - clients_after: {clients_after}")
-            logger.debug(f"   - clients_after_first: {clients_after_first}")
-            logger.debug(f"   - first_client_opened: {first_client_opened}")
-            logger.debug(f"   - last_client_opened:  {last_client_opened}")
-            logger.debug(f"   - tries_after_first:   {tries_after_first}")
-
-            
-
+                elif elapsed > profile["deadline"]:
+                    logger.info(f"Application {self.name} is slower than its profile, falling back to stability polling")
+                    profile = None
+                    poll_time = BASE_WAIT_TIME
+            elif elapsed - changed_at >= STABILITY_TRIES * BASE_WAIT_TIME:
+                last_client_opened = True
+
+        logger.debug("Awaited window for %d tries, %.2fs, new_ids: %s", total_tries, elapsed, new_ids)
+
+        # A wait cut short says nothing about how the application starts
+        if not cut_off:
+            profiles.record(
+                self.exec,
+                first_window_at,
+                changed_at if first_window_at is not None else None,
+                len(new_ids),
+                window_class=self.client_classes.get(new_ids[-1]) if len(new_ids) > 0 else None,
+            )
+            self.window.workspace.controller.file_manager.save_profiles(profiles.show())
 
         # Determing the node ID of this application based on before/after
         # lists
-        b_set = set(clients_before)
-        new_ids = [n_id for n_id in clients_after if n_id not in b_set]
-
-        logger.debug(f"new_ids: {new_ids}")
-
         return new_ids[-1] if len(new_ids) > 0 else None
     
     def __get_application_ids(self):
         # Get the hyprctl client IDs before opening this application
-        rc, stdout = run_command(["/usr/bin/hyprctl", "clients", "-j"])
+        rc, stdout = run_command([HYPRCTL_PATH, "clients", "-j"])
 
         if rc != 0:
             pass  # TODO: handle error
 
         clients_data = json.loads(stdout)
 
+        self.client_titles = { c_data['address']: c_data.get('title', '') for c_data in clients_data }
+        self.client_classes = { c_data['address']: c_data.get('class') for c_data in clients_data }
+
         return list(map(lambda c_data: c_data['address'], clients_data))
 
-    def __move_application_to_window(self, client_id, window_id):
+    def __close_application(self, client_id):
         rc, stdout = run_command([
-            "/usr/bin/hyprctl",
+            HYPRCTL_PATH,
             "dispatch",
-            "movetoworkspacesilent",
-            f"{window_id},address:{client_id}"
+            "closewindow",
+            f"address:{client_id}"
         ])
 
         if rc != 0:
             pass # TODO: handle error
         
         return rc
+    
+    def __kill_process(self):
+        if self.process:
+            logger.info("Killing process and all children")
 
-    def __focus_application(self, client_id):
-        rc, stdout = run_command([
-            "/usr/bin/hyprctl",
-            "dispatch",
-            "focuswindow",
-            f"address:{client_id}"
-        ])
+            try:
+                parent = psutil.Process(self.process.pid)
+            except psutil.NoSuchProcess:
+                logger.warn(f"Unable to find process {self.process.pid}")
+                parent = None
 
-        if rc != 0:
-            pass
+            if parent:        
+                for child in parent.children(recursive=True):
+                    try:
+                        child.kill()
+                    except psutil.NoSuchProcess:
+                        logger.warn(f"Failed to find process {child.ppid()} during kill")
+                
+                try:
+                    parent.kill()
+                except psutil.NoSuchProcess:
+                    logger.warn(f"Failed to find process {parent.ppid()} during kill")
 
-        return rc
+    def __owns_process(self):
+        # The pid may have been reused since it was saved
+        process = self.window.workspace.controller.file_manager.get_application_process(
+            self.window.name, self.name
+        )
 
-    def __close_application(self, client_id):
-        rc, stdout = run_command([
-            "/usr/bin/hyprctl",
-            "dispatch",
-            "closewindow",
-            f"address:{client_id}"
-        ])
+        return process != None and process.pid == self.process.pid
 
-        if rc != 0:
-            pass # TODO: handle error
-        
-        return rc
-    
     def __get_process(self, pid):
         logger.debug(f"Attempting to recover process with PID {pid}")
-        process = None
 
-        try:
-            process = psutil.Process(pid)
-        except psutil.NoSuchProcess:
-            logger.warning(f'No process with PID {pid} exists.')
-        except psutil.AccessDenied:
-            logger.warning(f'Access denied to process with PID {pid}.')
-        
+        # Only the process the pidfile was written for, the pid may have
+        # been reused since the state was saved
+        process = self.window.workspace.controller.file_manager.get_application_process(
+            self.window.name, self.name
+        )
+
+        if process == None or process.pid != pid:
+            logger.warning(f'Process with PID {pid} no longer exists.')
+            return None
+
         return process
\ No newline at end of file
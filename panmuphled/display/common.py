@@ -1,12 +1,90 @@
+import json
 import logging
+import os
 import subprocess
+import threading
+import time
+
+import psutil
 
 logger = logging.getLogger(__name__)
 
+# May point at a stand-in like panmuphlectl.simulator
+HYPRCTL_PATH = os.environ.get("PANMUPHLE_HYPRCTL", "/usr/bin/hyprctl")
+
+# The compositor answers in milliseconds when it's healthy, so a call which
+# takes longer than this is hanging regardless of any deadline
+HYPRCTL_TIMEOUT = 2.0
+
+# Seconds anything else, like a selector, may run when there's no deadline
+# left to bound it
+EXTERNAL_TIMEOUT = 60.0
+
+# Compositor commands deferred by run_batch while coalescing, per thread
+coalescing = threading.local()
+
+# Deadline of the IPC command being handled, per thread
+deadlines = threading.local()
+
+# Job the command on this thread runs for, which may be cancelled and is
+# told about progress
+jobs = threading.local()
+
+# Operation -> number of times it timed out
+timeout_counts = {}
+timeout_lock = threading.Lock()
+
+# Thread id -> (command, started at) of external calls in flight, so a
+# stalled thread can be told apart from one waiting on the compositor
+pending_calls = {}
+
+
+class CommandTimeout(Exception):
+    pass
+
 
 def run_command(command, input=None):
-    logger.debug(f"Running command: '{command}'")
-    p = subprocess.run(command, capture_output=True, text=True, input=input)
+    # Whatever runs next may depend on the effects of deferred commands
+    flush_dispatches()
+
+    operation = get_operation_name(command)
+    timeout = HYPRCTL_TIMEOUT if command[0] == HYPRCTL_PATH else None
+    remaining = get_remaining_time()
+
+    # Once the deadline has expired the command is reported as timed out,
+    # and whatever it still does to clean up is only bounded per call
+    if remaining != None and not deadline_expired():
+        if remaining <= 0:
+            expire_deadline(operation)
+            raise CommandTimeout(f"Deadline passed before running {operation}")
+
+        timeout = remaining if timeout == None else min(timeout, remaining)
+    elif timeout == None:
+        timeout = EXTERNAL_TIMEOUT
+
+    logger.debug("Running command: '%s'", command)
+
+    pending_calls[threading.get_ident()] = (command, time.monotonic())
+
+    try:
+        p = subprocess.run(command, capture_output=True, text=True, input=input, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        # subprocess.run has already killed it
+        logger.warning(f"Command timed out after {timeout:.2f}s, {command}")
+
+        # Outside of a command, on the event and reconciler threads or while
+        # starting up, nothing expects a timeout and it fails like any call
+        if remaining == None:
+            count_timeout(operation)
+            return [1, None]
+
+        if deadline_expired():
+            count_timeout(operation)
+
+        expire_deadline(operation)
+        raise CommandTimeout(f"{operation} timed out after {timeout:.2f}s")
+    finally:
+        pending_calls.pop(threading.get_ident(), None)
 
     if p.returncode:
         logger.warning(f"Error running command, {command}")
@@ -15,3 +93,251 @@ def run_command(command, input=None):
         return [p.returncode, None]
 
     return [p.returncode, p.stdout]
+
+
+def run_batch(commands):
+    # Run several hyprctl commands, e.g. ["dispatch", "workspace", "3"], in a
+    # single round trip to the compositor
+    if len(commands) == 0:
+        return [0, ""]
+
+    if getattr(coalescing, "pending", None) != None:
+        coalescing.pending.extend(commands)
+        return [0, ""]
+
+    rc = 0
+
+    for call in get_batch_calls(commands):
+        call_rc, stdout = run_command(call)
+        rc = rc or call_rc
+
+    return [rc, stdout]
+
+
+def get_batch_calls(commands):
+    # hyprctl splits batches on ';' and has no way of escaping it, so a
+    # command with one in an argument, e.g. an exec, is sent on its own
+    calls = []
+    batch = []
+
+    for command in commands:
+        if not any(";" in arg for arg in command):
+            batch.append(command)
+            continue
+
+        if len(batch) > 0:
+            calls.append([HYPRCTL_PATH, "--batch", " ; ".join(" ".join(command) for command in batch)])
+            batch = []
+
+        calls.append([HYPRCTL_PATH] + command)
+
+    if len(batch) > 0:
+        calls.append([HYPRCTL_PATH, "--batch", " ; ".join(" ".join(command) for command in batch)])
+
+    return calls
+
+
+def start_coalescing():
+    # Defer every run_batch on this thread until coalescing stops, or until
+    # some other command runs, so that a sequence of operations reaches the
+    # compositor in as few round trips as possible
+    coalescing.pending = []
+    coalescing.failed = False
+
+
+def stop_coalescing():
+    rc, stdout = flush_dispatches()
+
+    # Dispatches flushed early, by some other command, fail the whole lot
+    if rc == 0 and dispatches_failed():
+        rc = 1
+
+    coalescing.pending = None
+    coalescing.failed = False
+
+    return [rc, stdout]
+
+
+def flush_dispatches():
+    pending = getattr(coalescing, "pending", None)
+
+    if not pending:
+        return [0, ""]
+
+    coalescing.pending = None
+
+    try:
+        rc, stdout = run_batch(pending)
+    finally:
+        coalescing.pending = []
+
+    # Whatever deferred them has already returned
+    if rc != 0:
+        coalescing.failed = True
+
+    return [rc, stdout]
+
+
+def dispatches_failed():
+    return getattr(coalescing, "failed", False)
+
+
+def set_deadline(seconds):
+    deadlines.at = time.monotonic() + seconds if seconds != None else None
+    deadlines.expired = False
+
+
+def clear_deadline():
+    # Whether the deadline expired while it was set
+    expired = getattr(deadlines, "expired", False)
+
+    deadlines.at = None
+    deadlines.expired = False
+
+    return expired
+
+
+def get_remaining_time():
+    # Seconds left until the deadline on this thread, or None without one
+    at = getattr(deadlines, "at", None)
+
+    return at - time.monotonic() if at != None else None
+
+
+def deadline_expired():
+    return getattr(deadlines, "expired", False)
+
+
+def expire_deadline(operation):
+    if not deadline_expired():
+        count_timeout(operation)
+
+    deadlines.expired = True
+
+
+def count_timeout(operation):
+    with timeout_lock:
+        timeout_counts[operation] = timeout_counts.get(operation, 0) + 1
+
+
+def get_timeout_counts():
+    with timeout_lock:
+        return dict(timeout_counts)
+
+
+def set_job(job):
+    jobs.current = job
+
+
+def clear_job():
+    jobs.current = None
+
+
+def get_job():
+    return getattr(jobs, "current", None)
+
+
+def job_cancelled():
+    # Whether the job this thread runs for was cancelled, commands which
+    # aren't run as jobs can't be
+    job = getattr(jobs, "current", None)
+
+    return job != None and job.cancelled.is_set()
+
+
+def report_progress(**progress):
+    job = getattr(jobs, "current", None)
+
+    if job != None:
+        job.report(progress)
+
+
+def get_pending_calls():
+    return dict(pending_calls)
+
+
+def get_operation_name(command):
+    if command[0] == HYPRCTL_PATH and len(command) > 1:
+        return f"hyprctl {command[1]}"
+
+    return os.path.basename(command[0])
+
+
+def run_queries(queries):
+    # Run several hyprctl queries, e.g. ["clients", "workspaces"], in a single
+    # round trip to the compositor, returning their decoded responses, or
+    # None if any of them failed
+    rc, stdout = run_batch([[f"j/{query}"] for query in queries])
+
+    if rc != 0:
+        return None
+
+    # The responses are concatenated, so decode them one after another
+    decoder = json.JSONDecoder()
+    responses = []
+    idx = 0
+
+    for query in queries:
+        while idx < len(stdout) and stdout[idx].isspace():
+            idx = idx + 1
+
+        try:
+            response, idx = decoder.raw_decode(stdout, idx)
+        except json.JSONDecodeError:
+            logger.warning(f"Unable to decode response to query {query}")
+            return None
+
+        responses.append(response)
+
+    return responses
+
+
+def is_running(process):
+    # Processes are our own children when launched, and found by pid when
+    # they outlived a previous run of the daemon
+    if isinstance(process, subprocess.Popen):
+        return process.poll() == None
+
+    try:
+        return process.is_running() and process.status() != psutil.STATUS_ZOMBIE
+    except psutil.Error:
+        return False
+
+def fuzzy_score(query, text):
+    # Score how well a query matches some text, or None if the characters
+    # of the query don't appear in order in the text. Prefix matches beat
+    # substring matches, which beat scattered subsequence matches.
+    query = query.lower()
+    text = text.lower()
+
+    if not query:
+        return 0
+
+    if text.startswith(query):
+        return 1000 - len(text)
+
+    idx = text.find(query)
+
+    if idx >= 0:
+        boundary = idx == 0 or not text[idx - 1].isalnum()
+        return (600 if boundary else 500) - idx - len(text)
+
+    score = 0
+    pos = -1
+
+    for ch in query:
+        next_pos = text.find(ch, pos + 1)
+
+        if next_pos < 0:
+            return None
+
+        if next_pos == pos + 1:
+            score = score + 5
+        elif next_pos == 0 or not text[next_pos - 1].isalnum():
+            score = score + 3
+        else:
+            score = score - 1
+
+        pos = next_pos
+
+    return score - len(text)
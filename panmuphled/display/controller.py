@@ -1,9 +1,31 @@
 import logging
 import json
-
-from panmuphled.display.common import run_command
+import sys
+import threading
+
+from panmuphled.display.allocator import WorkspaceAllocator
+from panmuphled.display.common import run_command, run_batch, run_queries, get_timeout_counts, job_cancelled, HYPRCTL_PATH
+from panmuphled.display.events import EventListener, parse_address
+from panmuphled.display.frecency import Frecency
+from panmuphled.display.freezer import Freezer
+from panmuphled.display.hibernation import Hibernator
+from panmuphled.display.history import History, MAX_HISTORY
+from panmuphled.display.profiles import StartupProfiles
+from panmuphled.display.reconciler import Reconciler
+from panmuphled.display.scheduling import Scheduler
+from panmuphled.display.scratchpad import Scratchpads
+from panmuphled.display.rules import LaunchRules
+from panmuphled.display.search import SearchIndex, DEFAULT_RESULT_LIMIT
+from panmuphled.display.snapshot import Snapshots
 from panmuphled.display.workspace import Workspace
+from panmuphled.server.catalog import ApplicationCatalog
 from panmuphled.server.file_manager import FileManager
+from panmuphled.server.jobs import Jobs
+from panmuphled.server.logs import Logs
+from panmuphled.server.profiling import Profiler, MemoryProfiler
+from panmuphled.server.stalls import StallDetector
+from panmuphled.server.parser import Parser, RC_OK, UNBATCHABLE_COMMANDS
+from panmuphled.server.subscriptions import EventBus
 
 logger = logging.getLogger(__name__)
 
@@ -12,6 +34,53 @@ class Controller:
     def __init__(self, config_path):
         self.config_path = config_path
 
+        # Held while commands and compositor events modify the tree
+        self.lock = threading.RLock()
+
+        self.bus = EventBus()
+        self.file_manager = FileManager(self)
+        self.frecency = Frecency(self.file_manager.load_frecency())
+        self.profiles = StartupProfiles(self.file_manager.load_profiles())
+        self.launch_rules = LaunchRules()
+        self.freezer = Freezer(self)
+        self.scheduler = Scheduler(self)
+        self.hibernator = Hibernator(self)
+        self.catalog = ApplicationCatalog()
+        self.search_index = SearchIndex()
+        self.history = History()
+        self.snapshots = Snapshots(self)
+        self.profiler = Profiler(self)
+        self.memory_profiler = MemoryProfiler(self)
+        self.stall_detector = StallDetector(self)
+        self.jobs = Jobs(self)
+
+        # Compositor workspace id -> managed window
+        self.windows_by_id = {}
+        self.workspace_ids = WorkspaceAllocator()
+        self.focused_window_id = None
+
+        self.events = EventListener()
+        self.events.register("windowtitlev2", self.__on_window_title)
+        self.events.register("activewindowv2", self.__on_active_window)
+        self.events.register("workspacev2", self.__on_workspace)
+        self.events.register("focusedmonv2", self.__on_focused_monitor)
+        self.events.register("monitoraddedv2", self.__on_monitor_added)
+        self.events.register("monitorremoved", self.__on_monitor_removed)
+
+        self.reconciler = Reconciler(self)
+        self.events.register("closewindow", self.reconciler.on_close_window)
+        self.events.register("movewindowv2", self.reconciler.on_move_window)
+        self.events.register("openwindow", self.reconciler.on_open_window)
+
+        self.events.register("createworkspacev2", self.workspace_ids.on_create_workspace)
+        self.events.register("destroyworkspacev2", self.workspace_ids.on_destroy_workspace)
+        self.events.register("renameworkspace", self.workspace_ids.on_rename_workspace)
+
+        self.scratchpads = Scratchpads(self)
+        self.events.register("openwindow", self.scratchpads.on_open_window)
+        self.events.register("closewindow", self.scratchpads.on_close_window)
+        self.events.register("activespecial", self.scratchpads.on_active_special)
+
         valid_config = self.reload_config(config_path)
 
         if not valid_config:
@@ -19,13 +88,23 @@ class Controller:
             sys.exit(1)
 
         self.restored = False
-        self.file_manager = FileManager(self)
+
+        # Application subdirectory -> process, of applications which
+        # outlived a previous run of the daemon, until they're adopted
+        self.orphans = {}
+        self.orphan_clients = None
 
         self.workspaces = []
 
+        # Version of the tree last written to the state directory
+        self.persisted_version = None
+
         saved_state = self.file_manager.load_state()
+        saved_tree = self.file_manager.load_tree() if saved_state is None else None
 
-        if saved_state is None:
+        if saved_tree != None and len(saved_tree["workspaces"]) > 0:
+            self.rebuild(saved_tree)
+        elif saved_state is None:
             # Create a workspace instance for each workspace in the inital workspace list
             for ws_name in self.config["initial_workspaces"]:
                 inst_ws_name = self.get_next_workspace_name(ws_name)
@@ -33,6 +112,7 @@ class Controller:
                 self.workspaces.append(
                     Workspace(inst_ws_name, self, self.workspace_templates[ws_name])
                 )
+                self.__track_workspace(self.workspaces[-1])
 
             self.current_workspace = self.workspaces[0]
         else:
@@ -53,6 +133,35 @@ class Controller:
         if "workspaces" not in cfg:
             logger.error("Configuration file missing required attribute 'workspaces'")
 
+        if "scheduling" in cfg and not Scheduler.validate(cfg["scheduling"]):
+            return False
+
+        if "hibernation" in cfg and not Hibernator.validate(cfg["hibernation"]):
+            return False
+
+        if "logging" in cfg and not Logs.validate(cfg["logging"]):
+            return False
+
+        if "scratchpads" in cfg and not Scratchpads.validate(cfg["scratchpads"]):
+            return False
+
+        if "macros" in cfg and not Controller.validate_macros(cfg["macros"]):
+            return False
+
+        if "timeouts" in cfg:
+            if type(cfg["timeouts"]) != dict or not all(
+                type(timeout) in (int, float) and timeout > 0 for timeout in cfg["timeouts"].values()
+            ):
+                logger.error("'timeouts' element must map kinds of commands to positive numbers of seconds")
+                return False
+
+        if "stall_budgets" in cfg:
+            if type(cfg["stall_budgets"]) != dict or not all(
+                type(budget) in (int, float) and budget > 0 for budget in cfg["stall_budgets"].values()
+            ):
+                logger.error("'stall_budgets' element must map kinds of commands to positive numbers of seconds")
+                return False
+
         for ws_def in cfg["workspaces"]:
             if not Workspace.validate(ws_def):
                 return False
@@ -61,7 +170,35 @@ class Controller:
 
         return True
 
+    @staticmethod
+    def validate_macros(macros):
+        if type(macros) != dict:
+            logger.error(f"'macros' element incorrect type. Expecting type dict, got: {type(macros)}")
+            return False
+
+        for name, commands in macros.items():
+            if type(commands) != list:
+                logger.error(f"Macro {name} incorrect type. Expecting type list, got: {type(commands)}")
+                return False
+
+            for command in commands:
+                rc, parsed = Parser.parse_message(command)
+
+                if rc != RC_OK:
+                    logger.error(f"Invalid command in macro {name}: {parsed}")
+                    return False
+
+                if parsed["command"] in UNBATCHABLE_COMMANDS:
+                    logger.error(f"Command {parsed['command']} can't be used in macro {name}")
+                    return False
+
+        return True
+
     def reload_config(self, config_path):
+        with self.lock:
+            return self.__reload_config(config_path)
+
+    def __reload_config(self, config_path):
         logger.info(f"Opening configuration file {config_path}")
 
         with open(config_path) as conf_file:
@@ -76,6 +213,10 @@ class Controller:
 
         self.config = config
 
+        Logs.configure(self.config.get("logging", {}))
+        self.scratchpads.configure(self.config.get("scratchpads", []))
+        self.hibernator.configure()
+
         # Perform set up
         self.screens = self.__match_screen_ids(self.config["screens"])
         
@@ -85,6 +226,13 @@ class Controller:
         for ws_def in self.config["workspaces"]:
             self.workspace_templates[ws_def["name"]] = ws_def
 
+        self.frecency.drop_scope("templates", None)
+
+        for ws_name in self.workspace_templates:
+            self.frecency.add("templates", ws_name)
+
+        self.bus.publish("config_reloaded", config_path=config_path)
+
         return True
     
     ##################################
@@ -94,28 +242,100 @@ class Controller:
     def start(self):
         logger.info("Starting controller")
 
+        self.catalog.start()
+
+        # A restored controller was seeded while reconciling
+        if not self.workspace_ids.seeded:
+            self.__seed_workspace_ids()
+
         if self.restored == False:
-            self.file_manager.start()
+            self.orphans = self.file_manager.start()
             
             for workspace in self.workspaces:
-                workspace.start()
+                # A rebuilt workspace which was hibernated stays that way
+                # until it's switched to
+                if not workspace.hibernated:
+                    workspace.start()
+
+            self.scratchpads.adopt()
+            self.__release_orphans()
+        else:
+            for window in self.get_windows(all_win=True):
+                if not window.workspace.hibernated:
+                    window.relaunch()
+
+        self.__index_applications()
+        self.events.start()
+        self.reconciler.start()
+        self.hibernator.start()
+        self.stall_detector.start()
+        self.file_manager.start_flushing()
 
         logger.info("Activating current work space")
         self.current_workspace.activate()
+        self.scheduler.apply(self.workspaces)
+        self.history.record("workspaces", self.current_workspace)
 
     def stop(self):
         logger.info("Closing Controller")
 
+        # Jobs still launching applications wind down first
+        self.jobs.stop()
+
         for workspace in self.workspaces:
             workspace.stop()
 
+        self.scratchpads.stop()
+
         self.file_manager.stop()
+        self.flush()
+        # Nothing is left to adopt, the next run starts from the configuration
+        self.file_manager.remove_tree()
+        self.profiler.stop()
+        self.catalog.stop()
+        self.events.stop()
+        self.reconciler.stop()
+        self.freezer.stop()
+        self.hibernator.stop()
+        self.stall_detector.stop()
+        self.bus.stop()
 
     def restart(self):
         logger.info("Restarting Controller")
 
-        self.file_manager.save_state()
+        self.jobs.stop()
+
         self.file_manager.stop()
+        self.flush()
+        self.file_manager.save_state()
+        self.profiler.stop()
+        self.catalog.stop()
+        self.events.stop()
+        self.reconciler.stop()
+        self.freezer.stop()
+        self.hibernator.stop()
+        self.stall_detector.stop()
+        self.bus.stop()
+
+    def flush(self):
+        # Write whatever changed since it was last written, which commands
+        # leave to be done off their path
+        with self.lock:
+            frecency_state = self.frecency.show() if self.frecency.dirty else None
+            self.frecency.dirty = False
+
+            tree = self.show()
+
+            if tree["version"] == self.persisted_version:
+                tree = None
+            else:
+                self.persisted_version = tree["version"]
+
+        if frecency_state != None:
+            self.file_manager.save_frecency(frecency_state)
+
+        if tree != None:
+            self.file_manager.save_tree(tree)
 
     # Restore from a saved state
     def restore(self, saved_state):
@@ -127,14 +347,63 @@ class Controller:
 
         for ws in self.workspaces:
             ws.restore()
+            self.__track_workspace(ws)
 
             if ws.name == saved_state['current_workspace']:
                 self.current_workspace = ws
 
+        self.__reconcile_restored()
+
+    # Rebuild the tree a previous run last persisted, when it didn't get to
+    # save its state, so the applications of every workspace it had open are
+    # adopted rather than released
+    def rebuild(self, saved_tree):
+        logger.info("Rebuilding controller from the last persisted tree")
+
+        self.workspaces = [ Workspace(ws['name'], self, ws) for ws in saved_tree['workspaces'] ]
+        self.current_workspace = self.workspaces[0]
+
+        for ws in self.workspaces:
+            # Ids, processes and clients are those of the previous run, they
+            # are reserved and adopted again when the workspace starts
+            for window in ws.windows:
+                window.window_id = None
+                window.needs_reopen = ws.hibernated
+
+                for app in window.applications:
+                    app.process = None
+                    app.client_id = None
+                    app.needs_relaunch = ws.hibernated
+
+            self.__track_workspace(ws)
+
+            if ws.name == saved_tree['current_workspace']:
+                self.current_workspace = ws
+
     def show(self):
+        return self.snapshots.get()
+
+    def show_since(self, version):
+        return self.snapshots.since(version)
+
+    def mark_changed(self, workspace=None):
+        self.snapshots.mark_changed(workspace)
+
+    def get_stats(self):
         return {
-            'current_workspace': self.current_workspace.name,
-            'workspaces': [ ws.show() for ws in self.workspaces ]
+            "profiles": self.profiles.show_summary(),
+            "launch_rules": self.launch_rules.show(),
+            "workspace_ids": self.workspace_ids.show_stats(),
+            "scratchpads": self.scratchpads.show(),
+            "reconciler": self.reconciler.show_stats(),
+            "freezer": self.freezer.show_stats(),
+            "scheduler": self.scheduler.show_stats(),
+            "hibernator": self.hibernator.show_stats(),
+            "timeouts": get_timeout_counts(),
+            "profiler": self.profiler.show_stats(),
+            "memory_profiler": self.memory_profiler.show_stats(),
+            "stall_detector": self.stall_detector.show_stats(),
+            "jobs": self.jobs.show_stats(),
         }
 
     ##################################
@@ -146,13 +415,40 @@ class Controller:
         prev = self.current_workspace
         logger.info(f"Switching from workspace {prev.name} to workspace {next.name}")
 
-        next.activate(prev)
+        if next.hibernated:
+            self.hibernator.wake(next)
+
+        rc = next.activate(prev)
 
         self.current_workspace = next
 
+        if prev != next:
+            self.freezer.schedule(prev)
+
+        # Boost the workspace now in front and demote the one behind it
+        self.scheduler.apply([next] if prev == next else [next, prev])
+        self.history.record("workspaces", next)
+        self.mark_changed()
+
+        self.bus.publish("workspace_switched", workspace=next.name, previous=prev.name)
+
+        self.frecency.record("workspaces", next.name)
+
+        return rc
+
     def get_workspaces(self):
         return self.workspaces
 
+    def get_previous_workspace(self):
+        return self.history.previous("workspaces", current=self.current_workspace)
+
+    def get_workspace(self, ws_name):
+        for ws in self.workspaces:
+            if ws.name == ws_name:
+                return ws
+
+        return None
+
     def get_workspace_templates(self):
         return self.workspace_templates
 
@@ -165,31 +461,119 @@ class Controller:
         )
 
         new_ws = self.workspaces[-1]
+        self.__track_workspace(new_ws)
+        self.frecency.record("templates", template["name"])
+
         new_ws.start()
+        self.mark_changed()
+
+        # Nothing is left of a workspace whose job was cancelled before any
+        # of its applications started
+        if job_cancelled() and len([app for window in new_ws.windows for app in window.applications]) == 0:
+            logger.info(f"Opening workspace {new_ws.name} was cancelled, closing it")
+            return self.close_workspace(new_ws)
+
+        self.bus.publish("workspace_opened", workspace=new_ws.name, template=template["name"])
 
-        self.switch_workspace(new_ws)
+        return self.switch_workspace(new_ws)
 
     def close_workspace(self, workspace):
         self.workspaces.remove(workspace)
+        self.__untrack_workspace(workspace)
+        self.snapshots.mark_removed(workspace)
 
         if self.current_workspace == workspace:
             self.switch_workspace(self.workspaces[0])
 
         workspace.stop()
 
+        self.bus.publish("workspace_closed", workspace=workspace.name)
+
+        return RC_OK
+
     ##################################
     # Window Functions
     ##################################
 
     def switch_window(self, next):
+        if next.workspace is not self.current_workspace:
+            self.switch_workspace(next.workspace)
+
         target_screen_id = next.get_preferred_screen()
         
         if target_screen_id == None:
             target_screen_id = next.workspace.get_default_screen()
         
-        prev = self.current_workspace.get_window_at_screen(target_screen_id)
+        displayed = self.get_displayed_window_ids()
+        prev = self.current_workspace.get_window_by_id(displayed.get(target_screen_id))
+
+        rc = next.activate(screen_id=target_screen_id, prev=prev)
+
+        self.history.record("windows", next)
+
+        self.bus.publish("window_activated", window=next.name, workspace=next.workspace.name)
+
+        self.frecency.record("windows", next.name)
+
+        return rc
+
+    def get_previous_window(self):
+        current = self.windows_by_id.get(self.focused_window_id)
+
+        if current is None:
+            current = self.history.current("windows")
 
-        next.activate(screen_id=target_screen_id, prev=prev)
+        return self.history.previous("windows", current=current)
+
+    def register_window(self, window):
+        self.windows_by_id[window.window_id] = window
+
+        self.workspace_ids.hold(window.window_id, window.name)
+
+    def unregister_window(self, window):
+        if self.windows_by_id.get(window.window_id) is window:
+            del self.windows_by_id[window.window_id]
+
+        # The compositor destroys the workspace along with its last client
+        self.workspace_ids.release(window.window_id, window.name)
+
+        self.history.remove("windows", window)
+
+    def take_orphan(self, win_name, app_name):
+        # The subdirectory of an application, and the process it left
+        # behind if there is one
+        app_subdir = self.file_manager.get_application_subdir(win_name, app_name)
+
+        return app_subdir, self.orphans.pop(app_subdir, None)
+
+    def get_orphan_clients(self):
+        # Orphans are matched against a single query of the compositor
+        if self.orphan_clients == None:
+            snapshot = run_queries(["clients"])
+            self.orphan_clients = snapshot[0] if snapshot else []
+
+        return self.orphan_clients
+
+    def get_focused_window(self):
+        # Answered from compositor events when they are available, otherwise
+        # with a single query
+        if self.focused_window_id is None:
+            rc, stdout = run_command([HYPRCTL_PATH, "activeworkspace", "-j"])
+
+            if rc != 0:
+                return None
+
+            return self.windows_by_id.get(json.loads(stdout)["id"])
+
+        return self.windows_by_id.get(self.focused_window_id)
+
+    def get_window(self, wn_name):
+        for ws in self.workspaces:
+            for wn in ws.windows:
+                if wn.name == wn_name:
+                    return wn
+
+        return None
 
     def get_windows(self, ws_name=None, all_win=False):
         win_list = []
@@ -209,7 +593,33 @@ class Controller:
 
     def switch_application(self, next):
         self.switch_window(next.window)
-        next.activate(force=True)
+        rc = next.activate(force=True)
+
+        self.search_index.touch(next)
+        self.history.record("applications", next)
+
+        return rc
+
+    def cycle_recent_application(self):
+        # Skip over applications which have stopped since the cycle began
+        for _ in range(MAX_HISTORY):
+            app = self.history.cycle("applications")
+
+            if app is None:
+                return None
+
+            if app.window.workspace in self.workspaces and app in app.window.applications:
+                return app
+
+        return None
+
+    def search_applications(self, query, limit=DEFAULT_RESULT_LIMIT):
+        return self.search_index.search(query, limit=limit)
+
+    def launch_application(self, window, app_def):
+        window.launch_application(app_def)
+
+        self.frecency.record("executables", app_def["exec"])
 
     def get_applications(self, wn_name=None, all_apps=False):
         app_list = []
@@ -234,7 +644,7 @@ class Controller:
         app_list = [
             app for app in app_list if
                 (app.name == app_name and app_name is not None) or
-                (app.process.pid == app_pid and app_pid is not None) or
+                (app.process is not None and app.process.pid == app_pid and app_pid is not None) or
                 (app.client_id == app_addr and app_addr is not None)
         ]
 
@@ -244,6 +654,42 @@ class Controller:
         Utilities
     """
 
+    def get_connected_screens(self):
+        return [screen for screen in self.screens if "id" in screen]
+
+    def get_displayed_window_ids(self):
+        # Screen id -> id of the compositor workspace it displays, from a
+        # single query
+        rc, stdout = run_command([HYPRCTL_PATH, "monitors", "-j"])
+
+        if rc != 0:
+            return {}
+
+        return {
+            s_data['id']: s_data['activeWorkspace']['id']
+            for s_data in json.loads(stdout)
+            if 'activeWorkspace' in s_data
+        }
+
+    def resolve_screen_id(self, alias):
+        screen_id = self.get_screen_id(alias)
+
+        if screen_id != None:
+            return screen_id
+
+        # The screen isn't connected, use the configured fallback or else
+        # whichever screen is
+        if "fallback_screen" in self.config:
+            screen_id = self.get_screen_id(self.config["fallback_screen"])
+
+        if screen_id == None:
+            connected = self.get_connected_screens()
+            screen_id = connected[0]["id"] if len(connected) > 0 else None
+
+        logger.info(f"Screen {alias} is not connected, falling back to screen {screen_id}")
+
+        return screen_id
+
     def get_screen_id(self, alias):
         for screen in self.screens:
             if "id" not in screen:
@@ -266,13 +712,161 @@ class Controller:
     """
     """
 
+    def __reconcile_restored(self):
+        # Check every restored window and application against a single
+        # snapshot of the compositor, and fix everything that moved in a
+        # single batch. Whatever is gone is relaunched when starting.
+        snapshot = run_queries(["clients", "workspaces"])
+
+        if snapshot == None:
+            logger.warning("Unable to query compositor, restored state is unverified")
+            return
+
+        clients_data, workspaces_data = snapshot
+
+        clients_by_addr = { c_data['address']: c_data for c_data in clients_data }
+        workspaces_by_id = { w_data['id']: w_data for w_data in workspaces_data }
+
+        self.workspace_ids.seed(workspaces_data)
+
+        commands = []
+
+        for window in self.get_windows(all_win=True):
+            commands = commands + window.reconcile(clients_by_addr, workspaces_by_id)
+
+        rc, stdout = run_batch(commands)
+
+        if rc != 0:
+            logger.warning("Failed to move restored applications back to their windows")
+
+        logger.info(f"Reconciled restored state, moved {len(commands)} clients back")
+
+    def __release_orphans(self):
+        # Whatever wasn't adopted has no place in the tree anymore
+        for app_subdir, process in self.orphans.items():
+            self.file_manager.remove_orphan(app_subdir, process)
+
+        self.orphans = {}
+        self.orphan_clients = None
+
+    def __seed_workspace_ids(self):
+        snapshot = run_queries(["workspaces"])
+
+        if snapshot == None:
+            logger.warning("Unable to query compositor, assuming it has no workspaces")
+            snapshot = [[]]
+
+        self.workspace_ids.seed(snapshot[0])
+
+    def __index_applications(self):
+        # Seed the search index, including the titles of every client, with
+        # a single query to the compositor
+        for app in self.get_applications(all_apps=True):
+            self.search_index.update(app)
+
+        rc, stdout = run_command([HYPRCTL_PATH, "clients", "-j"])
+
+        if rc != 0:
+            logger.warning("Unable to retrieve client titles for search index")
+            return
+
+        self.search_index.seed_titles(json.loads(stdout))
+
+    def __on_window_title(self, data):
+        addr, title = data.split(",", 1)
+
+        # Commands search the index while holding the lock
+        with self.lock:
+            self.search_index.set_title(parse_address(addr), title)
+
+    def __on_active_window(self, data):
+        with self.lock:
+            app = self.search_index.get_application(parse_address(data))
+
+            if app is None:
+                return
+
+            self.history.record("applications", app)
+            self.history.record("windows", app.window)
+            self.search_index.touch(app)
+
+    def __on_workspace(self, data):
+        ws_id, ws_name = data.split(",", 1)
+
+        self.__set_focused_window_id(int(ws_id))
+
+    def __on_focused_monitor(self, data):
+        mon_name, ws_id = data.split(",", 1)
+
+        self.__set_focused_window_id(int(ws_id))
+
+    def __set_focused_window_id(self, window_id):
+        changed = window_id != self.focused_window_id
+
+        self.focused_window_id = window_id
+        window = self.windows_by_id.get(window_id)
+
+        if window is not None:
+            self.history.record("windows", window)
+
+            if changed:
+                self.bus.publish("window_activated", window=window.name, workspace=window.workspace.name)
+
+    def __on_monitor_added(self, data):
+        mon_id, mon_name, mon_desc = data.split(",", 2)
+
+        with self.lock:
+            for screen in self.screens:
+                if screen["name"] == mon_name:
+                    logger.info(f"Screen {mon_name} connected with ID {mon_id}")
+                    screen["id"] = int(mon_id)
+
+            self.__handle_topology_change()
+
+    def __on_monitor_removed(self, data):
+        mon_name = data
+
+        with self.lock:
+            for screen in self.screens:
+                if screen["name"] == mon_name and "id" in screen:
+                    logger.info(f"Screen {mon_name} disconnected")
+                    del screen["id"]
+
+            self.__handle_topology_change()
+
+    def __handle_topology_change(self):
+        # Reassign every window to a connected screen, then re-activate the
+        # current workspace in a single batch
+        for ws in self.workspaces:
+            ws.resolve_screens()
+
+        rc, stdout = run_batch(self.current_workspace.plan_activate())
+
+        if rc != 0:
+            logger.warning("Failed to re-activate workspace after screen change")
+
+    def __track_workspace(self, workspace):
+        self.frecency.add("workspaces", workspace.name)
+
+        for wn in workspace.windows:
+            self.frecency.add("windows", wn.name, scope=workspace.name)
+
+    def __untrack_workspace(self, workspace):
+        self.history.remove("workspaces", workspace)
+        self.frecency.remove("workspaces", workspace.name)
+        self.frecency.drop_scope("windows", workspace.name)
+
     def __match_screen_ids(self, screens):
         rc, stdout = run_command([
-            "/usr/bin/hyprctl",
+            HYPRCTL_PATH,
             "monitors",
             "-j"
         ])
 
+        if rc != 0:
+            logger.warning("Unable to query monitors, screens are left unmatched")
+            return screens
+
         screens_data = json.loads(stdout)
 
         for screen in screens:
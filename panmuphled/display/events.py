@@ -0,0 +1,109 @@
+import logging
+import os
+import socket
+import threading
+
+logger = logging.getLogger(__name__)
+
+"""
+    Listens on Hyprland's event socket and dispatches each event to the
+    handlers registered for it. Events arrive as lines of the form
+    'EVENT>>DATA'.
+"""
+
+RECONNECT_WAIT_TIME = 1.0
+
+
+class EventListener:
+    def __init__(self):
+        self.handlers = {}
+
+        self.sock = None
+        self.thread = None
+        self.running = False
+
+    @staticmethod
+    def get_socket_path():
+        signature = os.environ.get("HYPRLAND_INSTANCE_SIGNATURE")
+
+        if not signature:
+            return None
+
+        runtime_dir = os.environ.get("XDG_RUNTIME_DIR", f"/run/user/{os.getuid()}")
+
+        for base_dir in [os.path.join(runtime_dir, "hypr"), "/tmp/hypr"]:
+            socket_path = os.path.join(base_dir, signature, ".socket2.sock")
+
+            if os.path.exists(socket_path):
+                return socket_path
+
+        return None
+
+    def register(self, event, handler):
+        if event not in self.handlers:
+            self.handlers[event] = []
+
+        self.handlers[event].append(handler)
+
+    def start(self):
+        socket_path = EventListener.get_socket_path()
+
+        if socket_path == None:
+            logger.warning("Unable to locate compositor event socket, events are disabled")
+            return
+
+        logger.info(f"Listening for compositor events on {socket_path}")
+
+        self.running = True
+        self.thread = threading.Thread(
+            target=self.__listen, args=(socket_path,), name="event-listener", daemon=True
+        )
+        self.thread.start()
+
+    def stop(self):
+        logger.info("Stopping compositor event listener")
+        self.running = False
+
+        if self.sock:
+            try:
+                self.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def dispatch(self, event, data):
+        for handler in self.handlers.get(event, []):
+            try:
+                handler(data)
+            except Exception:
+                logger.exception(f"Error handling compositor event {event}>>{data}")
+
+    """
+    """
+
+    def __listen(self, socket_path):
+        while self.running:
+            try:
+                self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                self.sock.connect(socket_path)
+
+                with self.sock.makefile("r", encoding="utf-8", errors="replace") as events:
+                    for line in events:
+                        if ">>" not in line:
+                            continue
+
+                        event, data = line.rstrip("\n").split(">>", 1)
+                        self.dispatch(event, data)
+            except OSError as e:
+                if self.running:
+                    logger.warning(f"Lost connection to compositor event socket: {e}")
+            finally:
+                self.sock.close()
+
+            if self.running:
+                threading.Event().wait(RECONNECT_WAIT_TIME)
+
+
+def parse_address(addr):
+    # Events report client addresses without the '0x' prefix that
+    # 'hyprctl clients -j' uses
+    return addr if addr.startswith("0x") else f"0x{addr}"
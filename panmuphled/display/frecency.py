@@ -0,0 +1,159 @@
+import logging
+import math
+import time
+from bisect import bisect_left
+
+logger = logging.getLogger(__name__)
+
+"""
+    Frecency (frequency x recency) ranking of selector candidates.
+
+    Every use of a name adds exp(DECAY_RATE * (t - epoch)) to its score. Since
+    every score decays by the same factor as time passes, the ordering of
+    names never changes on its own, only when one of them is used. That lets
+    each candidate list stay sorted and pre-rendered, and be updated
+    incrementally on every switch.
+
+    Scores are kept in log space so they don't overflow.
+"""
+
+HALF_LIFE = 3 * 24 * 60 * 60
+DECAY_RATE = math.log(2) / HALF_LIFE
+
+CATEGORIES = ["workspaces", "windows", "templates", "executables"]
+
+
+class RankedList:
+    def __init__(self, scores):
+        # Scores are shared between every list of the same category
+        self.scores = scores
+
+        # Sorted ascending by key, which is the negated score, so that the
+        # highest scored name is first
+        self.keys = []
+        self.names = []
+
+        self.rendered = None
+
+    def add(self, name):
+        if name in self.names:
+            return
+
+        key = (-self.scores.get(name, float("-inf")), name)
+        idx = bisect_left(self.keys, key)
+
+        self.keys.insert(idx, key)
+        self.names.insert(idx, name)
+        self.rendered = None
+
+    def remove(self, name):
+        if name not in self.names:
+            return
+
+        idx = self.names.index(name)
+
+        del self.keys[idx]
+        del self.names[idx]
+        self.rendered = None
+
+    def update(self, name, old_score):
+        # Reposition a name after its score changed
+        if name not in self.names:
+            return
+
+        old_key = (-old_score, name)
+        idx = bisect_left(self.keys, old_key)
+
+        if idx >= len(self.names) or self.names[idx] != name:
+            idx = self.names.index(name)
+
+        del self.keys[idx]
+        del self.names[idx]
+
+        key = (-self.scores[name], name)
+        idx = bisect_left(self.keys, key)
+
+        self.keys.insert(idx, key)
+        self.names.insert(idx, name)
+        self.rendered = None
+
+    def render(self):
+        if self.rendered is None:
+            self.rendered = "\n".join(self.names)
+
+        return self.rendered
+
+
+class Frecency:
+    def __init__(self, saved=None):
+        self.epoch = time.time()
+        self.scores = {category: {} for category in CATEGORIES}
+
+        # Bumped whenever the scores of a category change, so that views
+        # derived from them know when to re-sort
+        self.generations = {category: 0 for category in CATEGORIES}
+
+        # Whether scores changed since they were last saved
+        self.dirty = False
+
+        if saved:
+            self.epoch = saved.get("epoch", self.epoch)
+
+            for category in CATEGORIES:
+                self.scores[category].update(saved.get("scores", {}).get(category, {}))
+
+        # Candidate lists are keyed by (category, scope), where the scope
+        # allows e.g. one window list per workspace
+        self.lists = {}
+
+    def get_list(self, category, scope=None):
+        if (category, scope) not in self.lists:
+            self.lists[(category, scope)] = RankedList(self.scores[category])
+
+        return self.lists[(category, scope)]
+
+    def add(self, category, name, scope=None):
+        self.get_list(category, scope).add(name)
+
+    def remove(self, category, name, scope=None):
+        self.get_list(category, scope).remove(name)
+
+    def drop_scope(self, category, scope):
+        self.lists.pop((category, scope), None)
+
+    def record(self, category, name, scope=None):
+        scores = self.scores[category]
+
+        old_score = scores.get(name, float("-inf"))
+        used_at = DECAY_RATE * (time.time() - self.epoch)
+
+        # log(exp(old_score) + exp(used_at))
+        high, low = max(old_score, used_at), min(old_score, used_at)
+        scores[name] = high + math.log1p(math.exp(low - high))
+        self.generations[category] = self.generations[category] + 1
+        self.dirty = True
+
+        logger.debug(f"Recorded use of {category} '{name}', score {scores[name]:.3f}")
+
+        for (list_category, list_scope), ranked in self.lists.items():
+            if list_category == category:
+                ranked.update(name, old_score)
+
+    def ordered(self, category, scope=None):
+        return self.get_list(category, scope).names
+
+    def render(self, category, scope=None):
+        return self.get_list(category, scope).render()
+
+    def rank_names(self, category, names):
+        # Order an arbitrary collection of names, for selections which aren't
+        # backed by a pre-rendered list
+        scores = self.scores[category]
+
+        return sorted(names, key=lambda name: (-scores.get(name, float("-inf")), name))
+
+    def show(self):
+        return {
+            "epoch": self.epoch,
+            "scores": {category: dict(scores) for category, scores in self.scores.items()},
+        }
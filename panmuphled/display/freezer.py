@@ -0,0 +1,256 @@
+import logging
+import os
+import re
+import signal
+import threading
+
+import psutil
+
+logger = logging.getLogger(__name__)
+
+"""
+    Suspends the applications of workspaces which have been in the
+    background for a while, for templates which opt in with a policy like
+
+        "freeze": {"after": 300, "allow": ["chat"]}
+
+    where applications named in 'allow' keep running. Workspaces are
+    frozen with a cgroup v2 freezer when the daemon can create cgroups
+    next to its own, and otherwise by stopping every process in the trees
+    of their applications. Applications share the daemon's process group,
+    so the group itself can't be stopped.
+"""
+
+CGROUP_ROOT = "/sys/fs/cgroup"
+
+
+class Freezer:
+    def __init__(self, controller):
+        self.controller = controller
+
+        # Workspace -> timer which freezes it
+        self.timers = {}
+        # Workspace -> applications which were frozen
+        self.frozen = {}
+
+        self.own_cgroup = Freezer.get_own_cgroup()
+        self.cgroup_dir = Freezer.get_cgroup_dir(self.own_cgroup)
+
+        self.lock = threading.Lock()
+
+        logger.info(f"Freezing workspaces with {'cgroup freezer in ' + self.cgroup_dir if self.cgroup_dir else 'SIGSTOP'}")
+
+    @staticmethod
+    def get_own_cgroup():
+        # The daemon's own cgroup, if cgroup v2 is mounted
+        if not os.path.exists(os.path.join(CGROUP_ROOT, "cgroup.controllers")):
+            return None
+
+        try:
+            with open("/proc/self/cgroup") as cgroup_file:
+                lines = cgroup_file.read().splitlines()
+        except OSError:
+            return None
+
+        for line in lines:
+            if line.startswith("0::"):
+                return os.path.join(CGROUP_ROOT, line[3:].lstrip("/"))
+
+        return None
+
+    @staticmethod
+    def get_cgroup_dir(own_cgroup):
+        # The cgroup which contains the daemon's own, if we're allowed to
+        # create cgroups in it
+        if own_cgroup == None:
+            return None
+
+        cgroup_dir = os.path.dirname(own_cgroup)
+
+        return cgroup_dir if os.access(cgroup_dir, os.W_OK) else None
+
+    @staticmethod
+    def validate(policy):
+        if type(policy) != dict:
+            logger.error(f"'freeze' element incorrect type. Expecting type dict, got: {type(policy)}")
+            return False
+
+        if type(policy.get("after")) not in (int, float) or policy["after"] < 0:
+            logger.error("'freeze' element must contain a non-negative 'after' delay in seconds")
+            return False
+
+        if type(policy.get("allow", [])) != list:
+            logger.error(f"'allow' element of 'freeze' incorrect type. Expecting type list, got: {type(policy['allow'])}")
+            return False
+
+        return True
+
+    def schedule(self, workspace):
+        # Freeze a workspace once it's been in the background long enough
+        if workspace.freeze_policy == None:
+            return
+
+        with self.lock:
+            self.__cancel(workspace)
+
+            timer = threading.Timer(workspace.freeze_policy["after"], self.__freeze_in_background, args=(workspace,))
+            timer.daemon = True
+            self.timers[workspace] = timer
+
+        timer.start()
+
+    def freeze(self, workspace):
+        allow = workspace.freeze_policy.get("allow", []) if workspace.freeze_policy else []
+
+        apps = [
+            app
+            for window in workspace.windows
+            for app in window.applications
+            if app.name not in allow and app.process != None
+        ]
+
+        if len(apps) == 0:
+            return
+
+        logger.info(f"Freezing {len(apps)} applications of workspace {workspace.name}")
+
+        if not (self.cgroup_dir and self.__freeze_cgroup(workspace, apps, True)):
+            for app in apps:
+                self.__signal_tree(app, signal.SIGSTOP)
+
+        with self.lock:
+            self.frozen[workspace] = apps
+
+        self.controller.mark_changed(workspace)
+
+    def thaw(self, workspace):
+        with self.lock:
+            self.__cancel(workspace)
+            apps = self.frozen.pop(workspace, None)
+
+        if apps == None:
+            return
+
+        logger.info(f"Thawing {len(apps)} applications of workspace {workspace.name}")
+
+        if self.cgroup_dir:
+            self.__freeze_cgroup(workspace, apps, False)
+            self.__remove_cgroup(workspace)
+
+        # Continuing is harmless for processes which weren't stopped, and
+        # catches any which were stopped before they moved cgroup
+        for app in apps:
+            self.__signal_tree(app, signal.SIGCONT)
+
+        self.controller.mark_changed(workspace)
+
+    def is_frozen(self, workspace):
+        return workspace in self.frozen
+
+    def stop(self):
+        # Nothing should be left suspended once the daemon is gone
+        for workspace in list(self.frozen) + list(self.timers):
+            self.thaw(workspace)
+
+    def show_stats(self):
+        return {
+            "method": "cgroup" if self.cgroup_dir else "signal",
+            "frozen": [ws.name for ws in self.frozen],
+            "scheduled": [ws.name for ws in self.timers],
+        }
+
+    """
+    """
+
+    def __cancel(self, workspace):
+        timer = self.timers.pop(workspace, None)
+
+        if timer != None:
+            timer.cancel()
+
+    def __freeze_in_background(self, workspace):
+        with self.controller.lock:
+            with self.lock:
+                if self.timers.get(workspace) == None:
+                    return
+
+                del self.timers[workspace]
+
+            if workspace == self.controller.current_workspace or workspace not in self.controller.workspaces:
+                return
+
+            self.freeze(workspace)
+
+    def __get_cgroup_path(self, workspace):
+        return os.path.join(self.cgroup_dir, "panmuphled-" + re.sub(r"[^\w.-]", "_", workspace.name))
+
+    def __freeze_cgroup(self, workspace, apps, frozen):
+        cgroup_path = self.__get_cgroup_path(workspace)
+
+        try:
+            if frozen:
+                os.makedirs(cgroup_path, exist_ok=True)
+
+                for app in apps:
+                    for process in self.__get_tree(app):
+                        try:
+                            with open(os.path.join(cgroup_path, "cgroup.procs"), "w") as procs_file:
+                                procs_file.write(str(process.pid))
+                        except ProcessLookupError:
+                            # Exited since the tree was listed
+                            pass
+
+            with open(os.path.join(cgroup_path, "cgroup.freeze"), "w") as freeze_file:
+                freeze_file.write("1" if frozen else "0")
+        except OSError as e:
+            logger.warning(f"Unable to {'freeze' if frozen else 'thaw'} cgroup {cgroup_path}: {e}")
+
+            # Processes which already moved go back, so the whole tree is
+            # stopped with signals instead of only part of it being frozen
+            if frozen:
+                self.__remove_cgroup(workspace)
+
+            return False
+
+        return True
+
+    def __remove_cgroup(self, workspace):
+        # A cgroup can only be removed once it's empty, so its processes go
+        # back to the daemon's cgroup they were launched in
+        cgroup_path = self.__get_cgroup_path(workspace)
+
+        if not os.path.isdir(cgroup_path):
+            return
+
+        try:
+            with open(os.path.join(cgroup_path, "cgroup.procs")) as procs_file:
+                pids = procs_file.read().split()
+
+            for pid in pids:
+                try:
+                    with open(os.path.join(self.own_cgroup, "cgroup.procs"), "w") as procs_file:
+                        procs_file.write(pid)
+                except ProcessLookupError:
+                    pass
+
+            os.rmdir(cgroup_path)
+        except OSError as e:
+            logger.warning(f"Unable to remove cgroup {cgroup_path}: {e}")
+
+    def __signal_tree(self, app, sig):
+        for process in self.__get_tree(app):
+            try:
+                process.send_signal(sig)
+            except psutil.Error:
+                logger.debug(f"Unable to signal process {process.pid}")
+
+    def __get_tree(self, app):
+        if app.process == None:
+            return []
+
+        try:
+            parent = psutil.Process(app.process.pid)
+
+            return [parent] + parent.children(recursive=True)
+        except psutil.Error:
+            return []
@@ -0,0 +1,313 @@
+import logging
+import threading
+import time
+
+import psutil
+
+from panmuphled.display.common import run_batch, is_running
+
+logger = logging.getLogger(__name__)
+
+"""
+    Hibernates the least recently used workspaces when memory runs short.
+    Hibernating a workspace stops its applications but keeps its windows
+    and application definitions, and the workspace is relaunched the next
+    time it's switched to. It's enabled with a configuration element like
+
+        "hibernation": {
+            "pressure": 10.0,
+            "rss_mb": 8192,
+            "interval": 5,
+            "grace": 3,
+            "exempt": ["social"]
+        }
+
+    where 'pressure' is the share of time in the last ten seconds that
+    some tasks were stalled on memory, from /proc/pressure/memory, and
+    'rss_mb' is the total resident memory of all managed applications.
+    Crossing either threshold hibernates workspaces one after another
+    until the pressure is relieved. Since avg10 lags behind what was just
+    freed, the pressure is measured again over SETTLE_TIME after each
+    workspace. Applications are asked to close their windows and get
+    'grace' seconds to exit before they're killed. Workspaces of exempt
+    templates, and the current one, are never hibernated.
+"""
+
+PRESSURE_PATH = "/proc/pressure/memory"
+
+DEFAULT_INTERVAL = 5
+
+# Seconds applications get to exit after their windows are closed
+DEFAULT_GRACE = 3
+
+# Seconds the pressure is measured over after hibernating a workspace
+SETTLE_TIME = 1.0
+
+
+class Hibernator:
+    def __init__(self, controller):
+        self.controller = controller
+
+        self.hibernations = 0
+        self.last_pressure = None
+
+        # Whether the controller runs, the monitor itself only runs while
+        # the configuration asks for it
+        self.running = False
+
+        self.stopped = threading.Event()
+        self.thread = None
+
+    @staticmethod
+    def validate(policy):
+        if type(policy) != dict:
+            logger.error(f"'hibernation' element incorrect type. Expecting type dict, got: {type(policy)}")
+            return False
+
+        for key in ["pressure", "rss_mb", "interval", "grace"]:
+            if key in policy and (type(policy[key]) not in (int, float) or policy[key] <= 0):
+                logger.error(f"'{key}' of 'hibernation' must be a positive number")
+                return False
+
+        if "pressure" not in policy and "rss_mb" not in policy:
+            logger.error("'hibernation' element must contain a 'pressure' or 'rss_mb' threshold")
+            return False
+
+        if type(policy.get("exempt", [])) != list:
+            logger.error(f"'exempt' element of 'hibernation' incorrect type. Expecting type list, got: {type(policy['exempt'])}")
+            return False
+
+        return True
+
+    @staticmethod
+    def get_pressure():
+        # The 'some avg10' memory pressure, or None without PSI support
+        try:
+            with open(PRESSURE_PATH) as pressure_file:
+                for line in pressure_file:
+                    if line.startswith("some"):
+                        fields = dict(field.split("=") for field in line.split()[1:])
+                        return float(fields["avg10"])
+        except (OSError, KeyError, ValueError):
+            pass
+
+        return None
+
+    @staticmethod
+    def get_pressure_total():
+        # Microseconds some tasks were stalled on memory since boot
+        try:
+            with open(PRESSURE_PATH) as pressure_file:
+                for line in pressure_file:
+                    if line.startswith("some"):
+                        fields = dict(field.split("=") for field in line.split()[1:])
+                        return int(fields["total"])
+        except (OSError, KeyError, ValueError):
+            pass
+
+        return None
+
+    @staticmethod
+    def measure_pressure(seconds):
+        # The share of the next few seconds some tasks are stalled on memory,
+        # in the same percent as avg10 but without its lag
+        started_at = time.monotonic()
+        total_before = Hibernator.get_pressure_total()
+
+        time.sleep(seconds)
+
+        total_after = Hibernator.get_pressure_total()
+
+        if total_before == None or total_after == None:
+            return None
+
+        return (total_after - total_before) / ((time.monotonic() - started_at) * 1e6) * 100
+
+    def start(self):
+        self.running = True
+        self.configure()
+
+    def configure(self):
+        # Follow the configuration, which may have been reloaded with or
+        # without hibernation
+        if not self.running:
+            return
+
+        enabled = self.controller.config.get("hibernation") != None
+
+        if enabled and self.thread == None:
+            logger.info("Starting memory pressure monitor")
+
+            self.stopped = threading.Event()
+            self.thread = threading.Thread(target=self.__monitor, args=(self.stopped,), name="hibernator", daemon=True)
+            self.thread.start()
+        elif not enabled and self.thread != None:
+            logger.info("Stopping memory pressure monitor")
+
+            self.stopped.set()
+            self.thread = None
+
+    def stop(self):
+        self.running = False
+
+        self.stopped.set()
+        self.thread = None
+
+    def hibernate(self, workspace, grace=DEFAULT_GRACE):
+        logger.info(f"Hibernating workspace {workspace.name}")
+
+        # Frozen applications can't handle being closed
+        self.controller.freezer.thaw(workspace)
+
+        # Every application is asked to close at once, and only killed if
+        # it's still running once it had time to save its state
+        apps = [app for window in workspace.windows for app in window.applications]
+
+        run_batch([app.plan_close() for app in apps if app.client_id])
+        Hibernator.await_exit([app for app in apps if app.client_id], grace)
+
+        for window in workspace.windows:
+            for app in window.applications:
+                app.stop(close=False)
+
+                app.client_id = None
+                app.needs_relaunch = True
+
+            # The compositor destroys the window's workspace with its last
+            # client
+            self.controller.unregister_window(window)
+            window.needs_reopen = True
+
+        workspace.hibernated = True
+        self.hibernations = self.hibernations + 1
+
+        self.controller.mark_changed(workspace)
+        self.controller.bus.publish("workspace_hibernated", workspace=workspace.name)
+
+    @staticmethod
+    def await_exit(apps, seconds):
+        started_at = time.monotonic()
+
+        while time.monotonic() - started_at < seconds:
+            if not any(app.process != None and is_running(app.process) for app in apps):
+                return True
+
+            time.sleep(0.1)
+
+        return False
+
+    def wake(self, workspace):
+        logger.info(f"Waking workspace {workspace.name} from hibernation")
+
+        workspace.hibernated = False
+
+        for window in workspace.windows:
+            window.relaunch()
+
+        self.controller.mark_changed(workspace)
+        self.controller.bus.publish("workspace_woken", workspace=workspace.name)
+
+    def get_workspace_rss(self, workspace):
+        rss = 0
+
+        for window in workspace.windows:
+            for app in window.applications:
+                if app.process == None:
+                    continue
+
+                try:
+                    parent = psutil.Process(app.process.pid)
+
+                    for process in [parent] + parent.children(recursive=True):
+                        rss = rss + process.memory_info().rss
+                except psutil.Error:
+                    pass
+
+        return rss
+
+    def show_stats(self):
+        return {
+            "enabled": "hibernation" in self.controller.config,
+            "pressure": self.last_pressure,
+            "hibernations": self.hibernations,
+            "hibernated": [ws.name for ws in self.controller.workspaces if ws.hibernated],
+        }
+
+    """
+    """
+
+    def __monitor(self, stopped):
+        while not stopped.wait(self.__get_interval()):
+            try:
+                self.__check(stopped)
+            except Exception:
+                logger.exception("Error checking memory pressure")
+
+    def __get_interval(self):
+        policy = self.controller.config.get("hibernation") or {}
+
+        return policy.get("interval", DEFAULT_INTERVAL)
+
+    def __check(self, stopped):
+        pressure = Hibernator.get_pressure()
+
+        while not stopped.is_set():
+            with self.controller.lock:
+                policy = self.controller.config.get("hibernation")
+
+                # The configuration may have been reloaded without it
+                if policy == None:
+                    return
+
+                self.last_pressure = pressure
+                workspace = self.__get_victim(policy, pressure)
+
+                if workspace == None:
+                    return
+
+                logger.info(f"Memory is short, pressure {pressure}, hibernating {workspace.name}")
+                self.hibernate(workspace, grace=policy.get("grace", DEFAULT_GRACE))
+
+            # Measured without the controller, which commands need meanwhile
+            pressure = Hibernator.measure_pressure(SETTLE_TIME)
+
+    def __get_victim(self, policy, pressure):
+        # The workspace to hibernate next, if memory is short
+        over_pressure = (
+            "pressure" in policy
+            and pressure != None
+            and pressure >= policy["pressure"]
+        )
+
+        candidates = self.__get_candidates(policy)
+
+        if len(candidates) == 0:
+            return None
+
+        over_rss = False
+
+        if "rss_mb" in policy and not over_pressure:
+            total_rss = sum(self.get_workspace_rss(ws) for ws in self.controller.workspaces)
+            over_rss = total_rss >= policy["rss_mb"] * 1024 * 1024
+
+        if over_pressure or over_rss:
+            return candidates[0]
+
+        return None
+
+    def __get_candidates(self, policy):
+        # Least recently used first, and workspaces which were never used
+        # before any which were
+        recent = self.controller.history.ordered("workspaces")
+
+        workspaces = [
+            ws for ws in self.controller.workspaces if ws not in recent
+        ] + list(reversed(recent))
+
+        return [
+            ws for ws in workspaces
+            if ws != self.controller.current_workspace
+            and not ws.hibernated
+            and ws in self.controller.workspaces
+            and ws.template not in policy.get("exempt", [])
+        ]
@@ -0,0 +1,91 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+"""
+    Bounded most-recently-used history of workspaces, windows and
+    applications. Each kind is an ordered ring with the most recently used
+    item last, so recording a use and finding the previous item are both
+    O(1).
+"""
+
+MAX_HISTORY = 32
+
+# Consecutive cycle requests within this many seconds continue walking the
+# same snapshot of the history, like holding alt while pressing tab
+CYCLE_TIMEOUT = 1.5
+
+KINDS = ["workspaces", "windows", "applications"]
+
+
+class History:
+    def __init__(self, max_len=MAX_HISTORY):
+        self.max_len = max_len
+        self.rings = {kind: OrderedDict() for kind in KINDS}
+
+        self.cycle_order = None
+        self.cycle_pos = 0
+        self.cycle_at = 0
+
+        # Events from the compositor are recorded from the listener thread
+        self.lock = threading.Lock()
+
+    def record(self, kind, item):
+        with self.lock:
+            ring = self.rings[kind]
+
+            if item in ring:
+                ring.move_to_end(item)
+            else:
+                ring[item] = True
+
+                if len(ring) > self.max_len:
+                    ring.popitem(last=False)
+
+    def remove(self, kind, item):
+        with self.lock:
+            self.rings[kind].pop(item, None)
+
+    def current(self, kind):
+        with self.lock:
+            ring = self.rings[kind]
+
+            return next(reversed(ring)) if len(ring) > 0 else None
+
+    def previous(self, kind, current=None):
+        # The most recently used item other than the current one
+        with self.lock:
+            for item in reversed(self.rings[kind]):
+                if item is not current:
+                    return item
+
+        return None
+
+    def ordered(self, kind):
+        with self.lock:
+            return list(reversed(self.rings[kind]))
+
+    def cycle(self, kind):
+        now = time.monotonic()
+
+        if (
+            self.cycle_order is None
+            or self.cycle_order[0] != kind
+            or now - self.cycle_at > CYCLE_TIMEOUT
+        ):
+            self.cycle_order = (kind, self.ordered(kind))
+            self.cycle_pos = 0
+
+        self.cycle_at = now
+
+        items = self.cycle_order[1]
+
+        if len(items) < 2:
+            return None
+
+        self.cycle_pos = (self.cycle_pos + 1) % len(items)
+
+        return items[self.cycle_pos]
@@ -0,0 +1,113 @@
+import logging
+import statistics
+
+logger = logging.getLogger(__name__)
+
+"""
+    Learned startup profiles of applications, keyed by executable. Every
+    launch records how long the application took to open its first window,
+    how many windows it opened and when the last of them appeared. Once an
+    executable has enough samples, waiting for its windows can stop as soon
+    as it has behaved as it usually does, rather than after a fixed delay.
+"""
+
+MAX_SAMPLES = 20
+MIN_SAMPLES = 3
+
+# Launches which take longer than OUTLIER_FACTOR times the usual settle time
+# plus OUTLIER_SLACK seconds stop trusting the profile
+OUTLIER_FACTOR = 2.0
+OUTLIER_SLACK = 0.5
+
+MIN_POLL_TIME = 0.02
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+
+    return ordered[idx]
+
+
+class StartupProfiles:
+    def __init__(self, saved=None):
+        # Executable -> list of samples, oldest first
+        self.samples = saved if saved else {}
+        self.expectations = {}
+
+    def record(self, exec, first_window, last_window, windows, window_class=None):
+        samples = self.samples.setdefault(exec, [])
+
+        samples.append({
+            "first_window": first_window,
+            "last_window": last_window,
+            "windows": windows,
+            "window_class": window_class,
+        })
+
+        del samples[:-MAX_SAMPLES]
+
+        # Derived expectations are recomputed lazily
+        self.expectations.pop(exec, None)
+
+        logger.debug(
+            f"Recorded startup of {exec}: first window {first_window}, last window {last_window}, {windows} windows"
+        )
+
+    def get(self, exec):
+        # The expected behaviour of an executable, or None if it hasn't been
+        # launched often enough to know
+        if exec in self.expectations:
+            return self.expectations[exec]
+
+        samples = [
+            sample for sample in self.samples.get(exec, []) if sample["first_window"] is not None
+        ]
+
+        if len(samples) < MIN_SAMPLES:
+            return None
+
+        window_counts = [sample["windows"] for sample in samples]
+        settle_time = percentile([sample["last_window"] for sample in samples], 0.9)
+        first_window = statistics.median(sample["first_window"] for sample in samples)
+
+        expectation = {
+            # The most common number of windows, preferring more on ties
+            "windows": max(set(window_counts), key=lambda count: (window_counts.count(count), count)),
+            "settle_time": settle_time,
+            "deadline": settle_time * OUTLIER_FACTOR + OUTLIER_SLACK,
+            "poll_time": max(MIN_POLL_TIME, first_window / 10),
+        }
+
+        self.expectations[exec] = expectation
+
+        return expectation
+
+    def get_window_class(self, exec):
+        # The class of the last window the executable opened, which is known
+        # after a single launch
+        for sample in reversed(self.samples.get(exec, [])):
+            if sample.get("window_class") != None:
+                return sample["window_class"]
+
+        return None
+
+    def show(self):
+        return self.samples
+
+    def show_summary(self):
+        summary = {}
+
+        for exec, samples in self.samples.items():
+            opened = [sample for sample in samples if sample["first_window"] is not None]
+
+            summary[exec] = {
+                "launches": len(samples),
+                "first_window_median": statistics.median(s["first_window"] for s in opened) if opened else None,
+                "stability_median": statistics.median(s["last_window"] - s["first_window"] for s in opened) if opened else None,
+                "windows_max": max(s["windows"] for s in samples),
+                "window_class": self.get_window_class(exec),
+                "expectation": self.get(exec),
+            }
+
+        return summary
@@ -0,0 +1,283 @@
+import logging
+import os
+import select
+import subprocess
+import threading
+
+from panmuphled.display.common import run_batch, run_queries, is_running
+from panmuphled.display.events import parse_address
+
+logger = logging.getLogger(__name__)
+
+"""
+    Keeps the tree in sync with the compositor as clients are closed,
+    moved or opened behind the daemon's back, and as applications exit.
+    Compositor events and process exits are handled as they happen, and a
+    cheap periodic check against a single query catches anything they
+    missed. Every correction counts as drift, so it's visible how often the
+    tree was wrong.
+
+    Process exits are watched through pidfds where the kernel supports
+    them, otherwise the periodic check notices them.
+"""
+
+CHECK_INTERVAL = 30.0
+
+DRIFT_KINDS = ["closed", "moved", "opened", "exited"]
+
+
+class Reconciler:
+    def __init__(self, controller):
+        self.controller = controller
+
+        # Kind of correction -> how often the tree had to be corrected
+        self.drift = {kind: 0 for kind in DRIFT_KINDS}
+        self.checks = 0
+
+        # pidfd -> (application, pid)
+        self.pidfds = {}
+        self.poller = select.poll()
+        self.wakeup_r, self.wakeup_w = os.pipe()
+        self.poller.register(self.wakeup_r, select.POLLIN)
+
+        self.watch_lock = threading.Lock()
+        self.stopped = threading.Event()
+
+        self.watch_thread = None
+        self.check_thread = None
+
+    def start(self):
+        logger.info("Starting reconciler")
+
+        for app in self.controller.get_applications(all_apps=True):
+            self.watch_process(app)
+
+        self.watch_thread = threading.Thread(target=self.__watch, name="process-watcher", daemon=True)
+        self.watch_thread.start()
+
+        self.check_thread = threading.Thread(target=self.__check_periodically, name="reconciler", daemon=True)
+        self.check_thread.start()
+
+    def stop(self):
+        logger.info("Stopping reconciler")
+
+        self.stopped.set()
+        os.write(self.wakeup_w, b"\0")
+
+    def watch_process(self, app):
+        if app.process == None or not hasattr(os, "pidfd_open"):
+            return
+
+        pid = app.process.pid
+
+        try:
+            pidfd = os.pidfd_open(pid)
+        except OSError:
+            # Already gone, the next check will notice
+            return
+
+        with self.watch_lock:
+            if (app, pid) in self.pidfds.values():
+                os.close(pidfd)
+                return
+
+            self.pidfds[pidfd] = (app, pid)
+            self.poller.register(pidfd, select.POLLIN)
+
+        # Wake the watcher so it polls the new pidfd too
+        os.write(self.wakeup_w, b"\0")
+
+    def show_stats(self):
+        return {
+            "drift": dict(self.drift, total=sum(self.drift.values())),
+            "checks": self.checks,
+            "watched_processes": len(self.pidfds),
+        }
+
+    """
+        Compositor event handlers
+    """
+
+    def on_close_window(self, data):
+        addr = parse_address(data)
+
+        with self.controller.lock:
+            app = self.controller.search_index.get_application(addr)
+
+            if app == None or app.client_id != addr:
+                return
+
+            self.__client_closed(app, self.__query_clients())
+
+    def on_move_window(self, data):
+        addr, ws_id, ws_name = data.split(",", 2)
+
+        with self.controller.lock:
+            app = self.controller.search_index.get_application(parse_address(addr))
+
+            if app == None:
+                return
+
+            self.__client_moved(app, int(ws_id))
+
+    def on_open_window(self, data):
+        addr, ws_name, wm_class, title = data.split(",", 3)
+
+        with self.controller.lock:
+            # Only applications which lost their client can claim a new one,
+            # launches find their own
+            orphans = [
+                app for app in self.controller.get_applications(all_apps=True)
+                if app.client_id == None and app.process != None
+            ]
+
+            if len(orphans) == 0:
+                return
+
+            clients_by_addr = self.__query_clients()
+
+            if clients_by_addr == None or parse_address(addr) not in clients_by_addr:
+                return
+
+            client = clients_by_addr[parse_address(addr)]
+
+            for app in orphans:
+                if app.owns_client(client):
+                    self.__client_opened(app, client)
+                    break
+
+    """
+    """
+
+    def __client_closed(self, app, clients_by_addr):
+        logger.info(f"Client {app.client_id} of application {app.name} was closed")
+        self.__count("closed")
+
+        # Applications can have several clients, keep following another one
+        # if there is one
+        others = [
+            client for client in (clients_by_addr or {}).values()
+            if client["address"] != app.client_id and app.owns_client(client)
+        ]
+
+        if len(others) > 0:
+            app.attach_client(others[0]["address"], title=others[0].get("title"))
+        else:
+            app.forget()
+
+    def __client_moved(self, app, ws_id):
+        if ws_id == app.window.window_id:
+            return
+
+        logger.info(f"Client {app.client_id} of application {app.name} was moved to workspace {ws_id}")
+        self.__count("moved")
+
+        window = self.controller.windows_by_id.get(ws_id)
+
+        if window == None:
+            logger.info(f"Workspace {ws_id} isn't managed, leaving application {app.name} in window {app.window.name}")
+            return
+
+        if not app.move_to(window):
+            logger.info(f"Window {window.name} already has an application {app.name}, moving it back")
+            run_batch([app.plan_move_to_window()])
+
+    def __client_opened(self, app, client):
+        logger.info(f"Application {app.name} opened client {client['address']}")
+        self.__count("opened")
+
+        app.attach_client(client["address"], title=client.get("title"))
+
+        if client["workspace"]["id"] != app.window.window_id:
+            run_batch([app.plan_move_to_window()])
+
+    def __process_exited(self, app, clients_by_addr):
+        logger.info(f"Process {app.process.pid} of application {app.name} exited")
+
+        # Launchers often exit once they've handed over to the real
+        # application, which is fine as long as its client lives on
+        if app.client_id != None and clients_by_addr != None and app.client_id in clients_by_addr:
+            return
+
+        self.__count("exited")
+        app.forget()
+
+    def __is_managed(self, app):
+        return app.window.workspace in self.controller.workspaces and app in app.window.applications
+
+    def __count(self, kind):
+        self.drift[kind] = self.drift[kind] + 1
+
+    def __query_clients(self):
+        snapshot = run_queries(["clients"])
+
+        if snapshot == None:
+            return None
+
+        return { c_data['address']: c_data for c_data in snapshot[0] }
+
+    """
+        Process exit watcher
+    """
+
+    def __watch(self):
+        while not self.stopped.is_set():
+            for fd, event in self.poller.poll():
+                if fd == self.wakeup_r:
+                    os.read(self.wakeup_r, 64)
+                    continue
+
+                with self.watch_lock:
+                    app, pid = self.pidfds.pop(fd)
+                    self.poller.unregister(fd)
+
+                os.close(fd)
+
+                try:
+                    self.__on_process_exit(app, pid)
+                except Exception:
+                    logger.exception(f"Error handling exit of process {pid}")
+
+    def __on_process_exit(self, app, pid):
+        with self.controller.lock:
+            # The application may have been stopped or relaunched since
+            if app.process == None or app.process.pid != pid or not self.__is_managed(app):
+                return
+
+            # Reap our own children
+            if isinstance(app.process, subprocess.Popen):
+                app.process.poll()
+
+            self.__process_exited(app, self.__query_clients())
+
+    """
+        Periodic consistency check
+    """
+
+    def __check_periodically(self):
+        while not self.stopped.wait(CHECK_INTERVAL):
+            try:
+                with self.controller.lock:
+                    self.__check()
+            except Exception:
+                logger.exception("Error checking consistency with compositor")
+
+    def __check(self):
+        clients_by_addr = self.__query_clients()
+
+        if clients_by_addr == None:
+            logger.warning("Unable to query compositor, skipping consistency check")
+            return
+
+        self.checks = self.checks + 1
+
+        for app in self.controller.get_applications(all_apps=True):
+            if app.client_id != None and app.client_id not in clients_by_addr:
+                self.__client_closed(app, clients_by_addr)
+            elif app.client_id != None:
+                self.__client_moved(app, clients_by_addr[app.client_id]["workspace"]["id"])
+
+            if self.__is_managed(app) and app.process != None and not is_running(app.process):
+                self.__process_exited(app, clients_by_addr)
+
+        self.controller.scratchpads.check(clients_by_addr)
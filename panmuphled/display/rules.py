@@ -0,0 +1,71 @@
+import logging
+import re
+import threading
+
+logger = logging.getLogger(__name__)
+
+"""
+    Window rules which only apply while applications are launching. Rules
+    are keyed by the window class the launched application is expected to
+    open, rather than matching every window, so unrelated windows which
+    open during a launch keep their focus.
+
+    Rules are reference counted, since several launches can expect the same
+    class at once. A rule is only installed by the first launch which needs
+    it and only removed by the last, so overlapping launches never remove
+    each other's rules. Nothing is sent to the compositor here, callers get
+    the commands back so they can batch them with their own.
+"""
+
+LAUNCH_RULES = ["noinitialfocus"]
+
+
+def class_match(window_class):
+    return f"class:^({re.escape(window_class)})$"
+
+
+class LaunchRules:
+    def __init__(self):
+        # Window rule match -> number of launches holding it
+        self.holders = {}
+
+        self.lock = threading.Lock()
+
+    def acquire(self, matches):
+        commands = []
+
+        with self.lock:
+            for match in matches:
+                count = self.holders.get(match, 0)
+
+                if count == 0:
+                    commands = commands + [
+                        ["keyword", "windowrulev2", f"{rule},{match}"] for rule in LAUNCH_RULES
+                    ]
+
+                self.holders[match] = count + 1
+
+        return commands
+
+    def release(self, matches):
+        commands = []
+
+        with self.lock:
+            for match in matches:
+                count = self.holders.get(match, 0)
+
+                if count == 0:
+                    logger.warning(f"Released launch rule {match} which was not held")
+                    continue
+
+                if count == 1:
+                    del self.holders[match]
+                    commands.append(["keyword", "windowrulev2", f"unset,{match}"])
+                else:
+                    self.holders[match] = count - 1
+
+        return commands
+
+    def show(self):
+        with self.lock:
+            return dict(self.holders)
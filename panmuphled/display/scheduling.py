@@ -0,0 +1,156 @@
+import logging
+
+import psutil
+
+logger = logging.getLogger(__name__)
+
+"""
+    CPU and I/O priorities for the process trees of applications, depending
+    on whether their workspace is the active one. Policies are set for the
+    whole configuration and may be overridden by templates, like
+
+        "scheduling": {
+            "active":     {"nice": 0, "ionice": "best-effort", "ionice_level": 0},
+            "background": {"nice": 10, "ionice": "idle", "affinity": [0, 1]}
+        }
+
+    Anything left out of a policy is left alone. Lowering the nice value of
+    a process, which boosting a workspace that was in the background does,
+    needs CAP_SYS_NICE or a high enough RLIMIT_NICE.
+"""
+
+STATES = ["active", "background"]
+
+IONICE_CLASSES = {
+    "none": psutil.IOPRIO_CLASS_NONE,
+    "realtime": psutil.IOPRIO_CLASS_RT,
+    "best-effort": psutil.IOPRIO_CLASS_BE,
+    "idle": psutil.IOPRIO_CLASS_IDLE,
+}
+
+
+class Scheduler:
+    def __init__(self, controller):
+        self.controller = controller
+
+        self.adjusted = 0
+        self.failures = 0
+
+    @staticmethod
+    def validate(scheduling):
+        if type(scheduling) != dict:
+            logger.error(f"'scheduling' element incorrect type. Expecting type dict, got: {type(scheduling)}")
+            return False
+
+        for state, policy in scheduling.items():
+            if state not in STATES:
+                logger.error(f"Unknown scheduling state '{state}', expecting one of {STATES}")
+                return False
+
+            if type(policy) != dict:
+                logger.error(f"{state} scheduling incorrect type. Expecting type dict, got: {type(policy)}")
+                return False
+
+            if "nice" in policy and (type(policy["nice"]) != int or not -20 <= policy["nice"] <= 19):
+                logger.error(f"'nice' of {state} scheduling must be an integer between -20 and 19")
+                return False
+
+            if "ionice" in policy and policy["ionice"] not in IONICE_CLASSES:
+                logger.error(f"'ionice' of {state} scheduling must be one of {list(IONICE_CLASSES)}")
+                return False
+
+            if "ionice_level" in policy and (type(policy["ionice_level"]) != int or not 0 <= policy["ionice_level"] <= 7):
+                logger.error(f"'ionice_level' of {state} scheduling must be an integer between 0 and 7")
+                return False
+
+            if "affinity" in policy and (
+                type(policy["affinity"]) != list or not all(type(cpu) == int for cpu in policy["affinity"])
+            ):
+                logger.error(f"'affinity' of {state} scheduling must be a list of CPU numbers")
+                return False
+
+        return True
+
+    def get_policy(self, workspace):
+        state = "active" if workspace == self.controller.current_workspace else "background"
+
+        policy = dict(self.controller.config.get("scheduling", {}).get(state, {}))
+
+        if workspace.scheduling:
+            policy.update(workspace.scheduling.get(state, {}))
+
+        # Coming back from the background shouldn't leave processes pinned,
+        # an empty affinity means every CPU
+        if state == "active" and "affinity" not in policy:
+            other = dict(self.controller.config.get("scheduling", {}).get("background", {}))
+
+            if workspace.scheduling:
+                other.update(workspace.scheduling.get("background", {}))
+
+            if "affinity" in other:
+                policy["affinity"] = []
+
+        return policy
+
+    def apply(self, workspaces):
+        # Adjust every process of the given workspaces in a single pass
+        for workspace in workspaces:
+            policy = self.get_policy(workspace)
+
+            if len(policy) == 0:
+                continue
+
+            logger.debug("Applying scheduling %s to workspace %s", policy, workspace.name)
+
+            for window in workspace.windows:
+                for app in window.applications:
+                    self.__apply_policy(app, policy)
+
+    def apply_application(self, app):
+        policy = self.get_policy(app.window.workspace)
+
+        if len(policy) != 0:
+            self.__apply_policy(app, policy)
+
+    def show_stats(self):
+        return {
+            "adjusted": self.adjusted,
+            "failures": self.failures,
+        }
+
+    """
+    """
+
+    def __apply_policy(self, app, policy):
+        if app.process == None:
+            return
+
+        try:
+            parent = psutil.Process(app.process.pid)
+            processes = [parent] + parent.children(recursive=True)
+        except psutil.Error:
+            return
+
+        for process in processes:
+            try:
+                if "nice" in policy:
+                    process.nice(policy["nice"])
+
+                if "ionice" in policy:
+                    ioclass = IONICE_CLASSES[policy["ionice"]]
+
+                    # Only best-effort and realtime have levels
+                    if ioclass in (psutil.IOPRIO_CLASS_BE, psutil.IOPRIO_CLASS_RT):
+                        process.ionice(ioclass, policy.get("ionice_level", 4))
+                    else:
+                        process.ionice(ioclass)
+
+                if "affinity" in policy:
+                    process.cpu_affinity(policy["affinity"])
+
+                self.adjusted = self.adjusted + 1
+            except psutil.NoSuchProcess:
+                pass
+            except (psutil.AccessDenied, ValueError) as e:
+                self.failures = self.failures + 1
+                logger.warning(f"Unable to adjust scheduling of process {process.pid} of application {app.name}: {e}")
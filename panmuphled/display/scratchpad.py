@@ -0,0 +1,336 @@
+import logging
+import shlex
+import subprocess
+import time
+
+import psutil
+
+from panmuphled.display.application import BASE_WAIT_TIME, MAX_WAIT_TIME
+from panmuphled.display.common import run_batch, run_queries, get_remaining_time, deadline_expired, is_running
+from panmuphled.display.events import parse_address
+
+logger = logging.getLogger(__name__)
+
+"""
+    Scratchpads are applications which are kept running in Hyprland
+    special workspaces, outside of any workspace of the daemon, and shown
+    or hidden with a single dispatch. They're declared in the
+    configuration like
+
+        "scratchpads": [
+            {"name": "term", "exec": "kitty --class dropterm", "class": "dropterm"},
+            {"name": "music", "exec": "spotify"}
+        ]
+
+    where the optional 'class' lets the window be recognized without
+    asking the compositor. A scratchpad is launched the first time it's
+    toggled, and again whenever it was closed. The compositor shows special
+    workspaces on the focused monitor, so a scratchpad follows the focus.
+"""
+
+# Stands in for the window name in the state directory
+SCRATCHPAD_WINDOW = "scratchpad"
+
+
+class Scratchpad:
+    def __init__(self, controller, sp_def):
+        self.controller = controller
+
+        self.name = sp_def["name"]
+        self.exec = sp_def["exec"]
+        self.window_class = sp_def.get("class")
+
+        self.process = None
+        self.client_id = None
+
+        # Whether to show the client once its window opens
+        self.show_when_opened = False
+        # Monitor the special workspace is shown on
+        self.visible_on = None
+
+        self.launches = 0
+
+    def toggle(self):
+        if self.client_id != None:
+            rc, stdout = run_batch([["dispatch", "togglespecialworkspace", self.name]])
+            return rc
+
+        if self.is_launching():
+            self.show_when_opened = not self.show_when_opened
+            return 0
+
+        return self.launch(show=True)
+
+    def launch(self, show=False):
+        logger.info(f"Launching scratchpad {self.name}")
+
+        file_manager = self.controller.file_manager
+        file_manager.remove_application_subdir(SCRATCHPAD_WINDOW, self.name)
+
+        subdir, stdout_log_path, stderr_log_path = file_manager.create_application_subdir(
+            SCRATCHPAD_WINDOW, self.name
+        )
+
+        with open(stdout_log_path, "wb") as stdout_log, open(stderr_log_path, "wb") as stderr_log:
+            self.process = subprocess.Popen(shlex.split(self.exec), stdout=stdout_log, stderr=stderr_log)
+
+        file_manager.save_application_pid(subdir, self.process.pid)
+
+        self.client_id = None
+        self.show_when_opened = show
+        self.launches = self.launches + 1
+
+        # The window is claimed when the compositor reports it opening,
+        # without events it has to be waited for
+        if not self.controller.events.running:
+            return self.__await_client()
+
+        return 0
+
+    def adopt(self):
+        # Take back the process and client left in the special workspace
+        # by a previous run of the daemon
+        app_subdir, process = self.controller.take_orphan(SCRATCHPAD_WINDOW, self.name)
+
+        if process == None:
+            return False
+
+        self.process = process
+        clients = [client for client in self.controller.get_orphan_clients() if self.owns(client)]
+
+        # Without a client it's still launching as far as the scratchpad is
+        # concerned, and claims the next one it opens
+        if len(clients) == 0:
+            logger.info(f"Adopting process {process.pid} of scratchpad {self.name}, which has no client yet")
+            return True
+
+        logger.info(f"Adopting process {process.pid} and client {clients[0]['address']} of scratchpad {self.name}")
+
+        self.client_id = clients[0]["address"]
+
+        return True
+
+    def is_launching(self):
+        return self.client_id == None and self.process != None and is_running(self.process)
+
+    def owns(self, client):
+        if self.window_class != None and client.get("class") == self.window_class:
+            return True
+
+        if self.process == None:
+            return False
+
+        if client.get("pid") == self.process.pid:
+            return True
+
+        try:
+            return self.process.pid in [parent.pid for parent in psutil.Process(client["pid"]).parents()]
+        except (psutil.Error, KeyError):
+            return False
+
+    def claim(self, client_id):
+        logger.info(f"Scratchpad {self.name} opened client {client_id}")
+
+        self.client_id = client_id
+
+        commands = [["dispatch", "movetoworkspacesilent", f"special:{self.name},address:{client_id}"]]
+
+        if self.show_when_opened:
+            commands.append(["dispatch", "togglespecialworkspace", self.name])
+
+        self.show_when_opened = False
+
+        rc, stdout = run_batch(commands)
+
+        return rc
+
+    def forget(self):
+        # The client was closed, the next toggle launches it again
+        logger.info(f"Scratchpad {self.name} lost its client {self.client_id}")
+
+        self.client_id = None
+        self.visible_on = None
+
+        if self.process != None and not is_running(self.process):
+            self.process = None
+            self.controller.file_manager.remove_application_subdir(SCRATCHPAD_WINDOW, self.name)
+
+    def stop(self):
+        logger.info(f"Stopping scratchpad {self.name}")
+
+        commands = []
+
+        if self.client_id != None:
+            commands.append(["dispatch", "closewindow", f"address:{self.client_id}"])
+
+        run_batch(commands)
+
+        if self.process != None:
+            try:
+                parent = psutil.Process(self.process.pid)
+
+                for process in parent.children(recursive=True) + [parent]:
+                    process.kill()
+            except psutil.Error:
+                pass
+
+            # Reaps our own child
+            is_running(self.process)
+
+        self.process = None
+        self.client_id = None
+
+        self.controller.file_manager.remove_application_subdir(SCRATCHPAD_WINDOW, self.name)
+
+    def show(self):
+        return {
+            "name": self.name,
+            "exec": self.exec,
+            "class": self.window_class,
+            "pid": self.process.pid if self.process else None,
+            "client_id": self.client_id,
+            "visible_on": self.visible_on,
+            "launches": self.launches,
+        }
+
+    """
+    """
+
+    def __await_client(self):
+        started_at = time.monotonic()
+
+        while time.monotonic() - started_at < MAX_WAIT_TIME:
+            remaining = get_remaining_time()
+
+            if remaining != None and (remaining <= BASE_WAIT_TIME or deadline_expired()):
+                break
+
+            time.sleep(BASE_WAIT_TIME)
+
+            snapshot = run_queries(["clients"])
+
+            for client in (snapshot[0] if snapshot else []):
+                if self.owns(client):
+                    return self.claim(client["address"])
+
+            if not is_running(self.process):
+                break
+
+        logger.warning(f"Scratchpad {self.name} didn't open a window")
+
+        return 1
+
+
+class Scratchpads:
+    def __init__(self, controller):
+        self.controller = controller
+
+        # Name -> scratchpad
+        self.scratchpads = {}
+
+    @staticmethod
+    def validate(sp_defs):
+        if type(sp_defs) != list:
+            logger.error(f"'scratchpads' element incorrect type. Expecting type list, got: {type(sp_defs)}")
+            return False
+
+        names = set()
+
+        for sp_def in sp_defs:
+            if type(sp_def) != dict or type(sp_def.get("name")) != str or type(sp_def.get("exec")) != str:
+                logger.error("Scratchpad definitions must contain a 'name' and an 'exec'")
+                return False
+
+            if sp_def["name"] in names:
+                logger.error(f"Collision of scratchpads named {sp_def['name']}")
+                return False
+
+            if "class" in sp_def and type(sp_def["class"]) != str:
+                logger.error(f"'class' of scratchpad {sp_def['name']} must be a string")
+                return False
+
+            names.add(sp_def["name"])
+
+        return True
+
+    def configure(self, sp_defs):
+        # Follow changes of the configuration, scratchpads which were
+        # dropped are stopped, and changes apply from the next launch
+        names = [sp_def["name"] for sp_def in sp_defs]
+
+        for name in [name for name in self.scratchpads if name not in names]:
+            self.scratchpads.pop(name).stop()
+
+        for sp_def in sp_defs:
+            scratchpad = self.scratchpads.get(sp_def["name"])
+
+            if scratchpad == None:
+                self.scratchpads[sp_def["name"]] = Scratchpad(self.controller, sp_def)
+            else:
+                scratchpad.exec = sp_def["exec"]
+                scratchpad.window_class = sp_def.get("class")
+
+    def get(self, name):
+        return self.scratchpads.get(name)
+
+    def check(self, clients_by_addr):
+        # Called with a fresh snapshot of the compositor's clients
+        for scratchpad in self.scratchpads.values():
+            if scratchpad.client_id != None and scratchpad.client_id not in clients_by_addr:
+                scratchpad.forget()
+
+    def adopt(self):
+        for scratchpad in self.scratchpads.values():
+            scratchpad.adopt()
+
+    def stop(self):
+        for scratchpad in self.scratchpads.values():
+            scratchpad.stop()
+
+    def show(self):
+        return [scratchpad.show() for scratchpad in self.scratchpads.values()]
+
+    """
+        Compositor event handlers
+    """
+
+    def on_open_window(self, data):
+        addr, ws_name, wm_class, title = data.split(",", 3)
+
+        with self.controller.lock:
+            launching = [sp for sp in self.scratchpads.values() if sp.is_launching()]
+
+            if len(launching) == 0:
+                return
+
+            client = {"address": parse_address(addr), "class": wm_class}
+
+            # Only ask the compositor which process opened the window when
+            # the class doesn't tell
+            if not any(sp.window_class == wm_class for sp in launching):
+                snapshot = run_queries(["clients"])
+                clients_by_addr = { c_data['address']: c_data for c_data in (snapshot[0] if snapshot else []) }
+
+                client = clients_by_addr.get(client["address"], client)
+
+            for scratchpad in launching:
+                if scratchpad.owns(client):
+                    scratchpad.claim(client["address"])
+                    return
+
+    def on_close_window(self, data):
+        addr = parse_address(data)
+
+        with self.controller.lock:
+            for scratchpad in self.scratchpads.values():
+                if scratchpad.client_id == addr:
+                    scratchpad.forget()
+
+    def on_active_special(self, data):
+        ws_name, mon_name = data.split(",", 1)
+
+        for scratchpad in self.scratchpads.values():
+            if ws_name == f"special:{scratchpad.name}":
+                scratchpad.visible_on = mon_name
+            elif scratchpad.visible_on == mon_name:
+                scratchpad.visible_on = None
@@ -0,0 +1,126 @@
+import heapq
+import logging
+import os
+import time
+
+from panmuphled.display.common import fuzzy_score
+
+logger = logging.getLogger(__name__)
+
+"""
+    Search index over the managed applications. Each application is indexed
+    by its name, executable, window, workspace and the live title of its
+    client. Entries are updated as applications start, stop and retitle
+    themselves, so a query never has to walk the controller tree or ask the
+    compositor anything.
+"""
+
+DEFAULT_RESULT_LIMIT = 10
+
+# Recently used applications get a bonus which halves every RECENCY_HALF_LIFE
+# seconds
+RECENCY_BONUS = 50
+RECENCY_HALF_LIFE = 10 * 60
+
+
+class SearchIndex:
+    def __init__(self):
+        # Application -> lowercased search fields
+        self.documents = {}
+        # Application -> set of characters in its fields, for cheap filtering
+        self.charsets = {}
+
+        self.by_client = {}
+        self.clients = {}
+        self.titles = {}
+        self.last_used = {}
+
+    def update(self, app, title=None):
+        if title is not None and app.client_id:
+            self.titles[app.client_id] = title
+
+        old_client = self.clients.get(app)
+
+        if old_client is not None and old_client != app.client_id:
+            self.by_client.pop(old_client, None)
+
+        if app.client_id:
+            self.by_client[app.client_id] = app
+
+        self.clients[app] = app.client_id
+
+        fields = [
+            app.name,
+            os.path.basename(app.exec.split()[0]) if app.exec else "",
+            app.window.name,
+            app.window.workspace.name,
+            self.titles.get(app.client_id, ""),
+        ]
+        fields = [field.lower() for field in fields if field]
+
+        self.documents[app] = fields
+        self.charsets[app] = set("".join(fields))
+
+    def remove(self, app):
+        self.documents.pop(app, None)
+        self.charsets.pop(app, None)
+        self.last_used.pop(app, None)
+        self.clients.pop(app, None)
+
+        if app.client_id and self.by_client.get(app.client_id) is app:
+            del self.by_client[app.client_id]
+            self.titles.pop(app.client_id, None)
+
+    def set_title(self, client_id, title):
+        # Titles are only kept for managed clients
+        if client_id in self.by_client:
+            self.update(self.by_client[client_id], title=title)
+
+    def seed_titles(self, clients_data):
+        for cl_data in clients_data:
+            self.set_title(cl_data["address"], cl_data.get("title", ""))
+
+    def touch(self, app):
+        self.last_used[app] = time.monotonic()
+
+    def get_application(self, client_id):
+        return self.by_client.get(client_id)
+
+    def search(self, query, limit=DEFAULT_RESULT_LIMIT):
+        tokens = query.lower().split()
+        now = time.monotonic()
+        results = []
+
+        for app, fields in self.documents.items():
+            charset = self.charsets[app]
+            total = 0
+
+            for token in tokens:
+                if not charset.issuperset(token):
+                    total = None
+                    break
+
+                best = None
+
+                for field in fields:
+                    score = fuzzy_score(token, field)
+
+                    if score is not None and (best is None or score > best):
+                        best = score
+
+                if best is None:
+                    total = None
+                    break
+
+                total = total + best
+
+            if total is None:
+                continue
+
+            if app in self.last_used:
+                age = now - self.last_used[app]
+                total = total + RECENCY_BONUS * 0.5 ** (age / RECENCY_HALF_LIFE)
+
+            results.append((total, app))
+
+        return heapq.nsmallest(limit, results, key=lambda res: -res[0])
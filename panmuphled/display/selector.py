@@ -10,7 +10,10 @@ RC_BAD = 1
 class Selector:
     @staticmethod
     def select_from_list(lst):
-        stdin_str = "\n".join(lst)
+        return Selector.select_from_input("\n".join(lst))
+
+    @staticmethod
+    def select_from_input(stdin_str):
         rc, stdout = run_command(["/usr/bin/rofi", "-p", ">>>", "-dmenu"], input=stdin_str)
 
         if rc != RC_OK:
@@ -23,57 +26,87 @@ class Selector:
     
     @staticmethod
     def select_workspace(ctlr):
-        rc = RC_OK
-        workspaces = ctlr.get_workspaces()
-        ws_table = {}
-
-        for ws in workspaces:
-            ws_table[ws.name] = ws
-
-        rc, sel_ws = Selector.select_from_list(list(ws_table.keys()))
+        # Candidates are kept pre-rendered in frecency order
+        rc, sel_ws = Selector.select_from_input(ctlr.frecency.render("workspaces"))
 
         if rc != RC_OK:
             logger.warning(f"Selection failed with RC: {rc}")
             return [rc, None]
 
-        if sel_ws not in ws_table:
+        ws = ctlr.get_workspace(sel_ws)
+
+        if ws == None:
             logger.warning(f"Selected workspace not found: '{sel_ws}'")
             return [rc, None]
         
-        return [rc, ws_table[sel_ws]]
+        return [rc, ws]
 
     @staticmethod
     def select_window(ctlr, ws_name=None, all_win=False):
         rc = RC_OK
-        windows = ctlr.get_windows(ws_name=ws_name, all_win=all_win)
-        wn_table = {}
 
-        for wn in windows:
-            wn_table[wn.name] = wn
+        if all_win:
+            windows = ctlr.get_windows(all_win=True)
+            stdin_str = "\n".join(
+                ctlr.frecency.rank_names("windows", [wn.name for wn in windows])
+            )
+        else:
+            if ws_name == None:
+                ws_name = ctlr.current_workspace.name
 
-        rc, sel_wn = Selector.select_from_list(list(wn_table.keys()))
+            stdin_str = ctlr.frecency.render("windows", scope=ws_name)
+
+        rc, sel_wn = Selector.select_from_input(stdin_str)
 
         if rc != RC_OK:
             logger.warning(f"Selection failed with RC: {rc}")
             return [rc, None]
 
-        if sel_wn not in wn_table:
-            logger.warning(f"Selected window not found: '{sel_ws}'")
+        wn = ctlr.get_window(sel_wn)
+
+        if wn == None:
+            logger.warning(f"Selected window not found: '{sel_wn}'")
             return [rc, None]
         
-        return [rc, wn_table[sel_wn]]
+        return [rc, wn]
+
+    @staticmethod
+    def select_template(ctlr):
+        rc, sel_tmpl = Selector.select_from_input(ctlr.frecency.render("templates"))
+
+        if rc != RC_OK:
+            logger.warning(f"Selection failed with RC: {rc}")
+            return [rc, None]
+
+        ws_templates = ctlr.get_workspace_templates()
+
+        if sel_tmpl not in ws_templates:
+            logger.warning(f"Selected workspace template not found: '{sel_tmpl}'")
+            return [rc, None]
+
+        return [rc, ws_templates[sel_tmpl]]
     
     @staticmethod
-    def select_application():
-        rc, stdout = run_command(["/usr/bin/rofi", "-p", ">>>", "-show", "drun", "-run-command", '"echo {cmd}"'])
+    def select_application(ctlr):
+        # Launchable applications come from the daemon's catalog, ordered by
+        # how recently and frequently they were launched
+        stdin_str = ctlr.catalog.render(
+            scores=ctlr.frecency.scores["executables"],
+            generation=ctlr.frecency.generations["executables"],
+        )
+
+        rc, sel_app = Selector.select_from_input(stdin_str)
 
         if rc != RC_OK:
             logger.warning(f"Error with selecting application, return code: {rc}")
             return (rc, None)
 
-        sel = stdout.strip("\n")
+        entry = ctlr.catalog.get_entry(sel_app)
 
-        return (RC_OK, sel)
+        if entry == None:
+            logger.warning(f"Selected application not found: '{sel_app}'")
+
+        return (RC_OK, entry)
 
     @staticmethod
     def enter_text():
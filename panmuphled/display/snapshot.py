@@ -0,0 +1,128 @@
+import logging
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+"""
+    Versioned snapshots of the controller tree. Every change to the tree
+    bumps the version and marks the workspace it happened in. Snapshots are
+    cached and only the subtrees of marked workspaces are rebuilt, so
+    repeated requests for an unchanged tree cost nothing. Cached subtrees
+    are never modified once built, they are replaced, so they can be handed
+    out and serialized without copying.
+
+    Clients which already hold a snapshot can ask for only what changed
+    since its version. Versions start from the time the daemon started, in
+    microseconds, so a version handed out before a restart is never taken
+    for one of this run.
+"""
+
+MAX_REMOVALS = 256
+
+
+class Snapshots:
+    def __init__(self, controller):
+        self.controller = controller
+
+        self.version = time.time_ns() // 1000
+
+        # Workspace -> (version it last changed at, cached subtree)
+        self.subtrees = {}
+        self.dirty = set()
+
+        # Version at which the list of workspaces or the current workspace
+        # last changed
+        self.root_version = self.version
+
+        self.removed = deque()
+        # Deltas can't be computed for versions older than this, since the
+        # removals needed for them have been discarded
+        self.floor = self.version
+
+        self.tree = None
+
+        self.lock = threading.Lock()
+
+    def mark_changed(self, workspace=None):
+        # A change with no workspace is a change to the root of the tree
+        with self.lock:
+            self.version = self.version + 1
+
+            if workspace is None:
+                self.root_version = self.version
+            else:
+                self.dirty.add(workspace)
+
+            self.tree = None
+
+    def mark_removed(self, workspace):
+        with self.lock:
+            self.version = self.version + 1
+            self.root_version = self.version
+
+            self.subtrees.pop(workspace, None)
+            self.dirty.discard(workspace)
+
+            self.removed.append((self.version, workspace.name))
+
+            if len(self.removed) > MAX_REMOVALS:
+                self.floor, _ = self.removed.popleft()
+
+            self.tree = None
+
+    def get(self):
+        with self.lock:
+            if self.tree is None:
+                self.__rebuild()
+
+            return self.tree
+
+    def since(self, version):
+        with self.lock:
+            if self.tree is None:
+                self.__rebuild()
+
+            if version == self.version:
+                return {"version": self.version, "changed": False}
+
+            # Versions this run never handed out, from before a restart
+            if version < self.floor or version > self.version:
+                return dict(self.tree, changed=True, full=True)
+
+            workspaces = self.controller.get_workspaces()
+
+            return {
+                "version": self.version,
+                "changed": True,
+                "full": False,
+                "current_workspace": self.tree["current_workspace"],
+                "workspace_order": [ws.name for ws in workspaces]
+                if self.root_version > version
+                else None,
+                "workspaces": [
+                    self.subtrees[ws][1]
+                    for ws in workspaces
+                    if self.subtrees[ws][0] > version
+                ],
+                "removed": [name for removed_at, name in self.removed if removed_at > version],
+            }
+
+    """
+    """
+
+    def __rebuild(self):
+        workspaces = self.controller.get_workspaces()
+
+        for ws in workspaces:
+            if ws in self.dirty or ws not in self.subtrees:
+                self.subtrees[ws] = (self.version, ws.show())
+
+        self.dirty = set()
+
+        self.tree = {
+            "version": self.version,
+            "current_workspace": self.controller.current_workspace.name,
+            "workspaces": [self.subtrees[ws][1] for ws in workspaces],
+        }
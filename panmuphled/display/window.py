@@ -2,7 +2,7 @@ import logging
 import json
 
 from panmuphled.display.application import Application
-from panmuphled.display.common import run_command
+from panmuphled.display.common import run_command, run_batch, HYPRCTL_PATH
 
 logger = logging.getLogger(__name__)
 
@@ -13,12 +13,14 @@ class Window:
         self.name = name
 
         self.preferred_screen_alias = win_def["preferred_screen"] if "preferred_screen" in win_def else None
+        self.preferred_screen_id = None
 
         self.displayed_default = win_def["displayed_default"] if "displayed_default" in win_def else None
 
         self.workspace = workspace
 
         self.window_id = win_def["window_id"] if "window_id" in win_def else None
+        self.needs_reopen = False
 
         self.applications = [
             Application(None, self, app_def) for app_def in win_def["applications"]
@@ -54,30 +56,43 @@ class Window:
         logger.info(f"Starting window {self.name}")
         # Open this window on a screen
 
-        if self.preferred_screen_alias:
-            self.preferred_screen_id = self.workspace.controller.get_screen_id(self.preferred_screen_alias)
-            screen = self.preferred_screen_id
-        else:
-            self.preferred_screen_id = None
-            screen = self.workspace.default_screen_id
+        self.resolve_screens()
 
-        existing_id = self.__get_window_id_by_name(self.name)
+        self.window_id, existed = self.workspace.controller.workspace_ids.reserve(self.name)
 
-        if existing_id:
-            logger.info(f"Window with name {self.name} already existed. Cleaning it.")
-            self.__clean_window(existing_id)
-
-            self.window_id = existing_id
+        if existed:
+            logger.info(f"Window with name {self.name} already existed, cleaning it once its applications are started.")
         else:
             logger.info(f"Window with name {self.name} does not yet exist, creating it")
 
-            self.window_id = self.__open_window(self.name)
+            self.__open_window(self.window_id, self.name)
 
         logger.info(f"Window ID: {self.window_id}")
 
-        # Start each application in this desktop
-        for application in self.applications:
-            rc = application.start()
+        self.workspace.controller.register_window(self)
+        self.workspace.controller.mark_changed(self.workspace)
+
+        # Install the launch rules of every application at once, so they
+        # stay in place while the applications start one after another
+        launch_matches = [application.launch_match() for application in self.applications]
+
+        commands = self.workspace.controller.launch_rules.acquire(launch_matches)
+
+        try:
+            run_batch(commands)
+
+            # Start each application in this desktop, those of a cancelled job
+            # drop out of the list
+            for application in list(self.applications):
+                rc = application.start()
+        finally:
+            run_batch(self.workspace.controller.launch_rules.release(launch_matches))
+
+        # Clients left behind by a previous session. Once applications were
+        # adopted the session outlived the daemon, and whatever else is open
+        # here was opened by the user.
+        if existed and not any(application.adopted for application in self.applications):
+            self.__clean_window(self.window_id)
 
         return rc
 
@@ -87,21 +102,103 @@ class Window:
         for application in self.applications:
             application.stop()
 
+        self.workspace.controller.unregister_window(self)
+
         self.__close_window()
 
     def restore(self):
         logger.info(f"Restoring Window {self.name}")
 
-        if self.preferred_screen_alias:
-            self.preferred_screen_id = self.workspace.controller.get_screen_id(self.preferred_screen_alias)
-        else:
-            self.preferred_screen_id = None
+        self.resolve_screens()
+
+        if self.window_id != None:
+            self.workspace.controller.register_window(self)
 
         for app in self.applications:
             app.restore()
 
+    def reconcile(self, clients_by_addr, workspaces_by_id):
+        # Check a restored window and its applications against the
+        # compositor, returning the commands which fix whatever drifted
+        ws_data = workspaces_by_id.get(self.window_id)
+
+        if ws_data == None or ws_data["name"] != self.name:
+            # Compositor workspaces are destroyed with their last client, so
+            # every client in this window is gone, only applications without
+            # one may have survived
+            logger.info(f"Window {self.name} no longer exists, marking it for reopening")
+            self.needs_reopen = True
+
+            for app in self.applications:
+                app.reconcile({})
+
+            # Its id may belong to another workspace by now
+            self.workspace.controller.unregister_window(self)
+
+            return []
+
+        commands = []
+
+        for app in self.applications:
+            commands = commands + app.reconcile(clients_by_addr)
+
+        return commands
+
+    def relaunch(self):
+        # Bring back whatever was marked as gone while reconciling
+        if self.needs_reopen:
+            self.needs_reopen = False
+
+            self.window_id, existed = self.workspace.controller.workspace_ids.reserve(self.name)
+
+            if not existed:
+                self.__open_window(self.window_id, self.name)
+
+            logger.info(f"Reopened window {self.name} with ID {self.window_id}")
+
+            self.workspace.controller.register_window(self)
+
+        dead = [app for app in self.applications if app.needs_relaunch]
+
+        if len(dead) == 0:
+            return 0
+
+        launch_matches = [app.launch_match() for app in dead]
+        rc = 0
+
+        commands = self.workspace.controller.launch_rules.acquire(launch_matches)
+
+        try:
+            run_batch(commands)
+
+            for app in dead:
+                rc = app.relaunch()
+        finally:
+            run_batch(self.workspace.controller.launch_rules.release(launch_matches))
+
+        self.workspace.controller.mark_changed(self.workspace)
+
+        return rc
+
+    def resolve_screens(self):
+        # Falls back to another screen if the preferred one isn't connected
+        if self.preferred_screen_alias:
+            self.preferred_screen_id = self.workspace.controller.resolve_screen_id(self.preferred_screen_alias)
+        else:
+            self.preferred_screen_id = None
+
     def activate(self, screen_id=None, prev=None):
         logger.info(f"Activating window {self.name}")
+
+        rc, stdout = run_batch(self.plan_activate(screen_id=screen_id, prev=prev))
+
+        return rc
+
+    def plan_activate(self, screen_id=None, prev=None):
+        # The compositor commands which activate this window, so that callers
+        # can combine them with others into a single batch
+        plan = []
+
         if screen_id == None:
             logger.debug(f"No screen specified when activating window {self.name}")
             if prev == None:
@@ -109,23 +206,28 @@ class Window:
                     f"No previous window specified when activating window {self.name}"
                 )
                 # Just activate this desktop at its current location
-                rc = self.__activate_window(self.window_id)
+                plan.append(["dispatch", "workspace", f"{self.window_id}"])
             else:
                 logger.debug(
                     f"Previous window was {prev.name} when activating window {self.name}"
                 )
                 # Swap this desktop with the previous one based on the previous location
-                rc = self.__activate_window(self.window_id)
+                plan.append(["dispatch", "workspace", f"{self.window_id}"])
         else:
             logger.debug(
                 f"Screen {screen_id} was specified when activating window {self.name}"
             )
-            rc = self.__move_window_to_screen(self.window_id, screen_id)
+            plan.append(["dispatch", "moveworkspacetomonitor", f"{self.window_id}", f"{screen_id}"])
+            plan.append(["dispatch", "workspace", f"{self.window_id}"])
 
-            rc = self.__activate_window(self.window_id)
+        # The compositor destroys empty workspaces once they lose focus, and
+        # recreates them by id alone, so the name is given back every time
+        plan.append(["dispatch", "renameworkspace", f"{self.window_id} {self.name}"])
 
         for application in self.applications:
-            application.activate()
+            plan = plan + application.plan_activate()
+
+        return plan
 
     """
     """
@@ -169,14 +271,14 @@ class Window:
         return self.preferred_screen_id
 
     def is_displayed_default(self):
-        return self.is_displayed_default
+        return self.displayed_default
 
 
     """
     """
 
     def __get_window_ids(self):
-        rc, stdout = run_command(["/usr/bin/hyprctl", "workspaces", "-j"])
+        rc, stdout = run_command([HYPRCTL_PATH, "workspaces", "-j"])
 
         if rc != 0:
             pass    # TODO: handle error
@@ -185,79 +287,23 @@ class Window:
 
         return list(map(lambda w_data: w_data['id'], windows_data))
 
-    def __get_window_id_by_name(self, name):
-        rc, stdout = run_command(["/usr/bin/hyprctl", "workspaces", "-j"])
-
-        if rc != 0:
-            pass    # TODO: handle error
-        
-        windows_data = json.loads(stdout)
-
-        windows_data = [ w_data for w_data in windows_data if w_data['name'] == name]
-
-        if len(windows_data) != 0:
-            return windows_data[0]['id']
-        else:
-            return None
-
-    def __open_window(self, name):
-        rc, stdout = run_command([
-            "/usr/bin/hyprctl",
-            "workspaces",
-            "-j"
-        ])
-        workspace_data = json.loads(stdout)
-
-        next_id = 0
-
-        for ws_data in workspace_data:
-            ws_id = ws_data['id']
-
-            if ws_id >= next_id:
-                next_id = ws_id + 1
-
-        rc, stdout = run_command([
-            "/usr/bin/hyprctl",
-            "dispatch",
-            "workspace",
-            f"{next_id}"
-        ])
-
-        # Rename workspace
-        rc, stdout = run_command([
-            "/usr/bin/hyprctl",
-            "dispatch",
-            "renameworkspace",
-            f"{next_id} {name}"
+    def __open_window(self, window_id, name):
+        # The id was reserved beforehand, so the compositor doesn't need to
+        # be asked which ids are taken
+        rc, stdout = run_batch([
+            ["dispatch", "workspace", f"{window_id}"],
+            ["dispatch", "renameworkspace", f"{window_id} {name}"],
         ])
 
-        return next_id
+        if rc != 0:
+            logger.warning(f"Failed to open window {name} with ID {window_id}")
 
     def __close_window(self):
         pass
 
-    def __activate_window(self, window_id):
-        rc, stdout = run_command([
-            "/usr/bin/hyprctl",
-            "dispatch",
-            "workspace",
-            f"{window_id}"
-        ])
-
-    def __move_window_to_screen(self, window_id, screen_id):
-        rc, stdout = run_command([
-            "/usr/bin/hyprctl",
-            "dispatch",
-            "moveworkspacetomonitor",
-            f"{window_id}",
-            f"{screen_id}"
-        ])
-
-        return rc
-    
     def __get_focused_window_id(self):
         rc, stdout = run_command([
-            "/usr/bin/hyprctl",
+            HYPRCTL_PATH,
             "activeworkspace",
             "-j"
         ])
@@ -267,7 +313,7 @@ class Window:
     
     def __get_active_window_ids(self):
         rc, stdout = run_command([
-            "/usr/bin/hyprctl",
+            HYPRCTL_PATH,
             "monitors",
             "-j"
         ])
@@ -281,7 +327,7 @@ class Window:
     
     def __get_displayed_screen_id(self, window_id):
         rc, stdout = run_command([
-            "/usr/bin/hyprctl",
+            HYPRCTL_PATH,
             "monitors",
             "-j"
         ])
@@ -295,19 +341,21 @@ class Window:
     
     def __clean_window(self, ws_id):
         rc, stdout = run_command([
-            "/usr/bin/hyprctl",
+            HYPRCTL_PATH,
             "clients",
             "-j"
         ])
         client_data = json.loads(stdout)
 
+        # Every client of the applications just started stays open
         client_data = [ cl_data for cl_data in client_data if
-            cl_data["workspace"]["id"] == ws_id ]
+            cl_data["workspace"]["id"] == ws_id and
+            not any(application.owns_client(cl_data) for application in self.applications) ]
 
         for cl_data in client_data:
             client_addr = cl_data['address']
             rc, stdout = run_command([
-                "/usr/bin/hyprctl",
+                HYPRCTL_PATH,
                 "dispatch",
                 "closewindow",
-                f"address:{client_data}"])
\ No newline at end of file
+                f"address:{client_addr}"])
\ No newline at end of file
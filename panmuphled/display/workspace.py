@@ -1,8 +1,10 @@
 import logging
 import json
 
+from panmuphled.display.freezer import Freezer
+from panmuphled.display.scheduling import Scheduler
 from panmuphled.display.window import Window
-from panmuphled.display.common import run_command
+from panmuphled.display.common import run_command, run_batch
 
 logger = logging.getLogger(__name__)
 
@@ -15,8 +17,14 @@ class Workspace:
 
     def __init__(self, name, controller, ws_def):
         self.name = name
+        self.template = ws_def['template'] if 'template' in ws_def else ws_def['name']
 
         self.default_screen_alias = ws_def['default_screen'] if 'default_screen' in ws_def else None
+        self.default_screen_id = None
+
+        self.freeze_policy = ws_def['freeze'] if 'freeze' in ws_def else None
+        self.scheduling = ws_def['scheduling'] if 'scheduling' in ws_def else None
+        self.hibernated = ws_def['hibernated'] if 'hibernated' in ws_def else False
 
         self.controller = controller
         self.windows = [
@@ -46,6 +54,12 @@ class Workspace:
             )
             return False
 
+        if "freeze" in ws_def and not Freezer.validate(ws_def["freeze"]):
+            return False
+
+        if "scheduling" in ws_def and not Scheduler.validate(ws_def["scheduling"]):
+            return False
+
         default_display = {}
 
         for win_def in ws_def["windows"]:
@@ -78,10 +92,7 @@ class Workspace:
         logger.info(f"Starting workspace {self.name}")
         rc = 0
 
-        if self.default_screen_alias:
-            self.default_screen_id = self.controller.get_screen_id(self.default_screen_alias)
-        else:
-            self.default_screen_id = None
+        self.resolve_screens()
 
         # Start each window
         for window in self.windows:
@@ -97,6 +108,8 @@ class Workspace:
         logger.info(f"Stopping Workspace {self.name}")
         rc = 0
 
+        self.controller.freezer.thaw(self)
+
         for window in self.windows:
             rc = window.stop()
 
@@ -108,11 +121,27 @@ class Workspace:
     def restore(self):
         logger.info(f"Restoring Workspace {self.name}")
 
+        self.resolve_screens()
+
         for window in self.windows:
             rc = window.restore()
 
         return rc
 
+    """
+        Resolve the screens of this workspace and its windows against the
+        currently connected screens
+    """
+
+    def resolve_screens(self):
+        if self.default_screen_alias:
+            self.default_screen_id = self.controller.resolve_screen_id(self.default_screen_alias)
+        else:
+            self.default_screen_id = None
+
+        for window in self.windows:
+            window.resolve_screens()
+
     """
         Make each window in this workspace
         active
@@ -120,11 +149,25 @@ class Workspace:
 
     def activate(self, prev=None):
         logger.info(f"Activating workspace {self.name}")
-        
+
+        # Thaw before switching, so the applications paint straight away
+        self.controller.freezer.thaw(self)
+
+        rc, stdout = run_batch(self.plan_activate(prev=prev))
+
+        return rc
+
+    def plan_activate(self, prev=None):
+        # Every compositor command needed to activate this workspace, run by
+        # the caller as a single batch
+        plan = []
+
         # Set transition direction to vertical
-        self.__set_transition_direction_vertical()
+        plan.append(self.__transition_direction_command("slidevert"))
+
+        displayed = self.controller.get_displayed_window_ids() if prev else {}
         
-        for screen in self.controller.screens:
+        for screen in self.controller.get_connected_screens():
             screen_id = screen["id"]
             next_window = self.get_window_for_screen(screen_id)
 
@@ -141,19 +184,20 @@ class Workspace:
 
             prev_window = None
 
-            if prev:
-                prev_window = prev.get_window_at_screen(screen_id)
+            if prev and screen_id in displayed:
+                prev_window = prev.get_window_by_id(displayed[screen_id])
 
             logger.info(
                 f"Previous window for screen {screen_id} was {prev_window.name if prev_window else None}"
             )
 
             logger.debug(f"Activating window {next_window.name if next_window else None} on screen {screen_id}")
-            next_window.activate(prev=prev_window, screen_id=screen_id)
+            plan = plan + next_window.plan_activate(prev=prev_window, screen_id=screen_id)
         
         # Set transition direction to horizontal
-        self.__set_transition_direction_horizontal()
+        plan.append(self.__transition_direction_command("slide"))
 
+        return plan
 
     """
         Switch to a window in this workspace
@@ -168,7 +212,12 @@ class Workspace:
     def show(self):
         return {
             'name': self.name,
+            'template': self.template,
             'default_screen': self.default_screen_alias,
+            'freeze': self.freeze_policy,
+            'scheduling': self.scheduling,
+            'frozen': self.controller.freezer.is_frozen(self),
+            'hibernated': self.hibernated,
             'windows': [ wn.show() for wn in self.windows ]
         }
 
@@ -186,6 +235,13 @@ class Workspace:
 
         return None
 
+    def get_window_by_id(self, window_id):
+        for window in self.windows:
+            if window.window_id == window_id:
+                return window
+
+        return None
+
     def get_window_for_screen(self, screen_id):
         next_window = None
 
@@ -203,28 +259,14 @@ class Workspace:
         return next_window
 
     def get_focused_window(self):
-        for wn in self.windows:
-            if wn.is_focused():
-                return wn
-        
-        return None
+        wn = self.controller.get_focused_window()
 
-    def __set_transition_direction_vertical(self):
-        curveName = "myBezier"
+        if wn in self.windows:
+            return wn
 
-        rc, stdout = run_command([
-            "/usr/bin/hyprctl",
-            "keyword",
-            "animation",
-            f"workspaces,1,8,{curveName},slidevert"
-        ])
+        return None
 
-    def __set_transition_direction_horizontal(self):
+    def __transition_direction_command(self, style):
         curveName = "myBezier"
 
-        rc, stdout = run_command([
-            "/usr/bin/hyprctl",
-            "keyword",
-            "animation",
-            f"workspaces,1,8,{curveName},slide"
-        ])
\ No newline at end of file
+        return ["keyword", "animation", f"workspaces,1,8,{curveName},{style}"]
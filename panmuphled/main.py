@@ -4,6 +4,7 @@ import logging
 import sys
 import subprocess
 
+from panmuphled.server.logs import Logs, LEVEL_NAMES, DEFAULT_LEVEL
 from panmuphled.server.server import Server, RC_OK, RC_RESTART
 
 logger = logging.getLogger(__name__)
@@ -23,15 +24,24 @@ def main():
         help="Path to log file",
         default="/tmp/panmuphled.log"
     )
+    parser.add_argument(
+        "--log-level",
+        type=str,
+        help="Level of records written to the log file",
+        choices=LEVEL_NAMES,
+        default=DEFAULT_LEVEL
+    )
 
     args = parser.parse_args()
 
-    logging.basicConfig(level=logging.DEBUG, filename=args.log_file)
+    Logs.setup(args.log_file, level=args.log_level)
 
     server = Server(args.config)
 
     rc = server.start()
 
+    Logs.stop()
+
     if rc == RC_RESTART:
         restarted_process = subprocess.Popen([sys.executable] + sys.argv)
 
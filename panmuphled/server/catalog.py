@@ -0,0 +1,363 @@
+import heapq
+import logging
+import os
+import shlex
+import threading
+from bisect import bisect_left
+from itertools import chain
+
+from watchdog.observers import Observer
+from watchdog.events import FileSystemEventHandler
+
+from panmuphled.display.common import fuzzy_score
+
+logger = logging.getLogger(__name__)
+
+"""
+    Index of launchable applications: desktop entries and executables on
+    $PATH. The index is built once at startup, then each directory is only
+    rescanned after inotify reports a change to it.
+"""
+
+DEFAULT_SEARCH_LIMIT = 20
+
+# Desktop entry field codes which are substituted by launchers
+DESKTOP_FIELD_CODES = ["%f", "%F", "%u", "%U", "%d", "%D", "%n", "%N", "%i", "%c", "%k", "%v", "%m"]
+
+
+class ApplicationCatalog:
+    def __init__(self):
+        self.path_dirs = ApplicationCatalog.get_path_dirs()
+        self.desktop_dirs = ApplicationCatalog.get_desktop_dirs()
+
+        # Per directory scan results, so a change only rescans one directory
+        self.dir_entries = {}
+        self.dirty_dirs = set()
+
+        self.executables = {}
+        self.entries = {}
+
+        self.sorted_keys = []
+        self.rendered = None
+        self.rendered_generation = None
+
+        self.lock = threading.Lock()
+
+        event_handler = CatalogChangeHandler(self.invalidate)
+        self.observer = Observer()
+
+        for dir_path in self.path_dirs + self.desktop_dirs:
+            if os.path.isdir(dir_path):
+                self.observer.schedule(event_handler, path=dir_path, recursive=False)
+
+    @staticmethod
+    def get_path_dirs():
+        dirs = []
+
+        for dir_path in os.environ.get("PATH", "").split(os.pathsep):
+            if dir_path and dir_path not in dirs:
+                dirs.append(dir_path)
+
+        return dirs
+
+    @staticmethod
+    def get_desktop_dirs():
+        data_home = os.environ.get(
+            "XDG_DATA_HOME", os.path.join(os.path.expanduser("~"), ".local", "share")
+        )
+        data_dirs = os.environ.get("XDG_DATA_DIRS", "/usr/local/share:/usr/share")
+
+        dirs = []
+
+        for data_dir in [data_home] + data_dirs.split(":"):
+            if not data_dir:
+                continue
+
+            app_dir = os.path.join(data_dir, "applications")
+
+            if app_dir not in dirs:
+                dirs.append(app_dir)
+
+        return dirs
+
+    def start(self):
+        logger.info("Building application catalog")
+
+        with self.lock:
+            for dir_path in self.path_dirs + self.desktop_dirs:
+                self.__scan_dir(dir_path)
+
+            self.__rebuild_index()
+
+        logger.info(
+            f"Application catalog contains {len(self.entries)} entries and {len(self.executables)} executables"
+        )
+
+        self.observer.start()
+
+    def stop(self):
+        logger.info("Stopping application catalog watcher")
+        self.observer.stop()
+
+    def invalidate(self, dir_path):
+        if dir_path not in self.dir_entries:
+            return
+
+        with self.lock:
+            self.dirty_dirs.add(dir_path)
+
+    """
+        Queries
+    """
+
+    def which(self, name):
+        # Resolve a command to an absolute path without walking $PATH
+        if os.path.isabs(name):
+            return name
+
+        self.__refresh()
+
+        return self.executables.get(name)
+
+    def resolve_exec(self, cmd):
+        # Resolve the program of a command line, keeping its arguments
+        try:
+            args = shlex.split(cmd)
+        except ValueError:
+            logger.warning(f"Unable to parse command line '{cmd}'")
+            return None
+
+        if len(args) == 0:
+            return None
+
+        prog = self.which(args[0])
+
+        if prog == None:
+            return None
+
+        return shlex.join([prog] + args[1:])
+
+    def get_entry(self, name):
+        self.__refresh()
+
+        return self.entries.get(name)
+
+    def search(self, query, limit=DEFAULT_SEARCH_LIMIT, scores=None):
+        self.__refresh()
+
+        entries = self.entries
+        sorted_keys = self.sorted_keys
+        scores = scores if scores is not None else {}
+
+        query = query.lower() if query else ""
+
+        def rank(res):
+            return (-res[0], -scores.get(entries[res[1]]["exec"], float("-inf")), res[1])
+
+        def prefix_matches():
+            # Straight from the sorted index
+            idx = bisect_left(sorted_keys, (query, ""))
+
+            while idx < len(sorted_keys) and sorted_keys[idx][0].startswith(query):
+                name = sorted_keys[idx][1]
+                yield (fuzzy_score(query, name), name)
+                idx = idx + 1
+
+        # Only the best matches are kept, rather than sorting every one of
+        # them, which with an empty query is every entry
+        results = heapq.nsmallest(limit, prefix_matches(), key=rank)
+
+        # Fall back to fuzzy matching if there aren't enough prefix matches,
+        # in which case every prefix match is among the results
+        if len(results) < limit:
+            matched = {name for _, name in results}
+
+            fuzzy_matches = (
+                (score, name) for score, name in
+                ((fuzzy_score(query, name), name) for name in entries if name not in matched)
+                if score is not None
+            )
+
+            results = heapq.nsmallest(limit, chain(results, fuzzy_matches), key=rank)
+
+        return [entries[name] for _, name in results]
+
+    def render(self, scores=None, generation=None):
+        # Pre-rendered selector input, ordered by launch frecency. Only
+        # re-sorted when the index or the frecency scores changed.
+        self.__refresh()
+
+        if self.rendered is None or generation != self.rendered_generation:
+            scores = scores if scores is not None else {}
+
+            names = sorted(
+                self.entries,
+                key=lambda name: (
+                    -scores.get(self.entries[name]["exec"], float("-inf")),
+                    name.lower(),
+                ),
+            )
+
+            self.rendered = "\n".join(names)
+            self.rendered_generation = generation
+
+        return self.rendered
+
+    """
+    """
+
+    def __refresh(self):
+        with self.lock:
+            if len(self.dirty_dirs) == 0:
+                return
+
+            for dir_path in self.dirty_dirs:
+                logger.debug(f"Rescanning invalidated directory {dir_path}")
+                self.__scan_dir(dir_path)
+
+            self.dirty_dirs = set()
+
+            self.__rebuild_index()
+
+    def __scan_dir(self, dir_path):
+        if dir_path in self.desktop_dirs:
+            self.dir_entries[dir_path] = ApplicationCatalog.scan_desktop_dir(dir_path)
+        else:
+            self.dir_entries[dir_path] = ApplicationCatalog.scan_path_dir(dir_path)
+
+    def __rebuild_index(self):
+        executables = {}
+        desktop_entries = {}
+
+        # Earlier directories take precedence, as they do when searching $PATH
+        for dir_path in self.path_dirs:
+            for name, path in self.dir_entries.get(dir_path, {}).items():
+                executables.setdefault(name, path)
+
+        for dir_path in self.desktop_dirs:
+            for desktop_id, entry in self.dir_entries.get(dir_path, {}).items():
+                desktop_entries.setdefault(desktop_id, entry)
+
+        entries = {}
+
+        for name, path in executables.items():
+            entries[name] = {"name": name, "exec": path, "source": "path"}
+
+        for entry in desktop_entries.values():
+            if entry is None:
+                continue
+
+            entries[entry["name"]] = {
+                "name": entry["name"],
+                "exec": ApplicationCatalog.resolve_with(executables, entry["exec"]),
+                "source": "desktop",
+            }
+
+        self.executables = executables
+        self.entries = entries
+        self.sorted_keys = sorted((name.lower(), name) for name in entries)
+        self.rendered = None
+
+    @staticmethod
+    def resolve_with(executables, cmd):
+        try:
+            args = shlex.split(cmd)
+        except ValueError:
+            return cmd
+
+        if len(args) == 0 or os.path.isabs(args[0]) or args[0] not in executables:
+            return cmd
+
+        return shlex.join([executables[args[0]]] + args[1:])
+
+    @staticmethod
+    def scan_path_dir(dir_path):
+        executables = {}
+
+        try:
+            with os.scandir(dir_path) as it:
+                for dir_entry in it:
+                    try:
+                        if dir_entry.is_file() and os.access(dir_entry.path, os.X_OK):
+                            executables[dir_entry.name] = dir_entry.path
+                    except OSError:
+                        continue
+        except (FileNotFoundError, NotADirectoryError, PermissionError):
+            pass
+
+        return executables
+
+    @staticmethod
+    def scan_desktop_dir(dir_path):
+        entries = {}
+
+        try:
+            with os.scandir(dir_path) as it:
+                for dir_entry in it:
+                    if not dir_entry.name.endswith(".desktop"):
+                        continue
+
+                    # Hidden entries are kept so they shadow lower precedence
+                    # directories
+                    entries[dir_entry.name] = ApplicationCatalog.parse_desktop_entry(
+                        dir_entry.path
+                    )
+        except (FileNotFoundError, NotADirectoryError, PermissionError):
+            pass
+
+        return entries
+
+    @staticmethod
+    def parse_desktop_entry(path):
+        fields = {}
+        in_entry = False
+
+        try:
+            with open(path, "r", errors="replace") as desktop_file:
+                for line in desktop_file:
+                    line = line.strip()
+
+                    if line.startswith("["):
+                        in_entry = line == "[Desktop Entry]"
+                        continue
+
+                    if not in_entry or "=" not in line or line.startswith("#"):
+                        continue
+
+                    key, value = line.split("=", 1)
+                    fields.setdefault(key.strip(), value.strip())
+        except OSError:
+            logger.warning(f"Unable to read desktop entry {path}")
+            return None
+
+        if fields.get("Type", "Application") != "Application":
+            return None
+
+        if fields.get("NoDisplay") == "true" or fields.get("Hidden") == "true":
+            return None
+
+        if "Name" not in fields or "Exec" not in fields:
+            return None
+
+        cmd = fields["Exec"]
+
+        for code in DESKTOP_FIELD_CODES:
+            cmd = cmd.replace(code, "")
+
+        return {"name": fields["Name"], "exec": " ".join(cmd.split())}
+
+
+class CatalogChangeHandler(FileSystemEventHandler):
+    def __init__(self, invalidate_callback):
+        self.invalidate_callback = invalidate_callback
+
+    def on_any_event(self, event):
+        if event.event_type in ["opened", "closed", "closed_no_write"]:
+            return
+
+        self.invalidate_callback(os.path.dirname(event.src_path))
+
+        dest_path = getattr(event, "dest_path", None)
+
+        if dest_path:
+            self.invalidate_callback(os.path.dirname(dest_path))
@@ -3,6 +3,7 @@ import os
 import shutil
 import signal
 import psutil
+import threading
 import time 
 import json
 
@@ -13,6 +14,24 @@ logger = logging.getLogger(__name__)
 
 DEFAULT_STATE_PATH = "/tmp/panmuphled"
 
+# Files in the state directory which outlive a restart of the daemon
+FRECENCY_FILE = "frecency.json"
+PROFILES_FILE = "profiles.json"
+PROFILING_DIR = "profiling"
+STALLS_DIR = "stalls"
+# The tree as it last changed, for a daemon which didn't get to save its
+# state to adopt the applications of every workspace it had open
+TREE_FILE = "tree.json"
+PERSISTENT_FILES = [FRECENCY_FILE, PROFILES_FILE, PROFILING_DIR, STALLS_DIR, TREE_FILE]
+
+# Seconds the start time of a process may differ from the one in its
+# pidfile, which has a resolution of a clock tick
+PID_TIME_TOLERANCE = 0.1
+
+# Seconds between writes of state which changes with every switch, like
+# frecency, rather than writing it from the commands themselves
+FLUSH_INTERVAL = 5.0
+
 
 class FileManager:
     def __init__(self, controller):
@@ -23,24 +42,43 @@ class FileManager:
         event_handler = ConfigChangeHandler(controller.config_path, controller.reload_config)
         self.observer = Observer()
         self.observer.schedule(event_handler, path=controller.config_path, recursive=False)
+
+        self.stopped = threading.Event()
+        self.flusher = None
+        self.tree_lock = threading.Lock()
         
     def start(self):
+        # Returns the applications which outlived a previous run of the
+        # daemon, by subdirectory, for the controller to adopt
         logger.info("Starting file manager")
 
+        orphans = {}
+
         if os.path.exists(self.state_dir):
-            logger.info("State directory already existed, performing clean-up")
-            self.cleanup_state_dir()
+            logger.info("State directory already existed, looking for surviving applications")
+            orphans = self.find_orphans()
+
+            logger.info(f"Found {len(orphans)} surviving applications, cleaning up the rest")
+            self.cleanup_state_dir(keep=list(orphans))
 
         logger.info("Creating state directory")
-        os.mkdir(self.state_dir)
+        os.makedirs(self.state_dir, exist_ok=True)
 
         logger.info("Starting configuration file watcher")
         self.observer.start()
 
+        return orphans
+
+    def start_flushing(self):
+        self.flusher = threading.Thread(target=self.__flush_periodically, name="state-flusher", daemon=True)
+        self.flusher.start()
+
     def stop(self):
         logger.info("Stopping file manager")
         self.observer.stop()
 
+        self.stopped.set()
+
     def save_state(self):
         logger.info("Saving current state")
 
@@ -60,11 +98,78 @@ class FileManager:
         if os.path.exists(state_path):
             with open(state_path, "r") as state_file:
                 controller_state = json.loads(state_file.read())
+
+            # The state is only handed over to the next run, any later one
+            # wasn't restarted and adopts from the persisted tree instead
+            os.remove(state_path)
         
         logger.debug(controller_state)
 
         return controller_state
 
+    def save_frecency(self, frecency_state):
+        self.__save_persistent(FRECENCY_FILE, frecency_state)
+
+    def load_frecency(self):
+        return self.__load_persistent(FRECENCY_FILE)
+
+    def save_profiles(self, profiles_state):
+        self.__save_persistent(PROFILES_FILE, profiles_state)
+
+    def load_profiles(self):
+        return self.__load_persistent(PROFILES_FILE)
+
+    def save_tree(self, tree):
+        # A flush still underway once stopping mustn't bring back the tree
+        # removed by it
+        with self.tree_lock:
+            if self.stopped.is_set():
+                return
+
+            self.__save_persistent(TREE_FILE, tree)
+
+    def load_tree(self):
+        return self.__load_persistent(TREE_FILE)
+
+    def remove_tree(self):
+        tree_path = os.path.join(self.state_dir, TREE_FILE)
+
+        with self.tree_lock:
+            if os.path.exists(tree_path):
+                os.remove(tree_path)
+
+    def __flush_periodically(self):
+        while not self.stopped.wait(FLUSH_INTERVAL):
+            try:
+                self.controller.flush()
+            except Exception:
+                logger.exception("Error saving state")
+
+    def __save_persistent(self, file_name, state):
+        os.makedirs(self.state_dir, exist_ok=True)
+
+        # Written aside and moved into place, so a daemon killed halfway
+        # leaves the previous version behind rather than a truncated one
+        state_path = os.path.join(self.state_dir, file_name)
+
+        with open(f"{state_path}.tmp", "w") as state_file:
+            state_file.write(json.dumps(state))
+
+        os.replace(f"{state_path}.tmp", state_path)
+
+    def __load_persistent(self, file_name):
+        state = None
+        state_path = os.path.join(self.state_dir, file_name)
+
+        if os.path.exists(state_path):
+            try:
+                with open(state_path, "r") as state_file:
+                    state = json.loads(state_file.read())
+            except json.JSONDecodeError:
+                logger.warning(f"Discarding corrupt state file {state_path}")
+
+        return state
+
     ##########################################################
     # Process ID Management Functions
     ##########################################################
@@ -85,49 +190,150 @@ class FileManager:
         logger.info(f"Removing application subdirectory for application {app_name}")
         app_subdir = os.path.join(self.state_dir, f"{win_name}-{app_name}")
 
-        shutil.rmtree(app_subdir)
+        if os.path.exists(app_subdir):
+            shutil.rmtree(app_subdir)
     
+    def rename_application_subdir(self, old_win_name, new_win_name, app_name):
+        old_subdir = os.path.join(self.state_dir, f"{old_win_name}-{app_name}")
+        new_subdir = os.path.join(self.state_dir, f"{new_win_name}-{app_name}")
+
+        logger.info(f"Moving application subdirectory {old_subdir} to {new_subdir}")
+
+        if os.path.exists(old_subdir):
+            os.rename(old_subdir, new_subdir)
+
+    def get_application_subdir(self, win_name, app_name):
+        return os.path.join(self.state_dir, f"{win_name}-{app_name}")
+
     def save_application_pid(self, app_subdir, pid):
+        # The start time tells the process apart from a later one which
+        # reuses its pid
+        try:
+            create_time = psutil.Process(pid).create_time()
+        except psutil.Error:
+            create_time = None
+
         pid_file_path = os.path.join(app_subdir, "pidfile")
 
         with open(pid_file_path, "w") as pid_file:
-            pid_file.write(str(pid))
+            pid_file.write(str(pid) if create_time == None else f"{pid}\n{create_time}")
 
-    def cleanup_state_dir(self):
+    def get_application_process(self, win_name, app_name):
+        return self.get_live_process(self.get_application_subdir(win_name, app_name))
+
+    def get_live_process(self, app_subdir):
+        # The process a pidfile was written for, or None if it's gone.
+        # Pidfiles without a start time predate it, a process which started
+        # after the pidfile was written reuses the pid.
+        pid_file_path = os.path.join(app_subdir, "pidfile")
+
+        if not os.path.isfile(pid_file_path):
+            return None
+
+        try:
+            with open(pid_file_path, "r") as pid_file:
+                fields = pid_file.read().split()
+
+            app_pid = int(fields[0])
+            create_time = float(fields[1]) if len(fields) > 1 else None
+        except (ValueError, IndexError):
+            logger.warning(f"Ignoring malformed pidfile {pid_file_path}")
+            return None
+
+        try:
+            process = psutil.Process(app_pid)
+
+            if process.status() == psutil.STATUS_ZOMBIE:
+                return None
+
+            started_at = process.create_time()
+        except psutil.Error:
+            return None
+
+        if create_time != None:
+            same = abs(started_at - create_time) < PID_TIME_TOLERANCE
+        else:
+            same = started_at <= os.path.getmtime(pid_file_path)
+
+        if not same:
+            logger.info(f"Process {app_pid} of {pid_file_path} was replaced by another process")
+            return None
+
+        return process
+
+    def find_orphans(self):
+        # Subdirectory -> live process, of every application left behind
+        orphans = {}
+
+        for subdir in os.listdir(self.state_dir):
+            if subdir in PERSISTENT_FILES:
+                continue
+
+            app_subdir = os.path.join(self.state_dir, subdir)
+
+            if not os.path.isdir(app_subdir):
+                continue
+
+            process = self.get_live_process(app_subdir)
+
+            if process != None:
+                orphans[app_subdir] = process
+
+        return orphans
+
+    def remove_orphan(self, app_subdir, process):
+        logger.info(f"Killing unclaimed process {process.pid} of {app_subdir}")
+
+        self.kill_process_tree(process)
+
+        if os.path.exists(app_subdir):
+            shutil.rmtree(app_subdir)
+
+    @staticmethod
+    def kill_process_tree(parent):
+        try:
+            children = parent.children(recursive=True)
+        except psutil.NoSuchProcess:
+            logger.warn(f"Unable to find process {parent.pid}")
+            return
+
+        for child in children:
+            try:
+                child.kill()
+            except psutil.NoSuchProcess:
+                logger.warn(f"Failed to find process {child.pid} during kill")
+
+        try:
+            parent.kill()
+        except psutil.NoSuchProcess:
+            logger.warn(f"Failed to find process {parent.pid} during kill")
+
+    def cleanup_state_dir(self, keep=[]):
         for subdir in os.listdir(self.state_dir):
+            if subdir in PERSISTENT_FILES:
+                continue
+
             app_subdir = os.path.join(self.state_dir, subdir)
-            pid_file_path = os.path.join(app_subdir, "pidfile")
+
+            if app_subdir in keep:
+                continue
 
             logger.info(f"Cleaning up subdirectory {app_subdir}")
 
-            if os.path.exists(pid_file_path) and os.path.isfile(pid_file_path):
-                logger.info("Found existing pidfile")
-
-                with open(pid_file_path, "r") as pid_file:
-                    app_pid = int(pid_file.read())
-                
-                logger.info(f"Sending kill signal to process {app_pid}")
-
-                try:
-                    parent = psutil.Process(app_pid)
-                except psutil.NoSuchProcess:
-                    parent = None
-                    logger.warn(f"Unable to find process {app_pid}")
-
-                if parent:
-                    for child in parent.children(recursive=True):
-                        try:
-                            child.kill()
-                        except psutil.NoSuchProcess:
-                            logger.warn(f"Failed to find process {child.ppid()} during kill")
-                    
-                    try:
-                        parent.kill()
-                    except psutil.NoSuchProcess:
-                        logger.warn(f"Failed to find process {parent.ppid()} during kill")
-
-        logger.info("Removing old state directory")
-        shutil.rmtree(self.state_dir)
+            # Only a process the pidfile was written for is killed, a pid
+            # may have been reused by anything since
+            process = self.get_live_process(app_subdir) if os.path.isdir(app_subdir) else None
+
+            if process:
+                logger.info(f"Sending kill signal to process {process.pid}")
+                self.kill_process_tree(process)
+
+            if os.path.isdir(app_subdir):
+                shutil.rmtree(app_subdir)
+            else:
+                os.remove(app_subdir)
+
+        logger.info("Removed old state, keeping persistent files")
 
 class ConfigChangeHandler(FileSystemEventHandler):
     def __init__(self, config_path, config_change_callback):
@@ -0,0 +1,184 @@
+import logging
+import threading
+import time
+
+from panmuphled.display.common import set_job, clear_job
+
+logger = logging.getLogger(__name__)
+
+"""
+    Commands which launch applications can take as long as every one of
+    them takes to open its windows. Given 'job': true they're run as jobs
+    instead, on their own thread, and the client gets a job id back
+    straight away, which it can then check on, wait for or cancel.
+
+    Jobs take the controller lock like any other command, so the tree is
+    only changed by one command at a time. While one runs, the server
+    doesn't wait for the lock, commands which need it are answered as
+    busy straight away, and checking on jobs doesn't need it. Cancelling is cooperative,
+    applications which haven't started yet or are still waiting on their
+    windows are stopped and dropped from the tree, while everything which
+    already started is left as it is.
+"""
+
+# Finished jobs which are kept around to be asked about
+MAX_FINISHED_JOBS = 50
+
+# Seconds job-wait waits unless told otherwise
+DEFAULT_WAIT_TIME = 10.0
+
+# Seconds running jobs get to wind down when the daemon stops
+STOP_WAIT_TIME = 5.0
+
+JOB_STATES = ["queued", "running", "done", "failed", "cancelled"]
+
+
+class Job:
+    def __init__(self, job_id, msg):
+        self.id = job_id
+        self.msg = msg
+
+        self.state = "queued"
+        self.result = None
+
+        # One entry per application, as each of them is started
+        self.progress = []
+
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+        self.cancelled = threading.Event()
+        self.finished = threading.Event()
+
+        self.thread = None
+
+    def report(self, progress):
+        self.progress.append(dict(progress, time=time.time()))
+
+    def show(self):
+        return {
+            "id": self.id,
+            "command": self.msg["command"],
+            "state": self.state,
+            "cancelling": self.cancelled.is_set() and not self.finished.is_set(),
+            "progress": list(self.progress),
+            "result": self.result,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class Jobs:
+    def __init__(self, controller):
+        self.controller = controller
+
+        # Job id -> job, oldest first
+        self.jobs = {}
+        self.next_id = 1
+
+        self.counts = {state: 0 for state in JOB_STATES if state not in ("queued", "running")}
+
+        self.lock = threading.Lock()
+
+    def submit(self, msg, run):
+        # Run msg with run(msg) on a thread of its own
+        with self.lock:
+            job = Job(self.next_id, msg)
+            self.next_id = self.next_id + 1
+
+            self.jobs[job.id] = job
+            self.__prune()
+
+        logger.info(f"Submitting job {job.id} for command {msg['command']}")
+
+        job.thread = threading.Thread(target=self.__run, args=(job, run), name=f"job-{job.id}", daemon=True)
+        job.thread.start()
+
+        return job
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def get_jobs(self):
+        with self.lock:
+            return list(self.jobs.values())
+
+    def is_running(self):
+        with self.lock:
+            return any(not job.finished.is_set() for job in self.jobs.values())
+
+    def cancel(self, job):
+        if job.finished.is_set():
+            return False
+
+        logger.info(f"Cancelling job {job.id}")
+        job.cancelled.set()
+
+        return True
+
+    def wait(self, job, seconds):
+        return job.finished.wait(seconds)
+
+    def stop(self):
+        running = [job for job in self.get_jobs() if not job.finished.is_set()]
+
+        for job in running:
+            self.cancel(job)
+
+        for job in running:
+            job.finished.wait(STOP_WAIT_TIME)
+
+    def show_stats(self):
+        with self.lock:
+            return {
+                "running": len([job for job in self.jobs.values() if not job.finished.is_set()]),
+                "finished": dict(self.counts),
+            }
+
+    """
+    """
+
+    def __run(self, job, run):
+        set_job(job)
+
+        try:
+            if job.cancelled.is_set():
+                job.state = "cancelled"
+                return
+
+            job.state = "running"
+            job.started_at = time.time()
+
+            job.result = run(job.msg)
+
+            if job.cancelled.is_set():
+                job.state = "cancelled"
+            elif job.result.get("rc") == 0:
+                job.state = "done"
+            else:
+                job.state = "failed"
+        except Exception:
+            logger.exception(f"Error running job {job.id}")
+            job.state = "failed"
+        finally:
+            clear_job()
+
+            job.finished_at = time.time()
+
+            with self.lock:
+                self.counts[job.state] = self.counts[job.state] + 1
+
+            job.finished.set()
+
+            logger.info(f"Job {job.id} {job.state}")
+
+            self.controller.bus.publish("job_finished", job=job.id, command=job.msg["command"], state=job.state)
+
+    def __prune(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job.finished.is_set()]
+
+        for job_id in finished[:max(len(finished) - MAX_FINISHED_JOBS, 0)]:
+            del self.jobs[job_id]
@@ -0,0 +1,172 @@
+import logging
+import logging.handlers
+import queue
+import threading
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+"""
+    Logging for the daemon. Records are written to the log file by a
+    background thread, so commands never wait on the disk, and only
+    records at the file's level are formatted at all. Independently, the
+    most recent records down to DEBUG are kept unformatted in memory, and
+    can be dumped on demand with the 'dump_log' command.
+
+    Levels and the size of the buffer can be set with a configuration
+    element like
+
+        "logging": {
+            "level": "INFO",
+            "buffer_level": "DEBUG",
+            "buffer_size": 5000,
+            "levels": {"watchdog": "WARNING"}
+        }
+"""
+
+LEVEL_NAMES = ["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"]
+
+DEFAULT_LEVEL = "INFO"
+DEFAULT_BUFFER_LEVEL = "DEBUG"
+DEFAULT_BUFFER_SIZE = 5000
+
+# Chatty libraries which would otherwise crowd our own records out of the
+# buffer
+DEFAULT_LEVELS = {"watchdog": "INFO"}
+
+FILE_FORMAT = "%(asctime)s %(levelname)s [%(threadName)s] %(name)s: %(message)s"
+
+
+class RingBufferHandler(logging.Handler):
+    def __init__(self, size):
+        super().__init__()
+
+        self.records = deque(maxlen=size)
+        self.formatter = logging.Formatter()
+
+    def handle(self, record):
+        # Appending to a deque is atomic, there's no need to take the
+        # handler's lock
+        self.emit(record)
+
+        return True
+
+    def emit(self, record):
+        self.records.append(record)
+
+    def resize(self, size):
+        if size != self.records.maxlen:
+            self.records = deque(self.records, maxlen=size)
+
+    def dump(self, level=None, limit=None):
+        # Records are only formatted here, when somebody asks for them
+        levelno = logging.getLevelName(level) if level else logging.NOTSET
+        records = [record for record in list(self.records) if record.levelno >= levelno]
+
+        if limit:
+            records = records[-limit:]
+
+        return [self.show_record(record) for record in records]
+
+    def show_record(self, record):
+        shown = {
+            "time": record.created,
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "message": record.getMessage(),
+        }
+
+        if record.exc_info:
+            shown["exception"] = self.formatter.formatException(record.exc_info)
+
+        return shown
+
+
+class Logs:
+    ring_buffer = None
+    file_handler = None
+    queue_handler = None
+    listener = None
+
+    lock = threading.Lock()
+
+    @staticmethod
+    def setup(log_file, level=DEFAULT_LEVEL):
+        root = logging.getLogger()
+
+        # The root logger lets everything through, each handler filters for
+        # itself
+        root.setLevel(logging.DEBUG)
+
+        Logs.ring_buffer = RingBufferHandler(DEFAULT_BUFFER_SIZE)
+        Logs.ring_buffer.setLevel(DEFAULT_BUFFER_LEVEL)
+
+        Logs.file_handler = logging.FileHandler(log_file)
+        Logs.file_handler.setFormatter(logging.Formatter(FILE_FORMAT))
+
+        # Records are formatted as they're queued, so the queue handler has
+        # to filter by the file's level
+        Logs.queue_handler = logging.handlers.QueueHandler(queue.SimpleQueue())
+        Logs.queue_handler.setLevel(level)
+
+        Logs.listener = logging.handlers.QueueListener(Logs.queue_handler.queue, Logs.file_handler)
+        Logs.listener.start()
+
+        root.addHandler(Logs.queue_handler)
+        root.addHandler(Logs.ring_buffer)
+
+        for name, level in DEFAULT_LEVELS.items():
+            logging.getLogger(name).setLevel(level)
+
+    @staticmethod
+    def validate(cfg):
+        if type(cfg) != dict:
+            logger.error(f"'logging' element incorrect type. Expecting type dict, got: {type(cfg)}")
+            return False
+
+        for key in ["level", "buffer_level"]:
+            if key in cfg and cfg[key] not in LEVEL_NAMES:
+                logger.error(f"'{key}' of 'logging' must be one of {LEVEL_NAMES}")
+                return False
+
+        if "buffer_size" in cfg and (type(cfg["buffer_size"]) != int or cfg["buffer_size"] <= 0):
+            logger.error("'buffer_size' of 'logging' must be a positive integer")
+            return False
+
+        if "levels" in cfg and (
+            type(cfg["levels"]) != dict or not all(level in LEVEL_NAMES for level in cfg["levels"].values())
+        ):
+            logger.error(f"'levels' of 'logging' must map logger names to one of {LEVEL_NAMES}")
+            return False
+
+        return True
+
+    @staticmethod
+    def configure(cfg):
+        if Logs.ring_buffer == None:
+            return
+
+        with Logs.lock:
+            if "level" in cfg:
+                Logs.queue_handler.setLevel(cfg["level"])
+
+            Logs.ring_buffer.setLevel(cfg.get("buffer_level", DEFAULT_BUFFER_LEVEL))
+            Logs.ring_buffer.resize(cfg.get("buffer_size", DEFAULT_BUFFER_SIZE))
+
+            for name, level in dict(DEFAULT_LEVELS, **cfg.get("levels", {})).items():
+                logging.getLogger(name).setLevel(level)
+
+    @staticmethod
+    def dump(level=None, limit=None):
+        if Logs.ring_buffer == None:
+            return []
+
+        return Logs.ring_buffer.dump(level=level, limit=limit)
+
+    @staticmethod
+    def stop():
+        # Flush whatever is still queued for the file
+        if Logs.listener != None:
+            Logs.listener.stop()
+            Logs.listener = None
@@ -1,195 +1,186 @@
 import logging
 
+from panmuphled.server.logs import LEVEL_NAMES
+from panmuphled.server.subscriptions import EVENT_TYPES
+
 logger = logging.getLogger(__name__)
 
 RC_OK = 0
 RC_BAD = 1
 
-class Parser
-    @staticmethod
-    parse_index(msg):
-        rc = RC_OK
-
-        if "index" not in msg:
-            return [rc, None]
-        else:
-            if type(msg["index"]) != int:
-                logger.warning(f"Found index with invalid type while parsing message")
-                return {"rc": RC_BAD}
-            else:
-                return [rc, msg["index"]]
+VERTICAL_DIRECTIONS = ["UP", "DOWN"]
+
+"""
+    Declarative schemas for the parameters of every command. Each parameter
+    may have:
+        type      the exact type of the value, or a tuple of them
+        items     for lists, the exact type of each item
+        choices   the values which are allowed
+        required  whether the value has to be present and not null
+        positive  for numbers, whether the value has to be above zero
+
+    Parameters which are absent or null are filled in as None, and anything
+    not in the schema is dropped, so command handlers can index messages
+    directly without checking them again.
+"""
+
+INDEX = {"type": int}
+NAME = {"type": str}
+PID = {"type": int}
+QUERY = {"type": str}
+LIMIT = {"type": int}
+PREVIOUS = {"type": bool}
+# Run the command as a job, returning its id instead of waiting for it
+JOB = {"type": bool}
+JOB_ID = {"type": int}
+
+# Parameters every command accepts
+COMMON_PARAMETERS = {
+    # Seconds the command has to finish, overriding the configured deadline
+    "timeout": {"type": (int, float), "positive": True},
+}
+
+COMMAND_SCHEMAS = {
+    "show_tree": {"since": {"type": int}},
+
+    "switch_workspace": {
+        "index": INDEX,
+        "direction": {"type": str, "choices": VERTICAL_DIRECTIONS},
+        "previous": PREVIOUS,
+    },
+    "select_workspace": {},
+    "list_workspaces": {},
+    "show_workspace": {"index": dict(INDEX, required=True)},
+    "launch_workspace": {"job": JOB},
+    "open_workspace": {"name": dict(NAME, required=True), "job": JOB},
+    "close_workspace": {},
+
+    "switch_window": {"index": INDEX, "previous": PREVIOUS},
+    "select_window": {},
+    "list_windows": {},
+    "show_window": {"index": dict(INDEX, required=True)},
+
+    "start_application": {"name": NAME, "exec": {"type": str}, "index": INDEX, "job": JOB},
+    "launch_application": {"job": JOB},
+    "switch_application": {"index": INDEX, "pid": PID, "address": {"type": str}},
+    "find_applications": {"name": NAME, "pid": PID},
+    "search_applications": {"query": QUERY, "limit": LIMIT},
+
+    "search": {"query": dict(QUERY, required=True), "limit": LIMIT},
+    "switch_to_match": {"query": dict(QUERY, required=True)},
+    "cycle_recent": {},
+
+    "toggle_scratchpad": {"name": dict(NAME, required=True)},
+
+    "stats": {},
+    "dump_log": {"limit": LIMIT, "level": {"type": str, "choices": LEVEL_NAMES}},
+    "profile": {
+        "mode": {"type": str, "choices": ["start", "stop", "status"]},
+        "count": {"type": int},
+        "seconds": {"type": (int, float)},
+    },
+    "memprofile": {
+        "mode": {"type": str, "choices": ["start", "snapshot", "stop"]},
+        "limit": LIMIT,
+        "frames": {"type": int},
+    },
+
+    "job_status": {"id": JOB_ID},
+    "job_wait": {"id": dict(JOB_ID, required=True), "seconds": {"type": (int, float)}},
+    "job_cancel": {"id": dict(JOB_ID, required=True)},
+    "batch": {
+        "commands": {"type": list, "items": dict, "required": True},
+        "stop_on_error": {"type": bool},
+    },
+    "run_macro": {"name": dict(NAME, required=True), "stop_on_error": {"type": bool}},
+
+    "subscribe": {"events": {"type": list, "items": str, "choices": EVENT_TYPES}},
+    "terminate": {},
+    "restart": {},
+}
+
+# Commands which can't be run from batches or macros, as they either run
+# other commands themselves or act on the server and the connection
+UNBATCHABLE_COMMANDS = ["batch", "run_macro", "subscribe", "terminate", "restart"]
+
+
+class Parser:
+    # Command name -> compiled validator
+    validators = {}
 
     @staticmethod
-    parse_name(msg):
-        rc = RC_OK
+    def compile_schema(command, schema):
+        # Flatten the schema into tuples once, so validating a message is a
+        # single pass with no dictionary lookups into the schema
+        checks = [
+            (
+                key,
+                spec["type"] if type(spec["type"]) == tuple else (spec["type"],),
+                spec.get("items"),
+                frozenset(spec["choices"]) if "choices" in spec else None,
+                spec.get("required", False),
+                spec.get("positive", False),
+            )
+            for key, spec in dict(COMMON_PARAMETERS, **schema).items()
+        ]
 
-        if "name" not in msg:
-            return [rc, None]
-        else:
-            if type(msg["name"]) != str:
-                logger.warning(f"Found name with invalid type while parsing message")
-                return {"rc": RC_BAD}
-            else:
-                return [rc, msg["name"]]
+        def validate(msg):
+            parsed = {"command": command}
 
+            for key, value_types, item_type, choices, required, positive in checks:
+                value = msg.get(key)
 
-    @staticmethod
-    parse_exec(msg):
-        rc = RC_OK
-
-        if "exec" not in msg:
-            return [rc, None]
-        else:
-            if type(msg["exec"]) != str:
-                logger.warning(f"Found exec with invalid type while parsing message")
-                return {"rc": RC_BAD}
-            else:
-                return [rc, msg["exec"]]
+                if value is None:
+                    if required:
+                        return [RC_BAD, f"missing required parameter '{key}'"]
+
+                    parsed[key] = None
+                    continue
+
+                if type(value) not in value_types:
+                    type_names = " or ".join(value_type.__name__ for value_type in value_types)
+                    return [RC_BAD, f"parameter '{key}' must be of type {type_names}"]
+
+                if positive and value <= 0:
+                    return [RC_BAD, f"parameter '{key}' must be positive"]
+
+                if item_type is not None:
+                    for item in value:
+                        if type(item) is not item_type:
+                            return [RC_BAD, f"items of parameter '{key}' must be of type {item_type.__name__}"]
+
+                        if choices is not None and item not in choices:
+                            return [RC_BAD, f"invalid value '{item}' in parameter '{key}'"]
+                elif choices is not None and value not in choices:
+                    return [RC_BAD, f"invalid value '{value}' for parameter '{key}'"]
+
+                parsed[key] = value
+
+            return [RC_OK, parsed]
+
+        return validate
 
     @staticmethod
-    parse_pid(msg):
-        rc = RC_OK
-
-        if "pid" not in msg:
-            return [rc, None]
-        else:
-            if type(msg["pid"]) != int:
-                logger.warning(f"Found pid with invalid type while parsing message")
-                return {"rc": RC_BAD}
-            else:
-                return [rc, msg["pid"]]
+    def compile_schemas(schemas):
+        for command, schema in schemas.items():
+            Parser.validators[command] = Parser.compile_schema(command, schema)
 
     @staticmethod
-    parse_message(msg, required=[], optional=[]):
+    def parse_message(msg):
         # This is a one-stop shop for everything we need to do vis-a-vis
         # parsing and validating the contents of a message
-        rc = RC_OK
-
-        resp_req = {}
-        resp_opt = {}
-
-        for key in required:
-            resp_req[key] = None
-        
-        for key in optional:
-            resp_opt[key] = None
-
-        if "workspace" in msg:
-            ws_msg = msg["workspace"]
-
-            # Handle index
-            rc, ws_index = Parser.parse_index(ws_msg)
-
-            if rc != RC_OK:
-                return [rc] + ([None] * len(required)) + ([None] * len(optional))
-            
-            if "ws_index" in resp_req:
-                resp_req["ws_index"] = ws_index
-        
-            if "ws_index" in resp_opt:
-                resp_opt["ws_index"] = ws_index
-
-            # Handle name
-            rc, ws_name = Parser.parse_name(ws_msg)
-
-            if rc != RC_OK:
-                return [rc] + ([None] * len(required)) + ([None] * len(optional))
-            
-            if "ws_name" in resp_req:
-                resp_req["ws_name"] = ws_name
-        
-            if "ws_name" in resp_opt:
-                resp_opt["ws_name"] = ws_name
-        if "window" in msg:
-            wn_msg = msg["window"]
-
-            # Handle index
-            rc, wn_index = Parser.parse_index(wn_msg)
-
-            if rc != RC_OK:
-                return [rc] + ([None] * len(required)) + ([None] * len(optional))
-            
-            if "wn_index" in resp_req:
-                resp_req["wn_index"] = wn_index
-        
-            if "wn_index" in resp_opt:
-                resp_opt["wn_index"] = wn_index
-
-            # Handle name
-            rc, wn_name = Parser.parse_name(wn_msg)
-
-            if rc != RC_OK:
-                return [rc] + ([None] * len(required)) + ([None] * len(optional))
-            
-            if "wn_name" in resp_req:
-                resp_req["wn_name"] = wn_name
-        
-            if "wn_name" in resp_opt:
-                resp_opt["wn_name"] = wn_name
-        
-        if "application" in msg:
-            app_msg = msg["application"]
-
-            # Handle index
-            rc, app_index = Parser.parse_index(app_msg)
-
-            if rc != RC_OK:
-                return [rc] + ([None] * len(required)) + ([None] * len(optional))
-            
-            if "app_index" in resp_req:
-                resp_req["app_index"] = app_index
-        
-            if "app_index" in resp_opt:
-                resp_opt["app_index"] = app_index
-
-            # Handle name
-            rc, app_name = Parser.parse_name(app_msg)
-
-            if rc != RC_OK:
-                return [rc] + ([None] * len(required)) + ([None] * len(optional))
-            
-            if "app_name" in resp_req:
-                resp_req["app_name"] = app_name
-        
-            if "app_name" in resp_opt:
-                resp_opt["app_name"] = app_name
-        
-            # Handle pid
-            rc, app_pid = Parser.parse_pid(app_msg)
-
-            if rc != RC_OK:
-                return [rc] + ([None] * len(required)) + ([None] * len(optional))
-            
-            if "app_pid" in resp_req:
-                resp_req["app_pid"] = app_pid
-        
-            if "app_pid" in resp_opt:
-                resp_opt["app_pid"] = app_pid
-            
-            # Handle exec
-            rc, app_exec = Parser.parse_exec(app_msg)
-
-            if rc != RC_OK:
-                return [rc] + ([None] * len(required)) + ([None] * len(optional))
-            
-            if "app_exec" in resp_req:
-                resp_req["app_exec"] = app_exec
-        
-            if "app_exec" in resp_opt:
-                resp_opt["app_exec"] = app_exec
-
-
-        # Make sure all the required keys were found
-        for key in resp_req:
-            if resp_req[key] == None:
-                return [RC_BAD] + ([None] * len(required)) + ([None] * len(optional))
-        
-        resp_all = []
-
-        for key in resp_req:
-            resp_all.append(resp_req[key])
-        
-        for key in resp_opt:
-            resp_all.append(resp_opt[key])
-        
-        return [rc] + resp_all
\ No newline at end of file
+        if type(msg) is not dict:
+            return [RC_BAD, "message must be an object"]
+
+        if "command" not in msg or type(msg["command"]) is not str:
+            return [RC_BAD, "message must contain a command"]
+
+        validate = Parser.validators.get(msg["command"])
+
+        if validate is None:
+            return [RC_BAD, f"unknown command '{msg['command']}'"]
+
+        return validate(msg)
+
+
+Parser.compile_schemas(COMMAND_SCHEMAS)
@@ -0,0 +1,282 @@
+import cProfile
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+from panmuphled.server.file_manager import PROFILING_DIR
+
+logger = logging.getLogger(__name__)
+
+"""
+    Profiling of the running daemon, started and stopped over IPC.
+
+    The CPU profiler runs cProfile around the next commands, for a number
+    of commands or a number of seconds, and meanwhile samples the stacks of
+    every thread, so work done by the event, reconciler and other threads
+    for those commands shows up too. When it's done it writes the cProfile
+    statistics as .pstats, and the sampled stacks as collapsed stacks
+    (.folded), which flamegraph tools read, into the 'profiling' directory
+    of the state directory.
+
+    The memory profiler takes tracemalloc snapshots, and reports the top
+    allocating lines and what grew since the previous snapshot.
+"""
+
+DEFAULT_COMMANDS = 10
+SAMPLE_INTERVAL = 0.005
+
+DEFAULT_FRAMES = 10
+DEFAULT_TOP = 20
+
+# Frames of tracemalloc and the import system aren't worth reporting
+MEMORY_FILTERS = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+]
+
+
+def get_profiling_dir(state_dir):
+    profiling_dir = os.path.join(state_dir, PROFILING_DIR)
+    os.makedirs(profiling_dir, exist_ok=True)
+
+    return profiling_dir
+
+def get_stack(frame):
+    # 'file:function' of every frame, outermost first
+    stack = []
+
+    while frame != None:
+        code = frame.f_code
+        stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+
+    return list(reversed(stack))
+
+
+class Profiler:
+    def __init__(self, controller):
+        self.controller = controller
+
+        self.profile = None
+        self.remaining = None
+        self.ends_at = None
+        self.started_at = None
+
+        # Collapsed stack -> number of samples
+        self.stacks = {}
+        self.sampler = None
+        self.stopped = threading.Event()
+        self.timer = None
+
+        self.in_command = False
+        self.last_result = None
+
+        self.lock = threading.Lock()
+
+    def start(self, commands=None, seconds=None):
+        with self.lock:
+            if self.profile != None:
+                return False
+
+            if commands == None and seconds == None:
+                commands = DEFAULT_COMMANDS
+
+            logger.info(f"Profiling the next {commands or 'unlimited'} commands for {seconds or 'unlimited'} seconds")
+
+            self.profile = cProfile.Profile()
+            self.remaining = commands
+            self.started_at = time.time()
+            self.ends_at = time.monotonic() + seconds if seconds else None
+
+            self.stacks = {}
+            self.stopped.clear()
+            self.sampler = threading.Thread(target=self.__sample, name="profiler", daemon=True)
+            self.sampler.start()
+
+            if seconds:
+                self.timer = threading.Timer(seconds, self.__expire)
+                self.timer.daemon = True
+                self.timer.start()
+
+        return True
+
+    def stop(self):
+        with self.lock:
+            if self.profile == None:
+                return self.last_result
+
+            # A command running on another thread finishes the session
+            # once it's done
+            if self.in_command:
+                self.ends_at = time.monotonic()
+                return None
+
+            return self.__finish()
+
+    def before_command(self):
+        with self.lock:
+            if self.profile == None:
+                return
+
+            self.in_command = True
+            self.profile.enable()
+
+    def after_command(self):
+        with self.lock:
+            if not self.in_command:
+                return
+
+            self.profile.disable()
+            self.in_command = False
+
+            if self.remaining != None:
+                self.remaining = self.remaining - 1
+
+            if self.remaining == 0 or (self.ends_at != None and time.monotonic() >= self.ends_at):
+                self.__finish()
+
+    def show_stats(self):
+        return {
+            "active": self.profile != None,
+            "remaining_commands": self.remaining,
+            "remaining_seconds": max(self.ends_at - time.monotonic(), 0) if self.profile and self.ends_at else None,
+            "last": self.last_result,
+        }
+
+    """
+    """
+
+    def __expire(self):
+        with self.lock:
+            if self.profile == None:
+                return
+
+            self.ends_at = time.monotonic()
+
+            if not self.in_command:
+                self.__finish()
+
+    def __finish(self):
+        # Called with the lock held, while no command is being profiled
+        self.stopped.set()
+
+        if self.timer != None:
+            self.timer.cancel()
+            self.timer = None
+
+        profiling_dir = get_profiling_dir(self.controller.file_manager.state_dir)
+        name = "profile-" + time.strftime("%Y%m%d-%H%M%S", time.localtime(self.started_at))
+
+        pstats_path = os.path.join(profiling_dir, name + ".pstats")
+        folded_path = os.path.join(profiling_dir, name + ".folded")
+
+        self.profile.dump_stats(pstats_path)
+
+        with open(folded_path, "w") as folded_file:
+            for stack, count in sorted(self.stacks.items()):
+                folded_file.write(f"{stack} {count}\n")
+
+        self.last_result = {
+            "pstats": pstats_path,
+            "folded": folded_path,
+            "samples": sum(self.stacks.values()),
+            "duration": time.time() - self.started_at,
+        }
+
+        logger.info(f"Wrote profile to {pstats_path} and {folded_path}")
+
+        self.profile = None
+        self.remaining = None
+        self.ends_at = None
+
+        return self.last_result
+
+    def __sample(self):
+        own_id = threading.get_ident()
+
+        while not self.stopped.wait(SAMPLE_INTERVAL):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+
+                stack = ";".join([names.get(thread_id, str(thread_id))] + get_stack(frame))
+                self.stacks[stack] = self.stacks.get(stack, 0) + 1
+
+
+class MemoryProfiler:
+    def __init__(self, controller):
+        self.controller = controller
+
+        self.previous = None
+        self.snapshots = 0
+
+    def start(self, frames=None):
+        if tracemalloc.is_tracing():
+            return False
+
+        logger.info("Starting to trace memory allocations")
+
+        tracemalloc.start(frames or DEFAULT_FRAMES)
+        self.previous = None
+
+        return True
+
+    def snapshot(self, limit=None):
+        # Starts tracing if it wasn't, the first snapshot is the baseline
+        self.start()
+
+        snapshot = tracemalloc.take_snapshot().filter_traces(MEMORY_FILTERS)
+        limit = limit or DEFAULT_TOP
+
+        profiling_dir = get_profiling_dir(self.controller.file_manager.state_dir)
+        snapshot_path = os.path.join(profiling_dir, "memory-" + time.strftime("%Y%m%d-%H%M%S") + ".snapshot")
+        snapshot.dump(snapshot_path)
+
+        current, peak = tracemalloc.get_traced_memory()
+
+        result = {
+            "snapshot": snapshot_path,
+            "traced": current,
+            "peak": peak,
+            "top": [
+                {"location": str(stat.traceback), "size": stat.size, "count": stat.count}
+                for stat in snapshot.statistics("lineno")[:limit]
+            ],
+            "growth": None,
+        }
+
+        if self.previous != None:
+            result["growth"] = [
+                {"location": str(stat.traceback), "size_diff": stat.size_diff, "count_diff": stat.count_diff}
+                for stat in snapshot.compare_to(self.previous, "lineno")[:limit]
+                if stat.size_diff != 0
+            ]
+
+        self.previous = snapshot
+        self.snapshots = self.snapshots + 1
+
+        return result
+
+    def stop(self):
+        if not tracemalloc.is_tracing():
+            return False
+
+        logger.info("Stopping to trace memory allocations")
+
+        tracemalloc.stop()
+        self.previous = None
+
+        return True
+
+    def show_stats(self):
+        return {
+            "tracing": tracemalloc.is_tracing(),
+            "snapshots": self.snapshots,
+        }
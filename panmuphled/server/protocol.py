@@ -0,0 +1,127 @@
+import json
+import socket
+import struct
+
+"""
+    Wire protocol between panmuphled and its clients. Every message is a
+    frame with a 5 byte header, the length of the payload as an unsigned
+    32 bit big-endian integer followed by one byte naming the encoding, and
+    then the payload. Payloads are JSON, or MessagePack when the msgpack
+    module is installed and the client asks for it. Replies use the
+    encoding of the request they answer.
+
+    Connections mirror the send/recv/close interface of
+    multiprocessing.connection, which this replaced, so nothing about the
+    protocol is specific to Python.
+"""
+
+HEADER = struct.Struct("!IB")
+
+ENCODING_JSON = ord("J")
+ENCODING_MSGPACK = ord("M")
+
+MAX_MESSAGE_SIZE = 16 * 1024 * 1024
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+def encode(obj, encoding=ENCODING_JSON):
+    if encoding == ENCODING_MSGPACK:
+        return msgpack.packb(obj, use_bin_type=True)
+
+    return json.dumps(obj, separators=(",", ":")).encode("utf-8")
+
+
+def decode(payload, encoding=ENCODING_JSON):
+    if encoding == ENCODING_MSGPACK:
+        if msgpack is None:
+            raise ProtocolError("Received MessagePack payload but msgpack is not installed")
+
+        return msgpack.unpackb(payload, raw=False)
+
+    if encoding != ENCODING_JSON:
+        raise ProtocolError(f"Unknown payload encoding {encoding}")
+
+    return json.loads(payload)
+
+
+class ProtocolError(Exception):
+    pass
+
+
+class Connection:
+    def __init__(self, sock, encoding=ENCODING_JSON):
+        self.sock = sock
+        self.encoding = encoding
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def settimeout(self, timeout):
+        self.sock.settimeout(timeout)
+
+    def send(self, obj):
+        payload = encode(obj, self.encoding)
+
+        self.sock.sendall(HEADER.pack(len(payload), self.encoding) + payload)
+
+    def recv(self):
+        length, encoding = HEADER.unpack(self.__recv_exactly(HEADER.size))
+
+        if length > MAX_MESSAGE_SIZE:
+            raise ProtocolError(f"Message of {length} bytes exceeds maximum size")
+
+        # Answer in whatever encoding the peer used
+        self.encoding = encoding
+
+        return decode(self.__recv_exactly(length), encoding)
+
+    def close(self):
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+        self.sock.close()
+
+    def __recv_exactly(self, size):
+        chunks = []
+
+        while size > 0:
+            chunk = self.sock.recv(size)
+
+            if not chunk:
+                raise EOFError("Connection closed by peer")
+
+            chunks.append(chunk)
+            size = size - len(chunk)
+
+        return b"".join(chunks)
+
+
+class Listener:
+    def __init__(self, address):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind(address)
+        self.sock.listen()
+
+    def accept(self):
+        sock, _ = self.sock.accept()
+
+        return Connection(sock)
+
+    def close(self):
+        self.sock.close()
+
+
+def Client(address, binary=False):
+    sock = socket.create_connection(address)
+
+    if binary and msgpack is None:
+        raise ProtocolError("Binary encoding requested but msgpack is not installed")
+
+    return Connection(sock, ENCODING_MSGPACK if binary else ENCODING_JSON)
@@ -2,22 +2,63 @@ import logging
 import signal
 import sys
 import json
-import shutil
-from multiprocessing.connection import Listener
 
-from panmuphled.display.common import run_command
+from panmuphled.display.common import (
+    run_command, start_coalescing, stop_coalescing, dispatches_failed,
+    set_deadline, clear_deadline, get_remaining_time, expire_deadline, count_timeout, get_job, CommandTimeout,
+)
 from panmuphled.display.controller import Controller
+from panmuphled.display.search import DEFAULT_RESULT_LIMIT
 from panmuphled.display.selector import Selector
+from panmuphled.server.catalog import DEFAULT_SEARCH_LIMIT
+from panmuphled.server.jobs import DEFAULT_WAIT_TIME
+from panmuphled.server.logs import Logs
+from panmuphled.server.parser import Parser, VERTICAL_DIRECTIONS, COMMAND_SCHEMAS, UNBATCHABLE_COMMANDS
+from panmuphled.server.protocol import Listener, ProtocolError
+from panmuphled.server.subscriptions import EVENT_TYPES
 
 logger = logging.getLogger(__name__)
 
 RC_OK = 0
 RC_BAD = 1
 RC_RESTART = 2
+RC_TIMEOUT = 3
+
+# Seconds a client gets to send its message before it's dropped
+CLIENT_TIMEOUT = 5.0
+
+# Deadlines of commands by kind, which the 'timeouts' config element can
+# override. Interactive commands wait on the user, and long ones may launch
+# applications or wake hibernated workspaces.
+DEFAULT_TIMEOUTS = {
+    "default": 10.0,
+    "interactive": 120.0,
+    "long": 60.0,
+}
+
+# Seconds a command of each kind may run before it's reported as stalled,
+# which the 'stall_budgets' config element can override
+DEFAULT_STALL_BUDGETS = {
+    "default": 2.0,
+    "interactive": 60.0,
+    "long": 20.0,
+}
 
-VERTICAL_DIRECTIONS = [ "UP", "DOWN"]
 HORIZONTAL_DIRECTION = ["LEFT", "RIGHT"]
 
+############################
+# Tree Commands
+############################
+
+def show_tree(msg, ctlr):
+    logger.info("Server recieved command to show tree")
+    rc = RC_OK
+
+    if msg["since"] != None:
+        return {"rc": rc, "tree": ctlr.show_since(msg["since"])}
+
+    return {"rc": rc, "tree": ctlr.show()}
+
 ############################
 # Workspace Control Commands
 ############################
@@ -26,23 +67,26 @@ def switch_workspace(msg, ctlr):
     logger.info("Server recieved command to switch workspaces")
     rc = RC_OK
 
-    if "index" not in msg and "direction" not in msg:
-        logger.warning(f"Recieved malformed message: {msg}")
-        return {"rc": RC_BAD}
+    if msg["previous"] == True:
+        next_workspace = ctlr.get_previous_workspace()
 
-    if "index" in msg and (type(msg["index"]) != int and msg["index"] != None):
-        logger.warning(f"Recieved message with invalid index parameter: {msg}")
-        return {"rc": RC_BAD}
+        if next_workspace == None:
+            logger.warning("No previous workspace to switch to")
+            return {"rc": RC_BAD}
+
+        rc = ctlr.switch_workspace(next_workspace)
 
-    if "direction" in msg and (msg["direction"] != None and (type(msg["direction"]) != str and msg["direction"] not in VERTICAL_DIRECTIONS)):
-        logger.warning(f"Recieved message with invalid direction parameter: {msg}")
+        return {"rc": rc}
+
+    if msg["index"] == None and msg["direction"] == None:
+        logger.warning(f"Recieved malformed message: {msg}")
         return {"rc": RC_BAD}
 
     workspaces = ctlr.get_workspaces()
 
-    logger.debug(f"  workspaces: {workspaces}")
+    logger.debug("  workspaces: %s", workspaces)
 
-    if "index" in msg and msg["index"] != None:
+    if msg["index"] != None:
         target_num = msg["index"] - 1
         if len(workspaces) <= target_num:
             logger.warning(
@@ -85,24 +129,18 @@ def list_workspaces(msg, ctlr):
     workspaces = ctlr.get_workspaces()
 
     ws_names = [ ws.name for ws in workspaces ]
+    hibernated = [ ws.name for ws in workspaces if ws.hibernated ]
 
-    return {"rc": rc, "workspace_names": ws_names}
+    return {"rc": rc, "workspace_names": ws_names, "hibernated": hibernated}
 
 def show_workspace(msg, ctlr):
     logger.info("Server recieved command to show workspace")
     rc = RC_OK
 
-    if "index" not in msg:
-        logger.warning(f"Recieved malformed message: {msg}")
-        return {"rc": RC_BAD}
-
-    if type(msg["index"]) != int:
-        logger.warning(f"Recieved message with invalid parameter: {msg}")
-        return {"rc": RC_BAD}
-    
+    target_num = msg["index"] - 1
     workspaces = ctlr.get_workspaces()
 
-    if len(workspaces) <= target_num:
+    if target_num not in range(0, len(workspaces)):
         logger.warning(
             f"Recieved request to show workspace which doesn't exist. Target workspace: {target_num}"
         )
@@ -118,19 +156,16 @@ def launch_workspace(msg, ctlr):
     logger.info("Server recieved command to launch a workspace")
     rc = RC_OK
 
-    ws_templates = ctlr.get_workspace_templates()
-
-    rc, sel_ws = Selector.select_from_list(list(ws_templates.keys()))
+    rc, sel_tmpl = Selector.select_template(ctlr)
 
     if rc != RC_OK:
         logger.warning(f"Selection failed with RC: {rc}")
         return {"rc": RC_BAD}
 
-    if sel_ws not in ws_templates:
-        logger.warning(f"Selected workspace not found: '{sel_ws}'")
+    if sel_tmpl == None:
         return {"rc": RC_BAD}
 
-    rc = ctlr.open_workspace(ws_templates[sel_ws])
+    rc = ctlr.open_workspace(sel_tmpl)
 
     return {"rc": rc}
 
@@ -138,10 +173,6 @@ def open_workspace(msg, ctlr):
     logger.info("Server recieved command to open a workspace")
     rc = RC_OK
 
-    if "name" not in msg or msg["name"] == None:
-        logger.warning(f"No workspace was specified for opening")
-        return {"rc": RC_BAD}
-
     new_ws = msg["name"]
 
     ws_templates = ctlr.get_workspace_templates()
@@ -150,12 +181,9 @@ def open_workspace(msg, ctlr):
         logger.warning(f"Specified workspace not found: '{new_ws}'")
         return {"rc": RC_BAD}
 
-    ws_name = None
-
-    if "name" in msg and msg["name"] != None:
-        ws_name = msg["name"]
+    ws_name = msg["name"]
 
-    ctlr.open_workspace(ws_templates[new_ws], ws_name=ws_name)
+    rc = ctlr.open_workspace(ws_templates[new_ws], ws_name=ws_name)
 
     return {"rc": rc}
 
@@ -163,23 +191,16 @@ def close_workspace(msg, ctlr):
     logger.info("Server recieved command to start workspaces")
     rc = RC_OK
 
-    workspaces = ctlr.get_workspaces()
-    ws_table = {}
-
-    for ws in workspaces:
-        ws_table[ws.name] = ws
-
-    rc, sel_ws = Selector.select_from_list(list(ws_table.keys()))
+    rc, sel_ws = Selector.select_workspace(ctlr)
 
     if rc != RC_OK:
         logger.warning(f"Selection failed with RC: {rc}")
         return {"rc": RC_BAD}
 
-    if sel_ws not in ws_table:
-        logger.warning(f"Selected workspace not found: '{sel_ws}'")
+    if sel_ws == None:
         return {"rc": RC_BAD}
 
-    rc = ctlr.close_workspace(ws_table[sel_ws])
+    rc = ctlr.close_workspace(sel_ws)
 
     return {"rc": rc}
 
@@ -191,18 +212,25 @@ def switch_window(msg, ctlr):
     logger.info("Server recieved command to switch windows")
     rc = RC_OK
 
-    if "index" not in msg:
-        logger.warning(f"Recieved malformed message: {msg}")
-        return {"rc": RC_BAD}
+    if msg["previous"] == True:
+        next_window = ctlr.get_previous_window()
+
+        if next_window == None:
+            logger.warning("No previous window to switch to")
+            return {"rc": RC_BAD}
+
+        rc = ctlr.switch_window(next_window)
 
-    if type(msg["index"]) != int:
-        logger.warning(f"Recieved message with invalid parameter: {msg}")
+        return {"rc": rc}
+
+    if msg["index"] == None:
+        logger.warning(f"Recieved malformed message: {msg}")
         return {"rc": RC_BAD}
 
     target_num = msg["index"] - 1
     windows = ctlr.get_windows()
 
-    logger.debug(f"  windows: {windows}")
+    logger.debug("  windows: %s", windows)
 
     if len(windows) <= target_num:
         logger.warning(
@@ -244,26 +272,19 @@ def show_window(msg, ctlr):
     logger.info("Server recieved command to show window")
     rc = RC_OK
 
-    if "index" not in msg:
-        logger.warning(f"Recieved malformed message: {msg}")
-        return {"rc": RC_BAD}
-
-    if type(msg["index"]) != int:
-        logger.warning(f"Recieved message with invalid parameter: {msg}")
-        return {"rc": RC_BAD}
-    
+    target_num = msg["index"] - 1
     windows = ctlr.get_windows()
 
-    if len(windows) <= target_num:
+    if target_num not in range(0, len(windows)):
         logger.warning(
             f"Recieved request to show window which doesn't exist. Target window: {target_num}"
         )
         return {"rc": RC_BAD}
     
-    ws = windows[target_num]
-    ws_data = ws.show()
+    wn = windows[target_num]
+    wn_data = wn.show()
 
-    return { "rc": RC_OK, "window": ws_data}
+    return { "rc": RC_OK, "window": wn_data}
 
 # def move_window(msg, ctrl):
 #     logger.info("Server recieved command to swap windows")
@@ -308,6 +329,48 @@ def start_application(msg, ctlr):
     logger.info("Server recieved command to start application")
     rc = RC_OK
 
+    if msg["exec"] == None and msg["name"] == None:
+        logger.warning(f"Recieved malformed message: {msg}")
+        return {"rc": RC_BAD}
+
+    # Resolve the application through the catalog, so that scripted
+    # launches never have to walk $PATH
+    if msg["exec"] != None:
+        app_exec = ctlr.catalog.resolve_exec(msg["exec"])
+        app_name = msg["name"] if msg["name"] != None else msg["exec"].split()[0]
+    else:
+        entry = ctlr.catalog.get_entry(msg["name"])
+        app_exec = entry["exec"] if entry else ctlr.catalog.resolve_exec(msg["name"])
+        app_name = msg["name"]
+
+    if app_exec == None:
+        logger.warning(f"Unable to resolve application to start: {msg}")
+        return {"rc": RC_BAD}
+
+    if msg["index"] != None:
+        windows = ctlr.get_windows()
+        target_num = msg["index"] - 1
+
+        if target_num not in range(0, len(windows)):
+            logger.warning("Specified window out of range")
+            return {"rc": RC_BAD}
+
+        target_win = windows[target_num]
+    else:
+        target_win = ctlr.current_workspace.get_focused_window()
+
+        if target_win == None:
+            logger.warning("No window specified and no managed window is focused")
+            return {"rc": RC_BAD}
+
+    ctlr.launch_application(target_win, {
+        'exec': app_exec,
+        'name': app_name,
+        'focused_default': False
+    })
+
+    return {"rc": rc}
+
 def launch_application(msg, ctlr):
     logger.info("Server recieved command to launch application")
     rc = RC_OK
@@ -318,35 +381,47 @@ def launch_application(msg, ctlr):
         logger.warning(f"Selection failed with RC: {rc}")
         return {"rc": RC_BAD}
 
-    # Have to find the absolute path of the application
-    # selected by rofi.
-    app_exec = shutil.which(sel_app)
+    if sel_app == None:
+        return {"rc": RC_BAD}
 
     rc, sel_ws = Selector.select_workspace(ctlr)
 
-    if rc != RC_OK:
+    if rc != RC_OK or sel_ws == None:
         logger.warning(f"Selection failed with RC: {rc}")
         return {"rc": RC_BAD}
     
     rc, sel_win = Selector.select_window(ctlr, ws_name=sel_ws.name)
 
-    if rc != RC_OK:
+    if rc != RC_OK or sel_win == None:
         logger.warning(f"Selection failed with RC: {rc}")
         return {"rc": RC_BAD}
     
-    sel_win.launch_application({
-        'exec': app_exec,
-        'name': sel_app,
+    ctlr.launch_application(sel_win, {
+        'exec': sel_app["exec"],
+        'name': sel_app["name"],
         'focused_default': False
     })
 
     return {"rc": rc}
 
+def search_applications(msg, ctlr):
+    logger.info("Server recieved command to search applications")
+    rc = RC_OK
+
+    query = msg["query"] if msg["query"] != None else ""
+    limit = msg["limit"] if msg["limit"] != None else DEFAULT_SEARCH_LIMIT
+
+    results = ctlr.catalog.search(
+        query, limit=limit, scores=ctlr.frecency.scores["executables"]
+    )
+
+    return {"rc": rc, "applications": results}
+
 def switch_application(msg, ctlr):
     logger.info("Server recieved command to switch to application")
     rc = RC_OK
 
-    if "index" in msg and msg["index"] != None:
+    if msg["index"] != None:
         target_num = msg["index"] - 1
         applications = ctlr.get_applications()
 
@@ -355,7 +430,7 @@ def switch_application(msg, ctlr):
             return {"rc": RC_BAD}
         
         ctlr.switch_application(applications[target_num])
-    elif "pid" in msg and msg["pid"] != None:
+    elif msg["pid"] != None:
         app_pid = msg["pid"]
         found_apps = ctlr.find_applications(app_pid=app_pid)
 
@@ -364,7 +439,7 @@ def switch_application(msg, ctlr):
             return {"rc": RC_BAD}
         
         ctlr.switch_application(found_apps[0])
-    elif "address" in msg and msg["address"] != None:
+    elif msg["address"] != None:
         app_addr = msg["address"]
         found_apps = ctlr.find_applications(app_addr=app_addr)
 
@@ -383,22 +458,250 @@ def find_applications(msg, ctlr):
     logger.info("Server recieved command to find application")
     rc = RC_OK
 
-    if "name" not in msg or "pid" not in msg:
+    app_name = msg["name"]
+    app_pid = msg["pid"]
+
+    if app_name == None and app_pid == None:
         logger.warning(f"Recieved malformed message: {msg}")
         return {"rc": RC_BAD}
- 
-    app_name = msg["name"] if "name" in msg else None
-    app_pid = msg["pid"] if "pid" in msg else None
 
     applications = ctlr.find_applications(app_name=app_name, app_pid=app_pid)
 
-    app_results = [ { "name": app.name, "pid": app.process.pid, "exec": app.exec, "window": app.window.name} for app in applications ]
+    app_results = [ show_application_result(app) for app in applications ]
+
+    return {"rc": rc, "applications": app_results}
+
+def search(msg, ctlr):
+    logger.info("Server recieved command to search applications and windows")
+    rc = RC_OK
+
+    limit = msg["limit"] if msg["limit"] != None else DEFAULT_RESULT_LIMIT
+
+    results = ctlr.search_applications(msg["query"], limit=limit)
+
+    app_results = [ dict(show_application_result(app), score=score) for score, app in results ]
 
     return {"rc": rc, "applications": app_results}
 
+def switch_to_match(msg, ctlr):
+    logger.info("Server recieved command to switch to best matching application")
+    rc = RC_OK
+
+    results = ctlr.search_applications(msg["query"], limit=1)
+
+    if len(results) < 1:
+        logger.warning(f"No application matched query '{msg['query']}'")
+        return {"rc": RC_BAD}
+
+    score, app = results[0]
+
+    rc = ctlr.switch_application(app)
+
+    return {"rc": rc, "application": show_application_result(app)}
+
+def cycle_recent(msg, ctlr):
+    logger.info("Server recieved command to cycle recent applications")
+    rc = RC_OK
+
+    next_app = ctlr.cycle_recent_application()
+
+    if next_app == None:
+        logger.warning("No recent application to cycle to")
+        return {"rc": RC_BAD}
+
+    rc = ctlr.switch_application(next_app)
+
+    return {"rc": rc, "application": show_application_result(next_app)}
+
+############################
+# Scratchpad Commands
+############################
+
+def toggle_scratchpad(msg, ctlr):
+    logger.info("Server recieved command to toggle scratchpad")
+
+    scratchpad = ctlr.scratchpads.get(msg["name"])
+
+    if scratchpad == None:
+        logger.warning(f"Specified scratchpad not found: '{msg['name']}'")
+        return {"rc": RC_BAD}
+
+    rc = scratchpad.toggle()
+
+    return {"rc": rc, "scratchpad": scratchpad.show()}
+
+def stats(msg, ctlr):
+    logger.info("Server recieved command to show stats")
+    rc = RC_OK
+
+    return {"rc": rc, "stats": ctlr.get_stats()}
+
+def dump_log(msg, ctlr):
+    logger.info("Server recieved command to dump recent log records")
+    rc = RC_OK
+
+    return {"rc": rc, "records": Logs.dump(level=msg["level"], limit=msg["limit"])}
+
+def profile(msg, ctlr):
+    logger.info("Server recieved command to profile commands")
+    rc = RC_OK
+
+    mode = msg["mode"] or "start"
+
+    if mode == "start":
+        if not ctlr.profiler.start(commands=msg["count"], seconds=msg["seconds"]):
+            logger.warning("Recieved request to profile while already profiling")
+            return {"rc": RC_BAD}
+
+        return {"rc": rc, "profiling": ctlr.profiler.show_stats()}
+
+    if mode == "stop":
+        return {"rc": rc, "profile": ctlr.profiler.stop()}
+
+    return {"rc": rc, "profiling": ctlr.profiler.show_stats()}
+
+def memprofile(msg, ctlr):
+    logger.info("Server recieved command to profile memory")
+    rc = RC_OK
+
+    mode = msg["mode"] or "snapshot"
+
+    if mode == "start":
+        return {"rc": rc, "started": ctlr.memory_profiler.start(frames=msg["frames"])}
+
+    if mode == "stop":
+        return {"rc": rc, "stopped": ctlr.memory_profiler.stop()}
+
+    return {"rc": rc, "memory": ctlr.memory_profiler.snapshot(limit=msg["limit"])}
+
+############################
+# Job Commands
+############################
+
+def job_status(msg, ctlr):
+    logger.info("Server recieved command to show job status")
+    rc = RC_OK
+
+    if msg["id"] == None:
+        return {"rc": rc, "jobs": [job.show() for job in ctlr.jobs.get_jobs()]}
+
+    job = ctlr.jobs.get(msg["id"])
+
+    if job == None:
+        logger.warning(f"Specified job not found: {msg['id']}")
+        return {"rc": RC_BAD}
+
+    return {"rc": rc, "job": job.show()}
+
+def job_wait(msg, ctlr):
+    logger.info("Server recieved command to wait for job")
+
+    job = ctlr.jobs.get(msg["id"])
+
+    if job == None:
+        logger.warning(f"Specified job not found: {msg['id']}")
+        return {"rc": RC_BAD}
+
+    seconds = msg["seconds"] if msg["seconds"] != None else DEFAULT_WAIT_TIME
+
+    # Waiting is bounded by the deadline of this command like anything else
+    remaining = get_remaining_time()
+
+    if remaining != None:
+        seconds = max(min(seconds, remaining), 0)
+
+    finished = ctlr.jobs.wait(job, seconds)
+
+    return {"rc": RC_OK if finished else RC_TIMEOUT, "job": job.show()}
+
+def job_cancel(msg, ctlr):
+    logger.info("Server recieved command to cancel job")
+
+    job = ctlr.jobs.get(msg["id"])
+
+    if job == None:
+        logger.warning(f"Specified job not found: {msg['id']}")
+        return {"rc": RC_BAD}
+
+    if not ctlr.jobs.cancel(job):
+        logger.warning(f"Recieved request to cancel job {job.id} which already finished")
+        return {"rc": RC_BAD, "job": job.show()}
+
+    return {"rc": RC_OK, "job": job.show()}
+
+############################
+# Batch Commands
+############################
+
+def batch(msg, ctlr):
+    logger.info("Server recieved command to run a batch of commands")
+
+    return run_commands(msg["commands"], msg["stop_on_error"], ctlr)
+
+def run_macro(msg, ctlr):
+    logger.info(f"Server recieved command to run macro {msg['name']}")
+
+    macros = ctlr.config.get("macros", {})
+
+    if msg["name"] not in macros:
+        logger.warning(f"Specified macro not found: '{msg['name']}'")
+        return {"rc": RC_BAD}
+
+    return run_commands(macros[msg["name"]], msg["stop_on_error"], ctlr)
+
+def run_commands(commands, stop_on_error, ctlr):
+    # Run commands one after another, deferring their compositor dispatches
+    # so they're sent together wherever nothing needs to see them first
+    rc = RC_OK
+    results = []
+
+    start_coalescing()
+
+    try:
+        for command in commands:
+            rv = run_batched_command(command, ctlr)
+            results.append(rv)
+
+            # Dispatches deferred by earlier commands may have been sent,
+            # and failed, while this one ran
+            if rv["rc"] != RC_OK or dispatches_failed():
+                rc = RC_BAD
+
+                if stop_on_error:
+                    break
+    finally:
+        dispatch_rc, stdout = stop_coalescing()
+
+    if dispatch_rc != 0:
+        rc = RC_BAD
+
+    return {"rc": rc, "results": results}
+
+def run_batched_command(msg, ctlr):
+    rc, parsed = Parser.parse_message(msg)
+
+    if rc != RC_OK:
+        return {"rc": RC_BAD, "error": parsed}
+
+    if parsed["command"] in UNBATCHABLE_COMMANDS:
+        return {"rc": RC_BAD, "error": f"command '{parsed['command']}' can't be batched"}
+
+    return COMMAND_MAPPINGS[parsed["command"]](parsed, ctlr)
+
+def show_application_result(app):
+    return {
+        "name": app.name,
+        "pid": app.process.pid if app.process else None,
+        "exec": app.exec,
+        "window": app.window.name,
+        "address": app.client_id
+    }
+
 
 
 COMMAND_MAPPINGS = {
+    "show_tree": show_tree,
+
     "switch_workspace": switch_workspace,
     "select_workspace": select_workspace,
     "list_workspaces":  list_workspaces,
@@ -416,8 +719,67 @@ COMMAND_MAPPINGS = {
     "launch_application": launch_application,
     "switch_application": switch_application,
     "find_applications": find_applications,
+    "search_applications": search_applications,
+
+    "search": search,
+    "switch_to_match": switch_to_match,
+    "cycle_recent": cycle_recent,
+
+    "toggle_scratchpad": toggle_scratchpad,
+
+    "stats": stats,
+    "dump_log": dump_log,
+    "profile": profile,
+    "memprofile": memprofile,
+
+    "job_status": job_status,
+    "job_wait": job_wait,
+    "job_cancel": job_cancel,
+
+    "batch": batch,
+    "run_macro": run_macro,
 }
 
+# Commands which run other commands
+BATCH_COMMANDS = ["batch", "run_macro"]
+
+# Commands which control profiling, and aren't profiled themselves
+PROFILING_COMMANDS = ["profile", "memprofile"]
+
+# Commands which may be run as jobs
+JOB_COMMANDS = ["open_workspace", "launch_workspace", "start_application", "launch_application"]
+
+# Commands which look after jobs, and don't wait for the controller, which
+# a running job holds
+JOB_CONTROL_COMMANDS = ["job_status", "job_wait", "job_cancel"]
+
+INTERACTIVE_COMMANDS = [
+    "select_workspace", "launch_workspace", "close_workspace",
+    "select_window", "launch_application",
+]
+
+LONG_COMMANDS = [
+    "switch_workspace", "open_workspace", "switch_window",
+    "start_application", "switch_application", "switch_to_match", "cycle_recent",
+    "toggle_scratchpad", "job_wait",
+] + BATCH_COMMANDS
+
+# Server-level commands which aren't dispatched through COMMAND_MAPPINGS
+SERVER_COMMANDS = ["subscribe", "terminate", "restart"]
+
+def get_command_kind(command):
+    if command in INTERACTIVE_COMMANDS:
+        return "interactive"
+
+    if command in LONG_COMMANDS:
+        return "long"
+
+    return "default"
+
+for command in list(COMMAND_MAPPINGS) + SERVER_COMMANDS:
+    if command not in COMMAND_SCHEMAS:
+        raise RuntimeError(f"Command {command} has no schema")
+
 
 class Server:
     def __init__(self, config_path):
@@ -451,24 +813,34 @@ class Server:
 
         # Wait for events from  the client
         logger.info(f"Listening for events on port {self.port}")
-        self.conn = self.listener.accept()
 
         while True:
-            msg = self.conn.recv()
-            logger.info(f"Recieved message: {msg}")
+            self.conn = self.listener.accept()
 
-            if "command" not in msg:
-                logger.warning(f"Recieved malformed message: {msg}")
-                self.conn.send({"rc": 1})
+            # A client which never sends anything can't hold up the server
+            self.conn.settimeout(CLIENT_TIMEOUT)
+
+            try:
+                msg = self.conn.recv()
+            except (EOFError, OSError, ProtocolError, ValueError) as e:
+                logger.warning(f"Failed to recieve message: {e}")
                 self.conn.close()
                 continue
 
-            if type(msg["command"]) != str:
-                logger.warning(f"Recieved message with invalid parameter: {msg}")
-                self.conn.send({"rc": 1})
+            logger.info("Recieved message: %s", msg)
+
+            # Every message is validated against the schema of its command
+            # before anything acts on it
+            rc, parsed = Parser.parse_message(msg)
+
+            if rc != RC_OK:
+                logger.warning(f"Recieved invalid message, {parsed}: {msg}")
+                self.conn.send({"rc": RC_BAD, "error": parsed})
                 self.conn.close()
                 continue
 
+            msg = parsed
+
             if msg["command"] == "terminate":
                 logger.info("Recieved terminate command")
                 self.conn.send({"rc": 0})
@@ -480,20 +852,121 @@ class Server:
                 self.conn.send({"rc": 0})
 
                 return self.restart()
-            
-            if msg["command"] not in COMMAND_MAPPINGS:
-                logger.warning(f"Unknown command {msg['command']}")
-                self.conn.send({"rc": 1})
-                self.conn.close()
+
+            if msg["command"] == "subscribe":
+                logger.info("Recieved subscribe command")
+                self.subscribe(msg)
                 continue
 
-            func = COMMAND_MAPPINGS[msg["command"]]
-            rv = func(msg, self.controller)
+            rv = self.run_command(msg)
+
+            try:
+                self.conn.send(rv)
+            except OSError as e:
+                logger.warning(f"Failed to send reply: {e}")
 
-            self.conn.send(rv)
             self.conn.close()
 
-            self.conn = self.listener.accept()
+    def run_command(self, msg):
+        # The client gets the job back while the command runs on
+        if msg["command"] in JOB_COMMANDS and msg["job"] == True:
+            job = self.controller.jobs.submit(msg, self.execute)
+
+            return {"rc": RC_OK, "job": job.show()}
+
+        return self.execute(msg)
+
+    def execute(self, msg):
+        func = COMMAND_MAPPINGS[msg["command"]]
+
+        # Everything the command does, compositor calls, selectors and
+        # waiting on applications, has to finish by its deadline
+        set_deadline(self.get_timeout(msg))
+
+        try:
+            if msg["command"] in JOB_CONTROL_COMMANDS:
+                rv = func(msg, self.controller)
+            elif self.lock_controller():
+                try:
+                    rv = self.run_measured(func, msg)
+                finally:
+                    self.controller.lock.release()
+            else:
+                logger.warning(f"Command {msg['command']} timed out waiting for the controller")
+                expire_deadline("controller lock")
+                rv = {"rc": RC_TIMEOUT, "error": "controller is busy"}
+        except CommandTimeout as e:
+            logger.warning(f"Command {msg['command']} timed out: {e}")
+            rv = {"rc": RC_TIMEOUT, "error": str(e)}
+
+        if clear_deadline():
+            count_timeout(f"command {msg['command']}")
+            rv = dict(rv, rc=RC_TIMEOUT)
+
+        return rv
+
+    def lock_controller(self):
+        # A job may hold the controller for as long as its launches take.
+        # The server handles one connection at a time, so rather than wait
+        # behind a job it answers busy straight away, jobs themselves wait
+        # until their deadline.
+        if get_job() == None and self.controller.jobs.is_running():
+            return self.controller.lock.acquire(blocking=False)
+
+        remaining = get_remaining_time()
+
+        if remaining == None:
+            return self.controller.lock.acquire()
+
+        return self.controller.lock.acquire(timeout=max(remaining, 0))
+
+    def run_measured(self, func, msg):
+        # Commands are profiled and watched for stalls while they hold the
+        # controller, which they do one at a time, jobs included
+        profiled = msg["command"] not in PROFILING_COMMANDS
+
+        if profiled:
+            self.controller.profiler.before_command()
+
+        self.controller.stall_detector.begin(msg, self.get_stall_budget(msg))
+
+        try:
+            return func(msg, self.controller)
+        finally:
+            self.controller.stall_detector.end()
+
+            if profiled:
+                self.controller.profiler.after_command()
+
+    def get_timeout(self, msg):
+        if msg["timeout"] != None:
+            return msg["timeout"]
+
+        timeouts = dict(DEFAULT_TIMEOUTS, **self.controller.config.get("timeouts", {}))
+
+        return timeouts[get_command_kind(msg["command"])]
+
+    def get_stall_budget(self, msg):
+        budgets = dict(DEFAULT_STALL_BUDGETS, **self.controller.config.get("stall_budgets", {}))
+
+        # A command may legitimately run as long as its deadline allows
+        if msg["timeout"] != None:
+            return max(budgets[get_command_kind(msg["command"])], msg["timeout"])
+
+        return budgets[get_command_kind(msg["command"])]
+
+    def subscribe(self, msg):
+        # The connection is handed over to the event bus, which keeps it open
+        # and pushes events to it
+        event_types = msg["events"]
+
+        # Subscribers are long lived, and sent to from their own threads
+        self.conn.settimeout(None)
+
+        self.conn.send({"rc": RC_OK, "events": event_types if event_types else EVENT_TYPES})
+        self.controller.bus.subscribe(self.conn, event_types)
+
+        self.conn = None
 
     def stop(self):
         logger.info("Closing Server")
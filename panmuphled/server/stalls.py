@@ -0,0 +1,144 @@
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+
+from panmuphled.display.common import get_pending_calls, get_operation_name
+from panmuphled.server.file_manager import STALLS_DIR
+
+logger = logging.getLogger(__name__)
+
+"""
+    Notices commands which run for longer than their budget, which with
+    commands handled one at a time means the daemon has stopped answering.
+    A stalled command is reported once, with the stacks of every thread,
+    the command and any external call still in flight, to the log and to
+    a file in the 'stalls' directory of the state directory.
+
+    Budgets are set by kind of command, like deadlines, and can be
+    overridden with a configuration element like
+
+        "stall_budgets": {"default": 2, "interactive": 60, "long": 20}
+"""
+
+CHECK_INTERVAL = 0.5
+
+
+def format_stacks(pending_calls):
+    # Like faulthandler, every thread, most recent call last
+    names = {thread.ident: thread.name for thread in threading.enumerate()}
+    lines = []
+
+    for thread_id, frame in sys._current_frames().items():
+        lines.append(f"Thread {names.get(thread_id, thread_id)} ({thread_id}):")
+
+        if thread_id in pending_calls:
+            command, started_at = pending_calls[thread_id]
+            lines.append(f"  Waiting {time.monotonic() - started_at:.2f}s on {command}")
+
+        lines.extend(line.rstrip("\n") for line in traceback.format_stack(frame))
+        lines.append("")
+
+    return "\n".join(lines)
+
+
+class StallDetector:
+    def __init__(self, controller):
+        self.controller = controller
+
+        # The command being run, when it started, and its budget
+        self.current = None
+        self.started_at = None
+        self.budget = None
+        self.reported = False
+
+        # Command -> number of times it stalled
+        self.stalls = {}
+        self.last_report = None
+
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        logger.info("Starting stall detector")
+
+        self.thread = threading.Thread(target=self.__watch, name="stall-detector", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+
+    def begin(self, msg, budget):
+        with self.lock:
+            self.current = msg
+            self.started_at = time.monotonic()
+            self.budget = budget
+            self.reported = False
+
+    def end(self):
+        with self.lock:
+            if self.reported:
+                logger.warning(f"Stalled command {self.current['command']} finished after {time.monotonic() - self.started_at:.2f}s")
+
+            self.current = None
+
+    def show_stats(self):
+        with self.lock:
+            return {
+                "stalls": dict(self.stalls),
+                "total": sum(self.stalls.values()),
+                "last_report": self.last_report,
+            }
+
+    """
+    """
+
+    def __watch(self):
+        while not self.stopped.wait(CHECK_INTERVAL):
+            with self.lock:
+                if self.current == None or self.reported or self.budget == None:
+                    continue
+
+                elapsed = time.monotonic() - self.started_at
+
+                if elapsed < self.budget:
+                    continue
+
+                self.reported = True
+                self.stalls[self.current["command"]] = self.stalls.get(self.current["command"], 0) + 1
+
+                msg = self.current
+
+            try:
+                self.__report(msg, elapsed)
+            except Exception:
+                logger.exception("Error reporting stalled command")
+
+    def __report(self, msg, elapsed):
+        pending_calls = get_pending_calls()
+
+        header = [
+            f"Command {msg['command']} stalled, running for {elapsed:.2f}s",
+            f"Message: {msg}",
+        ]
+
+        for command, started_at in pending_calls.values():
+            header.append(f"Pending call: {get_operation_name(command)}, {command}, for {time.monotonic() - started_at:.2f}s")
+
+        report = "\n".join(header) + "\n\n" + format_stacks(pending_calls)
+
+        stalls_dir = os.path.join(self.controller.file_manager.state_dir, STALLS_DIR)
+        os.makedirs(stalls_dir, exist_ok=True)
+
+        report_path = os.path.join(stalls_dir, f"stall-{time.strftime('%Y%m%d-%H%M%S')}-{msg['command']}.txt")
+
+        with open(report_path, "w") as report_file:
+            report_file.write(report)
+
+        with self.lock:
+            self.last_report = report_path
+
+        logger.error("%s\nReport written to %s", report, report_path)
@@ -0,0 +1,161 @@
+import logging
+import threading
+import time
+from collections import deque
+
+from panmuphled.server.protocol import ProtocolError
+
+logger = logging.getLogger(__name__)
+
+"""
+    Push-based event stream for clients which want to follow the state of
+    the daemon, like status bars. Each subscriber has a bounded buffer and
+    its own sender thread, so a slow subscriber only ever loses its own
+    oldest events and can never stall the daemon.
+"""
+
+EVENT_TYPES = [
+    "workspace_opened",
+    "workspace_closed",
+    "workspace_switched",
+    "workspace_hibernated",
+    "workspace_woken",
+    "window_activated",
+    "application_started",
+    "application_exited",
+    "config_reloaded",
+    "job_finished",
+]
+
+SUBSCRIBER_BUFFER_SIZE = 256
+
+
+class Subscriber:
+    def __init__(self, conn, event_types, bus):
+        self.conn = conn
+        self.event_types = set(event_types) if event_types else None
+        self.bus = bus
+
+        self.buffer = deque(maxlen=SUBSCRIBER_BUFFER_SIZE)
+        self.dropped = 0
+        self.closed = False
+
+        self.cond = threading.Condition()
+        self.thread = threading.Thread(target=self.__send_events, name="subscriber", daemon=True)
+
+        # Subscribers never send anything, reading only notices them going
+        # away while there's nothing to send them
+        self.watcher = threading.Thread(target=self.__watch_connection, name="subscriber-watch", daemon=True)
+
+    def wants(self, event_type):
+        return self.event_types is None or event_type in self.event_types
+
+    def push(self, event):
+        with self.cond:
+            if len(self.buffer) == self.buffer.maxlen:
+                self.dropped = self.dropped + 1
+
+            self.buffer.append(event)
+            self.cond.notify()
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify()
+
+    def __watch_connection(self):
+        while True:
+            try:
+                self.conn.recv()
+            except (OSError, EOFError, ValueError, ProtocolError):
+                break
+
+        with self.cond:
+            closed = self.closed
+
+        if not closed:
+            logger.info("Subscriber disconnected")
+
+        self.bus.unsubscribe(self)
+
+    def __send_events(self):
+        while True:
+            with self.cond:
+                while len(self.buffer) == 0 and not self.closed:
+                    self.cond.wait()
+
+                if self.closed:
+                    break
+
+                events = list(self.buffer)
+                self.buffer.clear()
+
+                dropped = self.dropped
+                self.dropped = 0
+
+            try:
+                if dropped:
+                    # Let the subscriber know it missed events and should resync
+                    self.conn.send({"event": "overflow", "dropped": dropped})
+
+                for event in events:
+                    self.conn.send(event)
+            except (OSError, EOFError, ValueError):
+                logger.info("Subscriber disconnected")
+                break
+
+        self.bus.unsubscribe(self)
+
+        try:
+            self.conn.close()
+        except OSError:
+            pass
+
+
+class EventBus:
+    def __init__(self):
+        self.subscribers = []
+        self.seq = 0
+
+        self.lock = threading.Lock()
+
+    def subscribe(self, conn, event_types=None):
+        subscriber = Subscriber(conn, event_types, self)
+
+        with self.lock:
+            self.subscribers.append(subscriber)
+
+        subscriber.thread.start()
+        subscriber.watcher.start()
+
+        logger.info(f"Added subscriber for events {event_types if event_types else 'all'}")
+
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self.lock:
+            if subscriber in self.subscribers:
+                self.subscribers.remove(subscriber)
+
+        subscriber.close()
+
+    def publish(self, event_type, **data):
+        with self.lock:
+            if len(self.subscribers) == 0:
+                return
+
+            self.seq = self.seq + 1
+
+            event = {"event": event_type, "seq": self.seq, "time": time.time()}
+            event.update(data)
+
+            for subscriber in self.subscribers:
+                if subscriber.wants(event_type):
+                    subscriber.push(event)
+
+    def stop(self):
+        with self.lock:
+            subscribers = list(self.subscribers)
+
+        for subscriber in subscribers:
+            self.unsubscribe(subscriber)